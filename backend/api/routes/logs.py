@@ -1,44 +1,238 @@
 from __future__ import annotations
 
 import time
-from typing import Annotated, Any, Dict
+import zlib
+from functools import lru_cache
+from typing import Annotated, Any, Dict, List, Sequence, Tuple
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from backend.core.config import settings
-from backend.db.database import get_db
+from backend.db.database import get_db, session_scope
+from backend.services.dedup import idempotency_store
+from backend.services.fast_validator import fast_validator
+from backend.services.ingest_metrics import ingest_metrics
+from backend.services.ingest_queue import QueueFull, StoreUnavailable, ingest_queue
 from backend.services.log_ingestor import LogIngestor
+from backend.services.ndjson_stream import InvalidLine, iter_ndjson
+from backend.services.rate_limiter import rate_limiter
 
 router = APIRouter(prefix="/api", tags=["logs"])
 
 
-def _check_api_key(api_key: str | None) -> None:
-    allowed = {k.strip() for k in settings.API_KEYS.split(",") if k.strip()}
-    if not api_key or api_key not in allowed:
+@lru_cache(maxsize=8)
+def _parse_api_keys(raw: str) -> frozenset[str]:
+    return frozenset(k.strip() for k in raw.split(",") if k.strip())
+
+
+def _check_api_key(api_key: str | None) -> str:
+    # cache theo chuỗi API_KEYS nên đổi settings vẫn có hiệu lực
+    if not api_key or api_key not in _parse_api_keys(settings.API_KEYS):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    return api_key
+
+
+def _admit(api_key: str, events: int, response: Response, detail: str = "") -> None:
+    """Token-bucket admission control; raise 429 with rate-limit headers when over budget."""
+    if not rate_limiter.enabled or events <= 0:
+        return
+    decision = rate_limiter.check(api_key, events)
+    if not decision.allowed:
+        ingest_metrics.record_dropped(events)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail or "Rate limit exceeded",
+            headers=decision.headers(),
+        )
+    response.headers.update(decision.headers())
 
 
 @router.post("/ingest")
 def ingest_batch(
     payload: Dict[str, Any],
+    response: Response,
     db: Session = Depends(get_db),
     x_api_key: Annotated[str | None, Header(alias="X-API-Key")] = None,
-) -> Dict[str, int]:
-    _check_api_key(x_api_key)
+    idempotency_key: Annotated[str | None, Header(alias="Idempotency-Key", max_length=255)] = None,
+) -> Dict[str, Any]:
+    api_key = _check_api_key(x_api_key)
+    key_hash = None
+    if idempotency_key and settings.DEDUP_ENABLED:
+        # retry của một batch đã commit → trả lại đúng response cũ, không ghi lại
+        key_hash = idempotency_store.key_hash(api_key, idempotency_key)
+        replay = idempotency_store.lookup(db, key_hash)
+        if replay is not None:
+            return _replayed(response, replay)
+    events = payload.get("events")
+    _admit(api_key, len(events) if isinstance(events, list) else 1, response)
+
+    svc = LogIngestor()
+    t0 = time.perf_counter_ns()
+    batch = svc.validate_rows(payload)
+    dropped = len(batch.rejects)
+    rows = batch.rows
+
+    if settings.INGEST_WRITE_BEHIND:
+        # validate xong thì enqueue; DB commit (cả idempotency key) do flusher nền đảm nhiệm
+        latency_ms = (time.perf_counter_ns() - t0) / 1_000_000
+        result = _result(len(rows), batch, latency_ms)
+        try:
+            ingest_queue.submit(rows, (key_hash, result) if key_hash else None)
+        except QueueFull as e:
+            ingest_metrics.record_dropped(len(batch.rows) + dropped)
+            unavailable = isinstance(e, StoreUnavailable)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+                if unavailable
+                else status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Ingest store is unavailable, retry later"
+                if unavailable
+                else "Ingest queue is full, retry later",
+                headers={"Retry-After": str(e.retry_after_sec)},
+            ) from None
+        response.status_code = status.HTTP_202_ACCEPTED
+    else:
+        if key_hash and not idempotency_store.claim(db, key_hash):
+            # một retry song song đã commit trước (claim chờ transaction đó kết thúc)
+            replay = idempotency_store.lookup(db, key_hash)
+            if replay is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT, detail="Idempotency-Key in use"
+                )
+            return _replayed(response, replay)
+        inserted = svc.save_rows(db, rows)
+        db.flush()  # để latency bao gồm cả thời gian ghi DB
+        latency_ms = (time.perf_counter_ns() - t0) / 1_000_000
+        result = _result(inserted, batch, latency_ms)
+        if key_hash:
+            idempotency_store.complete(db, key_hash, result)
+
+    ingest_metrics.record(
+        result["accepted"], dropped, latency_ms, batch_size=len(batch.rows) + dropped
+    )
+    return result
+
+
+def _result(accepted: int, batch: Any, latency_ms: float) -> Dict[str, Any]:
+    return {
+        "accepted": accepted,
+        "dropped": len(batch.rejects),
+        "rejects": batch.reject_counts(),
+        "latency_ms": int(latency_ms),
+    }
+
+
+def _replayed(response: Response, stored: Dict[str, Any]) -> Dict[str, Any]:
+    response.headers["Idempotent-Replayed"] = "true"
+    return stored
+
+
+_NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+_MAX_REPORTED_LINES = 100
+
+
+def _store_chunk(svc: LogIngestor, events: Sequence[Any]) -> Tuple[int, List[int]]:
+    """Validate one chunk per event and commit it in its own transaction.
+
+    Return (inserted, rejected_indexes).
+    """
+    batch = fast_validator.validate(events)
+    with session_scope() as db:
+        inserted = svc.save_rows(db, batch.rows)
+    return inserted, [r.index for r in batch.rejects]
+
+
+@router.post("/ingest/stream")
+async def ingest_stream(
+    request: Request,
+    response: Response,
+    x_api_key: Annotated[str | None, Header(alias="X-API-Key")] = None,
+    content_encoding: Annotated[str | None, Header()] = None,
+) -> Dict[str, Any]:
+    """Ingest NDJSON (one event per line, optionally gzip) while the body is still arriving.
+
+    Events are validated and committed in chunks of `INGEST_STREAM_CHUNK_EVENTS`, so memory
+    stays flat regardless of upload size. Bad lines are rejected individually.
+    """
+    api_key = _check_api_key(x_api_key)
+    ctype = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if ctype not in _NDJSON_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected Content-Type: application/x-ndjson",
+        )
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding: {encoding}",
+        )
 
     svc = LogIngestor()
     t0 = time.perf_counter_ns()
-    accepted_models, rejected = svc.validate_batch(payload)
-    inserted = svc.save_batch(db, accepted_models)
-    p95_ms = int((time.perf_counter_ns() - t0) / 1_000_000)
-    svc.update_metrics(db, inserted, len(rejected), p95_ms=p95_ms, batch_size=len(accepted_models))
+    rejects: Dict[str, int] = {"invalid_json": 0, "invalid_schema": 0, "line_too_long": 0}
+    rejected_lines: List[int] = []
+    lines = accepted = 0
+    chunk: List[Any] = []
+    chunk_lines: List[int] = []
+
+    def _reject(line_no: int, reason: str) -> None:
+        rejects[reason] += 1
+        if len(rejected_lines) < _MAX_REPORTED_LINES:
+            rejected_lines.append(line_no)
+
+    async def _flush() -> None:
+        nonlocal accepted
+        await run_in_threadpool(
+            _admit,
+            api_key,
+            len(chunk),
+            response,
+            f"Rate limit exceeded after {accepted} accepted events",
+        )
+        inserted, bad = await run_in_threadpool(_store_chunk, svc, chunk)
+        accepted += inserted
+        for i in bad:
+            _reject(chunk_lines[i], "invalid_schema")
+        chunk.clear()
+        chunk_lines.clear()
+
+    try:
+        async for line_no, obj in iter_ndjson(
+            request.stream(),
+            gzip=encoding == "gzip",
+            max_line_bytes=settings.INGEST_STREAM_MAX_LINE_BYTES,
+        ):
+            lines += 1
+            if isinstance(obj, InvalidLine):
+                _reject(line_no, obj.reason)
+                continue
+            chunk.append(obj)
+            chunk_lines.append(line_no)
+            if len(chunk) >= settings.INGEST_STREAM_CHUNK_EVENTS:
+                await _flush()
+        if chunk:
+            await _flush()
+    except zlib.error:
+        # các chunk trước đó đã commit; báo lỗi để client biết phần sau bị bỏ
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Corrupt gzip body after {accepted} accepted events",
+        ) from None
 
+    dropped = sum(rejects.values())
+    latency_ms = (time.perf_counter_ns() - t0) / 1_000_000
+    ingest_metrics.record(accepted, dropped, latency_ms, batch_size=lines)
     return {
-        "accepted": inserted,
-        "dropped": len(rejected),
-        "latency_ms": p95_ms,
+        "accepted": accepted,
+        "dropped": dropped,
+        "lines": lines,
+        "rejects": rejects,
+        "rejected_lines": rejected_lines,
+        "latency_ms": int(latency_ms),
     }
 
 
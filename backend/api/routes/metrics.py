@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterator, Sequence
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, Response
+from prometheus_client import CollectorRegistry, generate_latest
+from prometheus_client.core import GaugeMetricFamily, Metric
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from backend.core import metrics
+from backend.db.database import get_db
+from backend.db.models import RuleWatermark
+
+log = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"])
+
+
+class _AnalyzerCollector:
+    """Analyzer lag and rolling rule timings, read from `rule_watermarks` at scrape time
+    (the analyzer runs in its own process, so it has no in-memory metrics to share)."""
+
+    def __init__(self, rows: Sequence[RuleWatermark], now: datetime) -> None:
+        self.rows = rows
+        self.now = now
+
+    def collect(self) -> Iterator[Metric]:
+        lag = GaugeMetricFamily(
+            "analyzer_lag_seconds", "Now minus the last evaluated window end", labels=["rule_id"]
+        )
+        wall = GaugeMetricFamily(
+            "analyzer_rule_wall_seconds", "Rolling mean rule wall time", labels=["rule_id"]
+        )
+        db_time = GaugeMetricFamily(
+            "analyzer_rule_db_seconds", "Rolling mean rule DB time", labels=["rule_id"]
+        )
+        rows = GaugeMetricFamily(
+            "analyzer_rule_rows", "Rolling mean rows returned per window", labels=["rule_id"]
+        )
+        for r in self.rows:
+            lag.add_metric([r.rule_id], (self.now - r.last_end).total_seconds())
+            if r.avg_wall_ms is not None:  # chỉ có khi analyzer chạy với --profile
+                wall.add_metric([r.rule_id], r.avg_wall_ms / 1000)
+                db_time.add_metric([r.rule_id], (r.avg_db_ms or 0) / 1000)
+                rows.add_metric([r.rule_id], r.avg_rows or 0)
+        yield from (lag, wall, db_time, rows)
+
+
+@router.get("/metrics")
+def get_metrics(db: Session = Depends(get_db)) -> Response:
+    """Prometheus text exposition: process (or all workers') metrics + analyzer state."""
+    body, content_type = metrics.render()
+    try:
+        wms = db.execute(select(RuleWatermark)).scalars().all()
+    except SQLAlchemyError:
+        log.warning("metrics: cannot read rule_watermarks", exc_info=True)
+    else:
+        registry = CollectorRegistry()
+        registry.register(_AnalyzerCollector(wms, datetime.now(timezone.utc)))
+        body += generate_latest(registry)
+    return Response(content=body, media_type=content_type)
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
 from datetime import datetime
 from typing import Annotated, Any, Dict
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select, select
 from sqlalchemy.orm import Session
 
 from backend.db.database import get_db
-from backend.db.queries import fetch_events, fetch_logs
+from backend.db.models import Event, Log, RuleWatermark
+from backend.db.queries import (
+    EVENT_FIELDS,
+    EVENT_ORDER,
+    LOG_FIELDS,
+    LOG_ORDER,
+    event_filters,
+    fetch_events,
+    fetch_logs,
+    log_filters,
+    ordered,
+)
+from backend.services.exporter import Export, stream
 
 router = APIRouter(prefix="/api", tags=["read"])
 
@@ -22,6 +37,13 @@ def _parse_iso8601(value: str | None) -> datetime | None:
     return datetime.fromisoformat(v)
 
 
+def _parse_range(ts_from: str | None, ts_to: str | None) -> tuple[datetime | None, datetime | None]:
+    try:
+        return _parse_iso8601(ts_from), _parse_iso8601(ts_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ts_from/ts_to must be ISO 8601") from None
+
+
 @router.get("/logs")
 def get_logs(
     db: Session = Depends(get_db),
@@ -31,22 +53,26 @@ def get_logs(
     endpoint: Annotated[str | None, Query()] = None,
     status: Annotated[int | None, Query()] = None,
     limit: Annotated[int, Query(ge=1, le=1000)] = 100,
-    offset: Annotated[int, Query(ge=0)] = 0,
+    cursor: Annotated[str | None, Query()] = None,
     order_by: Annotated[str, Query()] = "-ts",
 ) -> Dict[str, Any]:
-    """Return paginated logs. TODO: parse ts_from/ts_to to datetime."""
-    rows = fetch_logs(
-        db,
-        ts_from=None,
-        ts_to=None,
-        ip=ip,
-        endpoint=endpoint,
-        status=status,
-        limit=limit,
-        offset=offset,
-        order_by=order_by,
-    )
-    return {"items": rows, "limit": limit, "offset": offset}
+    """Return one page of logs; pass `next_cursor` back as `cursor` for the next page."""
+    start, end = _parse_range(ts_from, ts_to)
+    try:
+        page = fetch_logs(
+            db,
+            ts_from=start,
+            ts_to=end,
+            ip=ip,
+            endpoint=endpoint,
+            status=status,
+            limit=limit,
+            cursor=cursor,
+            order_by=order_by,
+        )
+    except ValueError as e:  # cursor hỏng / không khớp order_by
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    return {"items": page.items, "limit": limit, "next_cursor": page.next_cursor}
 
 
 @router.get("/events")
@@ -59,19 +85,98 @@ def get_events(
     ip: Annotated[str | None, Query()] = None,
     endpoint: Annotated[str | None, Query()] = None,
     limit: Annotated[int, Query(ge=1, le=1000)] = 100,
-    offset: Annotated[int, Query(ge=0)] = 0,
+    cursor: Annotated[str | None, Query()] = None,
     order_by: Annotated[str, Query()] = "-last_seen",
 ) -> Dict[str, Any]:
-    items = fetch_events(
-        db,
-        ts_from=_parse_iso8601(ts_from),
-        ts_to=_parse_iso8601(ts_to),
-        rule_id=rule_id,
-        severity=severity,
-        ip=ip,
-        endpoint=endpoint,
-        limit=limit,
-        offset=offset,
-        order_by=order_by,
+    """Return one page of events; pass `next_cursor` back as `cursor` for the next page."""
+    start, end = _parse_range(ts_from, ts_to)
+    try:
+        page = fetch_events(
+            db,
+            ts_from=start,
+            ts_to=end,
+            rule_id=rule_id,
+            severity=severity,
+            ip=ip,
+            endpoint=endpoint,
+            limit=limit,
+            cursor=cursor,
+            order_by=order_by,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    return {"items": page.items, "limit": limit, "next_cursor": page.next_cursor}
+
+
+@router.get("/logs/export")
+async def export_logs(
+    ts_from: Annotated[str | None, Query()] = None,
+    ts_to: Annotated[str | None, Query()] = None,
+    ip: Annotated[str | None, Query()] = None,
+    endpoint: Annotated[str | None, Query()] = None,
+    status: Annotated[int | None, Query()] = None,
+    order_by: Annotated[str, Query()] = "-ts",
+    fmt: Annotated[str, Query(alias="format")] = "ndjson",
+) -> StreamingResponse:
+    """Stream every matching log (NDJSON or CSV); same filters and order as `/api/logs`."""
+    start, end = _parse_range(ts_from, ts_to)
+    conds = log_filters(ts_from=start, ts_to=end, ip=ip, endpoint=endpoint, status=status)
+    stmt = select(*(getattr(Log, f) for f in LOG_FIELDS)).where(*conds)
+    stmt, _, _ = ordered(stmt, LOG_ORDER, Log.id, order_by, "-ts")
+    return _export_response(stmt, LOG_FIELDS, fmt, "logs")
+
+
+@router.get("/events/export")
+async def export_events(
+    ts_from: Annotated[str | None, Query()] = None,
+    ts_to: Annotated[str | None, Query()] = None,
+    rule_id: Annotated[str | None, Query()] = None,
+    severity: Annotated[int | None, Query(ge=1, le=5)] = None,
+    ip: Annotated[str | None, Query()] = None,
+    endpoint: Annotated[str | None, Query()] = None,
+    order_by: Annotated[str, Query()] = "-last_seen",
+    fmt: Annotated[str, Query(alias="format")] = "ndjson",
+) -> StreamingResponse:
+    """Stream every matching event (NDJSON or CSV); same filters and order as `/api/events`."""
+    start, end = _parse_range(ts_from, ts_to)
+    conds = event_filters(
+        ts_from=start, ts_to=end, rule_id=rule_id, severity=severity, ip=ip, endpoint=endpoint
+    )
+    stmt = select(*(getattr(Event, f) for f in EVENT_FIELDS)).where(*conds)
+    stmt, _, _ = ordered(stmt, EVENT_ORDER, Event.id, order_by, "-last_seen")
+    return _export_response(stmt, EVENT_FIELDS, fmt, "events")
+
+
+def _export_response(
+    stmt: Select[Any], fields: Sequence[str], fmt: str, name: str
+) -> StreamingResponse:
+    try:
+        export = Export(stmt, fields, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from None
+    return StreamingResponse(
+        stream(export),
+        media_type=export.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
     )
-    return {"items": items, "limit": limit, "offset": offset}
+
+
+@router.get("/analyzer")
+def get_analyzer_status(db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """Per-rule watermark and lag as last recorded by the analyzer."""
+    rows = db.query(RuleWatermark).order_by(RuleWatermark.rule_id).all()
+    return {
+        "rules": [
+            {
+                "rule_id": r.rule_id,
+                "last_end": r.last_end,
+                "lag_sec": r.lag_sec,
+                "updated_at": r.updated_at,
+                "avg_wall_ms": r.avg_wall_ms,
+                "avg_db_ms": r.avg_db_ms,
+                "avg_rows": r.avg_rows,
+            }
+            for r in rows
+        ],
+        "max_lag_sec": max((r.lag_sec for r in rows), default=None),
+    }
@@ -19,9 +19,79 @@ class Settings(BaseSettings):
     DATABASE_URL: str | None = Field(default=None, description="SQLAlchemy URL for PostgreSQL")
     API_KEYS: str = "dev-key-1,dev-key-2"
     SECRET_KEY: str = "change-me"
-    RATE_LIMIT_PER_MIN: int = 3000
+    RATE_LIMIT_PER_MIN: int = 3000  # events/phút cho mỗi API key; 0 = tắt
+    RATE_LIMIT_BURST: int = 0  # dung lượng bucket; 0 = bằng RATE_LIMIT_PER_MIN
+    RATE_LIMIT_STORE: str = "memory"  # memory | db (chia sẻ giữa nhiều worker)
     LOG_LEVEL: str = "INFO"
-    RETENTION_DAYS: int = 14
+    RETENTION_DAYS: int = 14  # partition logs cũ hơn bị DROP bởi scripts/run_retention.py
+
+    # logs phân vùng theo ts: "day" | "hour"; tạo trước N partition cho tương lai
+    LOGS_PARTITION_INTERVAL: str = "day"
+    LOGS_PARTITIONS_AHEAD: int = 3
+
+    # Ingest write path: "orm" (add_all), "core" (INSERT executemany), "copy" (COPY FROM STDIN)
+    INGEST_WRITE_MODE: str = "orm"
+
+    # Write-behind: /api/ingest chỉ validate + enqueue, flusher nền gom batch rồi commit
+    INGEST_WRITE_BEHIND: bool = False
+    INGEST_QUEUE_MAX_BATCHES: int = 1000
+    INGEST_FLUSH_MAX_EVENTS: int = 5000
+    INGEST_FLUSH_MAX_AGE_MS: int = 500
+    # flush lỗi: thử lại N lần, chờ backoff*2^k (tối đa 30s); trong lúc đó ingest trả 503
+    INGEST_FLUSH_RETRIES: int = 5
+    INGEST_FLUSH_RETRY_BACKOFF_MS: int = 500
+
+    # /api/ingest/stream (NDJSON): số event mỗi chunk validate+ghi, giới hạn độ dài 1 dòng
+    INGEST_STREAM_CHUNK_EVENTS: int = 2000
+    INGEST_STREAM_MAX_LINE_BYTES: int = 1_048_576
+
+    # De-duplication chỉ theo header Idempotency-Key (không lọc theo nội dung event)
+    DEDUP_ENABLED: bool = True
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_TTL_SEC: int = 86_400
+
+    # Rollup ip_stats theo phút: số id logs tối đa mỗi lượt, và số giây gần nhất luôn tính lại
+    # (dòng commit trễ với id nhỏ hơn watermark được đọc lại qua rollup_watermarks.safe_id)
+    ROLLUP_MAX_IDS_PER_PASS: int = 200_000
+    ROLLUP_RECHECK_SEC: int = 120
+
+    # Streaming rules: đánh giá R-001/002/004/005 ngay trên đường ingest (Event source="stream")
+    STREAM_RULES_ENABLED: bool = False
+    STREAM_MAX_KEYS: int = 100_000  # số key tối đa mỗi rule giữ trong RAM
+    STREAM_MAX_CLOCK_SKEW_SEC: int = 300  # dòng có ts vượt giờ hiện tại quá mức này bị bỏ qua
+
+    # Heavy hitters trên đường ingest (Space-Saving top-K + Count-Min), snapshot mỗi phút vào
+    # bảng heavy_hitters; R-002 chỉ GROUP BY các IP ứng viên lấy từ đó
+    HEAVY_HITTERS_ENABLED: bool = False
+    HEAVY_HITTERS_TOP_K: int = 1000  # số key giữ mỗi (phút, ip|endpoint)
+    HEAVY_HITTERS_CM_WIDTH: int = 4096
+    HEAVY_HITTERS_CM_DEPTH: int = 4
+    HEAVY_HITTERS_RETAIN_MIN: int = 10  # số phút giữ trong RAM (nhận log đến trễ)
+
+    # Bộ đánh giá rule đếm ngưỡng: "sql" (ip_stats) | "numpy" (cần extra `fast`)
+    RULE_EVALUATOR: str = "sql"
+
+    # Sketch HyperLogLog (distinct_sketches) cho rule đếm phân biệt R-006/R-007: sai số chuẩn
+    # tương đối mong muốn → precision p (2^p byte / sketch trước khi nén)
+    HLL_STD_ERROR: float = 0.02
+
+    # Incident (events): match cùng (rule_id, ip, endpoint) cách last_seen <= N giây được gộp
+    # vào incident đang mở; incident không được nối dài quá N giây thì bị đóng
+    INCIDENT_IDLE_CLOSE_SEC: int = 900
+
+    # Analyzer daemon (scripts/run_analyzer.py --daemon): mỗi rule bước window_sec / HOPS
+    # (tối thiểu 1 phút), chỉ đánh giá window kết thúc trước now - DELAY (chờ log đến trễ),
+    # bắt kịp tối đa MAX_CATCHUP window mỗi rule mỗi lượt
+    ANALYZER_HOPS_PER_WINDOW: int = 5
+    ANALYZER_DELAY_SEC: int = 30
+    ANALYZER_MAX_CATCHUP: int = 50
+    ANALYZER_POLL_SEC: float = 5.0
+
+    # /api/*/export: số dòng mỗi lần fetch từ server-side cursor (= bộ nhớ tối đa mỗi export)
+    EXPORT_BATCH_ROWS: int = 5000
+
+    # Metrics ingest giữ trong RAM, flush 1 dòng / phút / worker vào ingest_metrics
+    METRICS_FLUSH_INTERVAL_SEC: int = 15
 
     @field_validator("DATABASE_URL")
     @classmethod
@@ -30,5 +100,37 @@ class Settings(BaseSettings):
             raise ValueError("DATABASE_URL is required. Set it via environment or .env")
         return v
 
+    @field_validator("INGEST_WRITE_MODE")
+    @classmethod
+    def _check_write_mode(cls, v: str) -> str:
+        mode = v.strip().lower()
+        if mode not in ("orm", "core", "copy"):
+            raise ValueError("INGEST_WRITE_MODE must be one of: orm, core, copy")
+        return mode
+
+    @field_validator("LOGS_PARTITION_INTERVAL")
+    @classmethod
+    def _check_partition_interval(cls, v: str) -> str:
+        interval = v.strip().lower()
+        if interval not in ("day", "hour"):
+            raise ValueError("LOGS_PARTITION_INTERVAL must be one of: day, hour")
+        return interval
+
+    @field_validator("RULE_EVALUATOR")
+    @classmethod
+    def _check_rule_evaluator(cls, v: str) -> str:
+        evaluator = v.strip().lower()
+        if evaluator not in ("sql", "numpy"):
+            raise ValueError("RULE_EVALUATOR must be one of: sql, numpy")
+        return evaluator
+
+    @field_validator("RATE_LIMIT_STORE")
+    @classmethod
+    def _check_rate_store(cls, v: str) -> str:
+        store = v.strip().lower()
+        if store not in ("memory", "db"):
+            raise ValueError("RATE_LIMIT_STORE must be one of: memory, db")
+        return store
+
 
 settings = Settings()
@@ -0,0 +1,121 @@
+"""HyperLogLog distinct-count sketch (64-bit blake2b hash, one byte per register).
+
+Relative standard error is about `1.04 / sqrt(2**p)`; `precision_for(err)` picks the
+smallest `p` meeting a bound. Sketches of the same key over several minute buckets merge
+by register-wise max (the union), and a sketch can be folded down to a lower precision, so
+rows written with an older `HLL_STD_ERROR` still merge with new ones.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import zlib
+from collections.abc import Iterable
+
+MIN_P, MAX_P = 4, 16
+
+
+def precision_for(std_error: float) -> int:
+    """Smallest precision whose standard error is <= `std_error` (clamped to 4..16)."""
+    if std_error <= 0:
+        return MAX_P
+    return min(MAX_P, max(MIN_P, math.ceil(2 * math.log2(1.04 / std_error))))
+
+
+def std_error(p: int) -> float:
+    return 1.04 / math.sqrt(1 << p)
+
+
+def hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+class HyperLogLog:
+    __slots__ = ("p", "registers")
+
+    def __init__(self, p: int, registers: bytearray | None = None) -> None:
+        if not MIN_P <= p <= MAX_P:
+            raise ValueError(f"HLL precision must be in {MIN_P}..{MAX_P}, got {p}")
+        self.p = p
+        self.registers = registers if registers is not None else bytearray(1 << p)
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash64(value))
+
+    def add_hash(self, h: int) -> None:
+        tail_bits = 64 - self.p
+        idx = h >> tail_bits
+        rank = tail_bits - (h & ((1 << tail_bits) - 1)).bit_length() + 1
+        self.registers[idx] = max(self.registers[idx], rank)
+
+    def update(self, values: Iterable[str]) -> HyperLogLog:
+        for v in values:
+            self.add(v)
+        return self
+
+    def fold(self, p: int) -> HyperLogLog:
+        """Same sketch at a lower precision (as if built with `p` from the start)."""
+        if p == self.p:
+            return self
+        if p > self.p:
+            raise ValueError("cannot raise HLL precision")
+        shift = self.p - p
+        out = bytearray(1 << p)
+        for idx, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            # các bit index bị bỏ trở thành đầu phần đuôi của hash
+            low = idx & ((1 << shift) - 1)
+            r = shift - low.bit_length() + 1 if low else shift + rank
+            j = idx >> shift
+            out[j] = max(out[j], r)
+        return HyperLogLog(p, out)
+
+    def merge(self, other: HyperLogLog) -> HyperLogLog:
+        """Union of both sketches, at the lower of the two precisions."""
+        p = min(self.p, other.p)
+        a, b = self.fold(p), other.fold(p)
+        return HyperLogLog(p, bytearray(map(max, a.registers, b.registers)))
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        est = _alpha(m) * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if est <= 2.5 * m and zeros:  # small-range correction: linear counting
+            est = m * math.log(m / zeros)
+        return round(est)
+
+    def to_bytes(self) -> bytes:
+        # thanh ghi phần lớn = 0 khi ít phần tử → zlib nén gần như về vài chục byte
+        return bytes([self.p]) + zlib.compress(bytes(self.registers), 1)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> HyperLogLog:
+        p = data[0]
+        registers = bytearray(zlib.decompress(data[1:]))
+        if len(registers) != 1 << p:
+            raise ValueError("corrupt HLL sketch")
+        return cls(p, registers)
+
+
+def merge_all(sketches: Iterable[HyperLogLog], p: int | None = None) -> HyperLogLog | None:
+    """Union of `sketches` folded to `p` (or their lowest precision); None if empty."""
+    items = list(sketches)
+    if not items:
+        return None
+    p = min([s.p for s in items] + ([p] if p is not None else []))
+    out = bytearray(1 << p)
+    for s in items:
+        out = bytearray(map(max, out, s.fold(p).registers))
+    return HyperLogLog(p, out)
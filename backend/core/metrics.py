@@ -0,0 +1,163 @@
+"""Prometheus metrics (text exposition served by `GET /metrics`).
+
+Metrics are plain `prometheus_client` objects updated in-process: request latency from
+`PrometheusMiddleware`, ingest counts from `IngestMetricsRecorder`, pool and query timings
+from the engine hooks in `instrument_engine`. With several uvicorn workers set
+`PROMETHEUS_MULTIPROC_DIR` (an empty directory, wiped before start) so each worker writes
+its values to mmap files and `render()` merges them on every scrape.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+INGEST_EVENTS = Counter("ingest_events", "Ingested events by outcome", ["outcome"])
+INGEST_BATCH_SIZE = Histogram(
+    "ingest_batch_size",
+    "Events per ingest request",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+WRITE_BEHIND_LOST = Counter(
+    "ingest_write_behind_lost_events",
+    "Events acknowledged with 202 whose write-behind flush failed after all retries",
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to get a connection from the pool (including connects)",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Connections checked out", multiprocess_mode="livesum"
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time by statement type",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+
+_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"})
+
+
+def multiprocess_mode() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render() -> tuple[bytes, str]:
+    """Exposition of this process' metrics (all workers' in multiprocess mode)."""
+    if multiprocess_mode():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this worker's live gauges from the shared directory (call on shutdown)."""
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+# --- requests ---
+class PrometheusMiddleware:
+    """Pure ASGI middleware: one histogram sample per HTTP request, labelled by route
+    template (`/api/events`, not the raw path) so label cardinality stays bounded."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # path không khớp route nào (scan 404) gom chung một nhãn
+            path = getattr(route, "path", None) or "<unmatched>"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status)).observe(
+                time.perf_counter() - t0
+            )
+
+
+# --- ingest ---
+def record_ingest(accepted: int, dropped: int, batch_size: int | None = None) -> None:
+    if accepted:
+        INGEST_EVENTS.labels("accepted").inc(accepted)
+    if dropped:
+        INGEST_EVENTS.labels("dropped").inc(dropped)
+    if batch_size is not None:
+        INGEST_BATCH_SIZE.observe(batch_size)
+
+
+# --- database ---
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - t0)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Count in-use connections and time every statement executed through `engine`."""
+
+    @event.listens_for(engine.pool, "checkout")
+    def _checkout(*_: Any) -> None:
+        DB_POOL_IN_USE.inc()
+
+    @event.listens_for(engine.pool, "checkin")
+    def _checkin(*_: Any) -> None:
+        DB_POOL_IN_USE.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn: Any, cursor: Any, statement: str, params: Any, context: Any, *_: Any) -> None:
+        if context is not None:
+            context._metrics_t0 = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn: Any, cursor: Any, statement: str, params: Any, context: Any, *_: Any) -> None:
+        t0 = getattr(context, "_metrics_t0", None)
+        if t0 is None:
+            return
+        words = statement[:16].split(None, 1)
+        op = words[0].upper() if words else ""
+        DB_QUERY_DURATION.labels(op if op in _OPERATIONS else "OTHER").observe(
+            time.perf_counter() - t0
+        )
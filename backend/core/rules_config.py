@@ -1,14 +1,128 @@
-"""Load & access rule config from YAML (typed)."""
+"""Load & access rule config from YAML (typed).
+
+Each load compiles `rules.yaml` into one immutable `RulesVersion`: the raw mapping plus a
+validated, frozen `RuleConfig` per rule (schemas in `RULE_SCHEMAS`). Readers take the
+current version with a single attribute read, so a reload swaps every rule at once.
+`reload_if_changed()` stats the file (inode, mtime, size) and only re-parses when it
+changed; an invalid edit is logged and the previous version stays active.
+"""
 
 from __future__ import annotations
 
+import logging
+import os
+from collections.abc import Mapping
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Mapping, cast
+from typing import Any, TypeVar, cast
 
 import yaml
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
 
 from backend.core.config import settings
 
+log = logging.getLogger(__name__)
+
+
+class RuleConfig(BaseModel):
+    """Validated settings of one rule; unknown keys are ignored."""
+
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
+    name: str = ""
+    severity: int = Field(3, ge=1, le=5)
+    window_sec: int | None = Field(None, gt=0)  # None = cửa sổ của lần chạy
+
+
+class BruteForceConfig(RuleConfig):
+    severity: int = Field(4, ge=1, le=5)
+    min_failures: int = Field(8, ge=1)
+    login_endpoint: str = "/login"
+
+
+class DDoSConfig(RuleConfig):
+    severity: int = Field(4, ge=1, le=5)
+    req_per_ip_threshold: int = Field(400, ge=1)
+    endpoint: str | None = None
+    exact_check: bool = True
+
+
+class SQLiConfig(RuleConfig):
+    min_hits_per_ip: int = Field(3, ge=1)
+    endpoints: tuple[str, ...] = ()
+    patterns: tuple[str, ...] = ()
+
+    @field_validator("endpoints", "patterns", mode="before")
+    @classmethod
+    def _none_is_empty(cls, v: Any) -> Any:
+        return () if v is None else v
+
+
+class Http5xxConfig(RuleConfig):
+    error_rate_threshold: float = Field(0.15, gt=0, le=1)
+    min_requests: int = Field(20, ge=1)
+
+
+class AdminProbingConfig(RuleConfig):
+    severity: int = Field(2, ge=1, le=5)
+    min_404s: int = Field(5, ge=1)
+    sensitive_paths: tuple[str, ...] = ()
+
+    @field_validator("sensitive_paths", mode="before")
+    @classmethod
+    def _none_is_empty(cls, v: Any) -> Any:
+        return () if v is None else v
+
+
+class EndpointScanConfig(RuleConfig):
+    min_distinct_endpoints: int = Field(50, ge=1)
+    max_error: float | None = Field(None, gt=0, lt=1)
+
+
+class DistributedBruteForceConfig(RuleConfig):
+    severity: int = Field(4, ge=1, le=5)
+    min_distinct_ips: int = Field(20, ge=1)
+    login_endpoint: str = "/login"
+    max_error: float | None = Field(None, gt=0, lt=1)
+
+
+RULE_SCHEMAS: dict[str, type[RuleConfig]] = {
+    "R-001": BruteForceConfig,
+    "R-002": DDoSConfig,
+    "R-003": SQLiConfig,
+    "R-004": Http5xxConfig,
+    "R-005": AdminProbingConfig,
+    "R-006": EndpointScanConfig,
+    "R-007": DistributedBruteForceConfig,
+}
+
+C = TypeVar("C", bound=RuleConfig)
+
+
+@dataclass(frozen=True)
+class RulesVersion:
+    version: int = 0
+    stamp: tuple[int, int, int] | None = None  # (inode, mtime_ns, size) của file đã nạp
+    data: Mapping[str, Any] = field(default_factory=dict)
+    rules: Mapping[str, RuleConfig] = field(default_factory=dict)
+
+
+def compile_rules(data: Mapping[str, Any]) -> dict[str, RuleConfig]:
+    """Validate every rule section; raise ValueError naming the first invalid rule."""
+    out: dict[str, RuleConfig] = {}
+    for rule_id, raw in data.items():
+        schema = RULE_SCHEMAS.get(rule_id, RuleConfig)
+        try:
+            out[rule_id] = schema.model_validate(raw or {})
+        except ValidationError as e:
+            raise ValueError(f"{rule_id}: {e}") from e
+    return out
+
+
+def _stamp(path: Path) -> tuple[int, int, int]:
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
 
 class RulesConfig:
     def __init__(self, path: str | None = None) -> None:
@@ -16,18 +130,51 @@ class RulesConfig:
         # settings.RULES_CONFIG_PATH có thể là Any, ép kiểu về str cho mypy
         chosen: str = path or cast(str, getattr(settings, "RULES_CONFIG_PATH", default))
         self._path: Path = Path(chosen)
-        self._data: dict[str, Any] = {}
+        self._current = RulesVersion()
+        self._rejected: tuple[int, int, int] | None = None  # bản lỗi đã log, khỏi log lại
 
-    def load(self) -> None:
+    def load(self, path: str | None = None) -> None:
+        if path is not None:  # vd. backtest với một bản rules.yaml khác
+            self._path = Path(path)
+        stamp = _stamp(self._path)
         with self._path.open("r", encoding="utf-8") as f:
-            self._data = yaml.safe_load(f) or {}
+            data = yaml.safe_load(f) or {}
+        rules = compile_rules(data)
+        # một phép gán → reader luôn thấy trọn một version
+        self._current = RulesVersion(self._current.version + 1, stamp, data, rules)
+
+    def reload_if_changed(self) -> bool:
+        """Re-load when the file's inode/mtime/size changed. Return True if a new version is live."""
+        try:
+            stamp = _stamp(self._path)
+        except OSError:
+            return False
+        if stamp == self._current.stamp or stamp == self._rejected:
+            return False
+        try:
+            self.load()
+        except (OSError, yaml.YAMLError, ValueError):
+            self._rejected = stamp
+            log.exception("rules config %s invalid; keeping version %d", self._path, self.version)
+            return False
+        log.info("rules config reloaded (version %d)", self.version)
+        return True
+
+    @property
+    def version(self) -> int:
+        return self._current.version
 
     def get(self, rule_id: str) -> Mapping[str, Any]:
         # Trả về cấu hình rule dưới dạng Mapping; dùng cast để thỏa mypy
-        return cast(Mapping[str, Any], self._data.get(rule_id, {}))
+        return cast(Mapping[str, Any], self._current.data.get(rule_id, {}))
+
+    def rule(self, rule_id: str, schema: type[C]) -> C:
+        """Compiled config of `rule_id` (schema defaults if the rule has no section)."""
+        cfg = self._current.rules.get(rule_id)
+        return cfg if isinstance(cfg, schema) else schema()
 
     def all(self) -> Mapping[str, Any]:
-        return self._data
+        return self._current.data
 
 
 rules_config = RulesConfig()
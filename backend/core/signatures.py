@@ -0,0 +1,127 @@
+"""Multi-pattern signature matching (Aho–Corasick) for ingest-time SQLi tagging.
+
+Patterns come from `rules.yaml` (R-003 `patterns`) and are matched case-insensitively.
+A match result is a bitmask: bit `i % 63` is set when pattern `i` occurs, so the mask fits
+a signed BIGINT. Sets larger than 63 patterns fold onto the same bits; "any match"
+(`mask != 0`) stays exact. Every tagged row also stores `pattern_version(patterns)`, so
+rows tagged with another pattern set (or never tagged) can be told apart and re-matched.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import zlib
+from collections import deque
+from collections.abc import Sequence
+
+from backend.core.rules_config import SQLiConfig, rules_config
+
+log = logging.getLogger(__name__)
+
+MASK_BITS = 63
+SQLI_RULE_ID = "R-003"
+
+
+def pattern_version(patterns: Sequence[str]) -> int:
+    """Stable id of a pattern list (same in every process), stored in `logs.sig_version`."""
+    return zlib.crc32("\0".join(patterns).encode()) & 0x7FFFFFFF
+
+
+class AhoCorasick:
+    """Matches all patterns in one left-to-right pass: O(len(text) + matches)."""
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns = tuple(patterns)
+        self.version = pattern_version(self.patterns)
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[int] = [0]
+        for i, p in enumerate(self.patterns):
+            self._add(p.lower(), 1 << (i % MASK_BITS))
+        self._build()
+
+    def _add(self, pattern: str, bit: int) -> None:
+        if not pattern:
+            return
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(0)
+            node = nxt
+        self._out[node] |= bit
+
+    def _build(self) -> None:
+        # BFS: fail link của một node = trạng thái dài nhất là hậu tố của nó
+        queue = deque(self._goto[0].values())  # node độ sâu 1 có fail = root
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] |= self._out[self._fail[child]]
+
+    def search(self, text: str | None) -> int:
+        """Bitmask of the patterns occurring in `text` (0 if none / empty)."""
+        if not text or len(self._goto) == 1:
+            return 0
+        goto, fail, out = self._goto, self._fail, self._out
+        node = mask = 0
+        for ch in text.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            mask |= out[node]
+        return mask
+
+    def mask(self, *texts: str | None) -> int:
+        """OR of `search` over several fields (e.g. endpoint and query string)."""
+        out = 0
+        for t in texts:
+            out |= self.search(t)
+        return out
+
+    def matched(self, mask: int) -> list[str]:
+        """Patterns whose bit is set (all folded candidates when there are > 63 patterns)."""
+        return [p for i, p in enumerate(self.patterns) if mask >> (i % MASK_BITS) & 1]
+
+
+_lock = threading.Lock()
+_compiled: AhoCorasick | None = None
+_version = 0  # version rules.yaml mà _compiled được build theo
+
+
+def sqli_matcher() -> AhoCorasick:
+    """Automaton for the current R-003 patterns; recompiled only when the pattern list changes.
+
+    Ingest does not go through `RuleEngine`, so this picks up edits of rules.yaml itself.
+    """
+    global _compiled, _version
+    if not rules_config.version:
+        try:
+            rules_config.load()
+        except (OSError, ValueError):
+            log.warning("rules config not readable; SQLi tagging disabled")
+    else:
+        rules_config.reload_if_changed()
+    version = rules_config.version
+    with _lock:
+        if _compiled is None or _version != version:
+            patterns = rules_config.rule(SQLI_RULE_ID, SQLiConfig).patterns
+            if _compiled is None or _compiled.patterns != patterns:
+                _compiled = AhoCorasick(patterns)
+            _version = version
+        return _compiled
+
+
+def sig_mask(endpoint: str | None, query_params: str | None) -> int:
+    """Signature bitmask for one event (endpoint and query string are both scanned)."""
+    return sqli_matcher().mask(endpoint, query_params)
@@ -0,0 +1,105 @@
+"""Bounded-memory heavy hitters: Space-Saving top-K with a Count-Min backstop.
+
+`SpaceSaving(k)` monitors at most `k` keys. A key not monitored replaces the smallest
+counter and inherits its count as `error`, so for every monitored key
+`count - error <= true count <= count`. When a Count-Min sketch is attached, an incoming
+key's count is capped by its Count-Min estimate, which keeps newcomers from inheriting a
+large minimum during floods of distinct keys. `floor` is the largest count ever evicted:
+any key that is not monitored occurred at most `floor` times.
+"""
+
+from __future__ import annotations
+
+import heapq
+from array import array
+from collections.abc import Iterable
+
+from backend.core.hll import hash64
+
+
+class CountMinSketch:
+    """`depth` rows of `width` counters; estimates never undercount."""
+
+    def __init__(self, width: int, depth: int) -> None:
+        self.width = max(16, width)
+        self.depth = max(1, depth)
+        self.rows = [array("q", bytes(8 * self.width)) for _ in range(self.depth)]
+
+    def _cells(self, key: str) -> list[int]:
+        # double hashing từ một hash 64-bit
+        h = hash64(key)
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, key: str, weight: int = 1) -> int:
+        """Add `weight` to `key`; return its new estimate."""
+        est = None
+        for row, c in zip(self.rows, self._cells(key)):
+            row[c] += weight
+            est = row[c] if est is None else min(est, row[c])
+        assert est is not None
+        return est
+
+    def estimate(self, key: str) -> int:
+        return min(row[c] for row, c in zip(self.rows, self._cells(key)))
+
+
+class SpaceSaving:
+    def __init__(self, k: int, backstop: CountMinSketch | None = None) -> None:
+        self.k = max(1, k)
+        self.backstop = backstop
+        self.counts: dict[str, int] = {}
+        self.errors: dict[str, int] = {}
+        self.floor = 0
+        self.total = 0
+        # min-heap (count, key) với xóa lười: entry cũ bị bỏ qua khi count đã đổi
+        self._heap: list[tuple[int, str]] = []
+
+    def add(self, key: str, weight: int = 1) -> None:
+        self.total += weight
+        upper = self.backstop.add(key, weight) if self.backstop is not None else None
+        cur = self.counts.get(key)
+        if cur is not None:
+            self._set(key, cur + weight)
+            return
+        if len(self.counts) < self.k:
+            self.errors[key] = 0
+            self._set(key, weight)
+            return
+        evicted, min_count = self._pop_min()
+        self.floor = max(self.floor, min_count)
+        count = min_count + weight if upper is None else min(min_count + weight, upper)
+        self.errors[key] = count - weight
+        self._set(key, count)
+        del self.counts[evicted], self.errors[evicted]
+
+    def update(self, weighted: Iterable[tuple[str, int]]) -> None:
+        for key, w in weighted:
+            self.add(key, w)
+
+    def top(self, n: int | None = None) -> list[tuple[str, int, int]]:
+        """(key, count, error) by count, largest first."""
+        items = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return [(k, c, self.errors[k]) for k, c in items[:n]]
+
+    def upper_bound(self, key: str) -> int:
+        """Largest possible true count of `key`."""
+        if key in self.counts:
+            return self.counts[key]
+        if self.backstop is not None:
+            return min(self.floor, self.backstop.estimate(key))
+        return self.floor
+
+    # --- internals ---
+    def _set(self, key: str, count: int) -> None:
+        self.counts[key] = count
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.k:  # dọn entry cũ để heap không phình
+            self._heap = [(c, k) for k, c in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple[str, int]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return key, count
@@ -0,0 +1,118 @@
+"""Bulk write helpers for the `logs` table (COPY / Core executemany, no ORM unit-of-work)."""
+
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator, Sequence
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log
+
+# Thứ tự cột cố định cho mọi đường ghi bulk; row tuple phải theo đúng thứ tự này
+LOG_COLUMNS: tuple[str, ...] = (
+    "ts",
+    "source",
+    "host",
+    "ip",
+    "endpoint",
+    "method",
+    "status_code",
+    "resp_time_ms",
+    "ua",
+    "action_type",
+    "user_id",
+    "session_id",
+    "bytes_in",
+    "bytes_out",
+    "referrer",
+    "query_params",
+    "error",
+    "raw",
+)
+
+# Cột suy ra lúc ghi (không do client gửi), nối vào cuối mỗi row trước khi insert
+STORED_LOG_COLUMNS: tuple[str, ...] = LOG_COLUMNS + ("sig_mask", "sig_version")
+
+LogRow = tuple[Any, ...]
+
+WRITE_MODES = ("orm", "core", "copy")
+
+
+def _copy_value(v: Any) -> str:
+    """Encode one value for COPY ... (FORMAT text)."""
+    if v is None:
+        return "\\N"
+    if isinstance(v, datetime):
+        return v.isoformat()
+    s = str(v)
+    if "\\" in s or "\t" in s or "\n" in s or "\r" in s:
+        s = s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return s
+
+
+def _copy_lines(rows: Iterable[LogRow]) -> Iterator[str]:
+    for row in rows:
+        yield "\t".join([_copy_value(v) for v in row]) + "\n"
+
+
+class _CopyReader:
+    """File-like adapter so `copy_expert` pulls rows lazily instead of from one big buffer."""
+
+    def __init__(self, lines: Iterator[str]) -> None:
+        self._lines = lines
+        self._buf = ""
+
+    def read(self, size: int = -1) -> str:
+        if size is None or size < 0:
+            out = self._buf + "".join(self._lines)
+            self._buf = ""
+            return out
+        while len(self._buf) < size:
+            try:
+                self._buf += next(self._lines)
+            except StopIteration:
+                break
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def supports_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def copy_log_rows(db: Session, rows: Sequence[LogRow], columns: Sequence[str] = LOG_COLUMNS) -> int:
+    """Stream rows into `logs` via PostgreSQL `COPY FROM STDIN` inside the session's transaction."""
+    if not rows:
+        return 0
+    dbapi_conn = db.connection().connection.driver_connection
+    sql = f"COPY {Log.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)"
+    with dbapi_conn.cursor() as cur:  # type: ignore[union-attr]
+        cur.copy_expert(sql, _CopyReader(_copy_lines(rows)))
+    return len(rows)
+
+
+def insert_log_rows(
+    db: Session, rows: Sequence[LogRow], columns: Sequence[str] = LOG_COLUMNS
+) -> int:
+    """Core `INSERT` executemany (batched multi-VALUES on PostgreSQL)."""
+    if not rows:
+        return 0
+    db.execute(insert(Log), [dict(zip(columns, row)) for row in rows])
+    return len(rows)
+
+
+def write_log_rows(
+    db: Session, rows: Sequence[LogRow], mode: str, columns: Sequence[str] = LOG_COLUMNS
+) -> int:
+    """Write row tuples using the requested bulk mode ("copy" falls back to "core" off psycopg2)."""
+    if mode == "copy" and supports_copy(db):
+        return copy_log_rows(db, rows, columns)
+    if mode in ("copy", "core"):
+        return insert_log_rows(db, rows, columns)
+    # "orm": giữ nguyên hành vi cũ (identity map + unit-of-work)
+    db.add_all([Log(**dict(zip(columns, row))) for row in rows])
+    return len(rows)
@@ -7,10 +7,12 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from backend.core.config import settings
+from backend.core.metrics import TimedQueuePool, instrument_engine
 
 # NOTE: DATABASE_URL is Optional in types; validator ensures non-None at runtime.
 _db_url: str = cast(str, settings.DATABASE_URL)
-_engine: Engine = create_engine(_db_url, future=True, pool_pre_ping=True)
+_engine: Engine = create_engine(_db_url, future=True, pool_pre_ping=True, poolclass=TimedQueuePool)
+instrument_engine(_engine)  # pool checkout / in-use / thời gian query cho /metrics
 
 _SessionLocal = sessionmaker(
     bind=_engine, autoflush=False, autocommit=False, expire_on_commit=False, future=True
@@ -0,0 +1,92 @@
+"""In-place schema upgrades for databases created by an older `create_all`.
+
+`create_all` only creates missing tables; every statement here must be idempotent so
+`scripts/migrate_db.py` can run on both fresh and existing databases.
+"""
+
+from __future__ import annotations
+
+from sqlalchemy.engine import Engine
+
+from backend.db.models import Base
+from backend.db.partitions import migrate_to_partitioned, premake_partitions
+
+UPGRADES: list[str] = [
+    # ingest_metrics: một dòng / (phút, worker) + p50/p99
+    "ALTER TABLE ingest_metrics ADD COLUMN IF NOT EXISTS worker VARCHAR(128) NOT NULL DEFAULT ''",
+    (
+        "ALTER TABLE ingest_metrics "
+        "ADD COLUMN IF NOT EXISTS ingest_latency_p50_ms INTEGER NOT NULL DEFAULT 0"
+    ),
+    (
+        "ALTER TABLE ingest_metrics "
+        "ADD COLUMN IF NOT EXISTS ingest_latency_p99_ms INTEGER NOT NULL DEFAULT 0"
+    ),
+    # các dòng cũ (mỗi request 1 dòng) trùng phút → gán worker riêng để tạo unique index được
+    "UPDATE ingest_metrics SET worker = 'legacy-' || id WHERE worker = ''",
+    (
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_ingest_metrics_minute_worker "
+        "ON ingest_metrics (ts_minute, worker)"
+    ),
+    # ingest_metrics: tổng + histogram để gộp khi một phút được flush 2 lần
+    "ALTER TABLE ingest_metrics ADD COLUMN IF NOT EXISTS batches INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE ingest_metrics ADD COLUMN IF NOT EXISTS batch_events BIGINT NOT NULL DEFAULT 0",
+    "ALTER TABLE ingest_metrics ADD COLUMN IF NOT EXISTS latency_hist BYTEA",
+    # ip_stats: cột phục vụ rule đọc từ bucket phút
+    "ALTER TABLE ip_stats ADD COLUMN IF NOT EXISTS auth_fail INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE ip_stats ADD COLUMN IF NOT EXISTS not_found INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE ip_stats ADD COLUMN IF NOT EXISTS first_ts TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE ip_stats ADD COLUMN IF NOT EXISTS last_ts TIMESTAMP WITH TIME ZONE",
+    # rollup_watermarks: giữ watermark dưới các transaction ghi logs còn đang chạy
+    "ALTER TABLE rollup_watermarks ADD COLUMN IF NOT EXISTS safe_id BIGINT",
+    "ALTER TABLE rollup_watermarks ADD COLUMN IF NOT EXISTS snapshot_xmax BIGINT",
+    # logs.sig_mask: signature SQLi gắn lúc ingest (dòng cũ giữ NULL)
+    "ALTER TABLE logs ADD COLUMN IF NOT EXISTS sig_mask BIGINT",
+    # logs.sig_version: bộ pattern đã gắn sig_mask (scripts/retag_signatures.py gắn lại)
+    "ALTER TABLE logs ADD COLUMN IF NOT EXISTS sig_version INTEGER",
+    # events.is_open: chỉ dòng mới nhất của mỗi (rule_id, ip, endpoint) còn mở
+    "ALTER TABLE events ADD COLUMN IF NOT EXISTS is_open BOOLEAN NOT NULL DEFAULT true",
+    (
+        "UPDATE events e SET is_open = false WHERE e.is_open AND EXISTS ("
+        "SELECT 1 FROM events o WHERE o.rule_id = e.rule_id "
+        "AND o.ip IS NOT DISTINCT FROM e.ip AND o.endpoint IS NOT DISTINCT FROM e.endpoint "
+        "AND o.id > e.id)"
+    ),
+    (
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_events_open_incident "
+        "ON events (rule_id, ip, endpoint) NULLS NOT DISTINCT WHERE is_open"
+    ),
+    # rule_watermarks: thời gian chạy trung bình của từng rule (analyzer --profile)
+    "ALTER TABLE rule_watermarks ADD COLUMN IF NOT EXISTS avg_wall_ms DOUBLE PRECISION",
+    "ALTER TABLE rule_watermarks ADD COLUMN IF NOT EXISTS avg_db_ms DOUBLE PRECISION",
+    "ALTER TABLE rule_watermarks ADD COLUMN IF NOT EXISTS avg_rows DOUBLE PRECISION",
+    # index (cột, id) cho keyset pagination thay các index đơn cột
+    "CREATE INDEX IF NOT EXISTS ix_events_first_seen_id ON events (first_seen, id)",
+    "CREATE INDEX IF NOT EXISTS ix_events_last_seen_id ON events (last_seen, id)",
+    "CREATE INDEX IF NOT EXISTS ix_events_count_id ON events (count, id)",
+    "CREATE INDEX IF NOT EXISTS ix_events_severity_id ON events (severity, id)",
+    "DROP INDEX IF EXISTS ix_events_first_seen",
+    "DROP INDEX IF EXISTS ix_events_last_seen",
+]
+
+# Index của logs chạy sau migrate_to_partitioned: heap cũ bị copy rồi DROP nên build index
+# trên nó là phí; bảng phân vùng mới đã có index từ model, các lệnh này chỉ bù cho bảng
+# phân vùng tạo bởi bản cũ hơn
+LOGS_INDEX_UPGRADES: list[str] = [
+    "CREATE INDEX IF NOT EXISTS ix_logs_sig_ts ON logs (ts) WHERE sig_mask <> 0",
+    "CREATE INDEX IF NOT EXISTS ix_logs_ts_sig_version ON logs (ts, sig_version)",
+    "CREATE INDEX IF NOT EXISTS ix_logs_ts_id ON logs (ts, id)",
+    "DROP INDEX IF EXISTS ix_logs_ts",
+]
+
+
+def upgrade_schema(engine: Engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for stmt in UPGRADES:
+            conn.exec_driver_sql(stmt)
+        # logs dạng heap cũ → bảng phân vùng theo ts (copy dữ liệu trong cùng transaction)
+        migrate_to_partitioned(conn)
+        for stmt in LOGS_INDEX_UPGRADES:
+            conn.exec_driver_sql(stmt)
+        premake_partitions(conn)
@@ -1,9 +1,26 @@
 from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime, Index, Integer, String, Text, UniqueConstraint, text
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Boolean,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+    event,
+    text,
+)
+from sqlalchemy.engine.default import DefaultExecutionContext
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
+from backend.core.signatures import sig_mask, sqli_matcher
+
 
 class Base(DeclarativeBase):
     pass
@@ -34,11 +51,15 @@ COMMON_SCHEMA_OPTIONAL = [
 
 
 class Log(Base):
+    """Partitioned by RANGE (ts); see backend/db/partitions.py for creation and retention."""
+
     __tablename__ = "logs"
+    __table_args__ = {"postgresql_partition_by": "RANGE (ts)"}
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
 
-    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    # khóa phân vùng phải nằm trong primary key → PK (id, ts)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, nullable=False)
 
     # NOT NULL + default để test/seed không cần truyền mọi lúc
     source: Mapped[str] = mapped_column(
@@ -71,20 +92,69 @@ class Log(Base):
 
     raw: Mapped[Optional[str]] = mapped_column(Text, default=None)
 
+    # bitmask signature SQLi (xem core/signatures.py), tính một lần lúc ingest; 0 = không khớp
+    sig_mask: Mapped[Optional[int]] = mapped_column(
+        BigInteger, default=lambda ctx: _sig_mask_default(ctx)
+    )
+    # pattern_version của bộ pattern đã gắn sig_mask; NULL/khác bản hiện tại = phải so khớp lại
+    sig_version: Mapped[Optional[int]] = mapped_column(
+        Integer, default=lambda ctx: sqli_matcher().version
+    )
+
+
+def _sig_mask_default(ctx: DefaultExecutionContext) -> int:
+    params = ctx.get_current_parameters()
+    return sig_mask(params.get("endpoint"), params.get("query_params"))
+
 
 # index tổng hợp hữu ích cho truy vấn theo thời gian & IP
 Index("ix_logs_ts_ip", Log.ts, Log.ip)
+# keyset pagination /api/logs: ORDER BY ts, id (thay cho index đơn trên ts)
+Index("ix_logs_ts_id", Log.ts, Log.id)
+# partial index: chỉ các dòng có signature → rule R-003 không phải quét cả window
+Index("ix_logs_sig_ts", Log.ts, postgresql_where=Log.sig_mask != 0)
+# R-003 tìm dòng gắn tag bằng bộ pattern khác trong window mà không đọc heap
+Index("ix_logs_ts_sig_version", Log.ts, Log.sig_version)
+
+# partition DEFAULT nhận các dòng chưa có partition riêng (dữ liệu quá cũ / quá xa tương lai)
+event.listen(
+    Log.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs DEFAULT"),
+)
 
 
 class IngestMetric(Base):
+    """One row per (minute, API worker process), upserted by the in-memory recorder."""
+
     __tablename__ = "ingest_metrics"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     ts_minute: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    worker: Mapped[str] = mapped_column(
+        String(128), nullable=False, default="", server_default=text("''")
+    )
     count_ok: Mapped[int] = mapped_column(Integer, nullable=False)
     count_dropped: Mapped[int] = mapped_column(Integer, nullable=False)
     avg_batch_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    ingest_latency_p50_ms: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
     ingest_latency_p95_ms: Mapped[int] = mapped_column(Integer, nullable=False)
+    ingest_latency_p99_ms: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    # tổng và histogram gốc (orjson) để flush lần 2 của cùng phút gộp đúng thay vì lấy max
+    batches: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default=text("0")
+    )
+    batch_events: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default=text("0")
+    )
+    latency_hist: Mapped[Optional[bytes]] = mapped_column(LargeBinary, default=None)
+
+
+Index("uq_ingest_metrics_minute_worker", IngestMetric.ts_minute, IngestMetric.worker, unique=True)
 
 
 class Event(Base):
@@ -94,18 +164,35 @@ class Event(Base):
     severity: Mapped[int] = mapped_column(Integer, nullable=False)  # 1..5
     ip: Mapped[Optional[str]] = mapped_column(String(64), index=True, default=None)
     endpoint: Mapped[Optional[str]] = mapped_column(String(1024), default=None)
-    first_seen: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), index=True, nullable=False
-    )
-    last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    first_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_seen: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
     count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     evidence: Mapped[Optional[str]] = mapped_column(Text, default=None)
     source: Mapped[str] = mapped_column(
         String(32), default="rules", server_default=text("'rules'"), nullable=False
     )
+    # incident còn mở thì match mới cùng key được gộp vào (xem services/incidents.py)
+    is_open: Mapped[bool] = mapped_column(
+        Boolean, default=True, server_default=text("true"), nullable=False
+    )
 
 
 Index("ix_events_rule_last", Event.rule_id, Event.last_seen)
+# keyset pagination /api/events: một index (cột sắp xếp, id) cho mỗi order_by
+Index("ix_events_first_seen_id", Event.first_seen, Event.id)
+Index("ix_events_last_seen_id", Event.last_seen, Event.id)
+Index("ix_events_count_id", Event.count, Event.id)
+Index("ix_events_severity_id", Event.severity, Event.id)
+# tối đa một incident mở cho mỗi (rule_id, ip, endpoint); NULL được coi là bằng nhau
+Index(
+    "uq_events_open_incident",
+    Event.rule_id,
+    Event.ip,
+    Event.endpoint,
+    unique=True,
+    postgresql_where=Event.is_open,
+    postgresql_nulls_not_distinct=True,
+)
 
 
 class IPStat(Base):
@@ -120,7 +207,134 @@ class IPStat(Base):
     req_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     error_4xx: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
     error_5xx: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # cho rule đọc bucket thay vì quét logs: 401/403, 404, và ts đầu/cuối trong phút
+    auth_fail: Mapped[int] = mapped_column(
+        Integer, default=0, server_default=text("0"), nullable=False
+    )
+    not_found: Mapped[int] = mapped_column(
+        Integer, default=0, server_default=text("0"), nullable=False
+    )
+    first_ts: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=None)
+    last_ts: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), default=None)
 
     __table_args__ = (
         UniqueConstraint("bucket_start", "ip", "endpoint", name="uq_ip_stats_bucket_ip_ep"),
     )
+
+
+class DistinctSketch(Base):
+    """HyperLogLog of distinct items per (minute, kind, key), rebuilt with `ip_stats` buckets.
+
+    kind "ip_endpoints": endpoints seen per IP; "endpoint_fail_ips": IPs with a 401/403 per
+    endpoint. `n_items` is the exact count in that minute (an upper bound for merged windows).
+    """
+
+    __tablename__ = "distinct_sketches"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    bucket_start: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), index=True, nullable=False
+    )
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    key: Mapped[str] = mapped_column(String(1024), nullable=False)
+    n_items: Mapped[int] = mapped_column(Integer, nullable=False)
+    first_ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    sketch: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "kind", "key", name="uq_distinct_sketches_bucket_key"),
+    )
+
+
+class HeavyHitter(Base):
+    """Space-Saving snapshot per (minute, kind, API worker), replaced on every flush.
+
+    `count - error <= true count <= count`; a key missing from a snapshot occurred at most
+    `floor` times in that minute on that worker (see services/heavy_hitters.py).
+    """
+
+    __tablename__ = "heavy_hitters"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)  # ip | endpoint
+    worker: Mapped[str] = mapped_column(String(128), nullable=False)
+    key: Mapped[str] = mapped_column(String(1024), nullable=False)
+    count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    error: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    floor: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+Index("ix_heavy_hitters_kind_bucket", HeavyHitter.kind, HeavyHitter.bucket_start)
+Index("ix_heavy_hitters_bucket_worker", HeavyHitter.bucket_start, HeavyHitter.worker)
+
+
+class RollupWatermark(Base):
+    """Highest `logs.id` already folded into a rollup (see db/queries.py:aggregate_ip_stats)."""
+
+    __tablename__ = "rollup_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_id: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # id <= safe_id đã commit hết và đã rollup; (safe_id, last_id] có thể còn dòng chưa commit
+    safe_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # pg_snapshot_xmax lúc đọc last_id: khi mọi xid < giá trị này kết thúc, last_id thành safe
+    snapshot_xmax: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class RuleWatermark(Base):
+    """End of the last window evaluated per rule by the analyzer daemon (services/analyzer.py)."""
+
+    __tablename__ = "rule_watermarks"
+
+    rule_id: Mapped[str] = mapped_column(String(16), primary_key=True)
+    last_end: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    lag_sec: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # trung bình trượt (EWMA) mỗi window, chỉ ghi khi analyzer chạy với --profile
+    avg_wall_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+    avg_db_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+    avg_rows: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+class RateLimitBucket(Base):
+    """Shared token-bucket state (RATE_LIMIT_STORE=db) for multi-worker deployments."""
+
+    __tablename__ = "rate_limit_buckets"
+
+    # sha256 của API key — không lưu key dạng plain text
+    key_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    tokens: Mapped[float] = mapped_column(Float, nullable=False)
+    allowed: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class IngestIdempotency(Base):
+    """Responses of batches sent with an `Idempotency-Key` header, replayed on retry."""
+
+    __tablename__ = "ingest_idempotency"
+
+    key_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), index=True, nullable=False
+    )
+    response: Mapped[str] = mapped_column(Text, nullable=False)
+
+
+class AccessLogRange(Base):
+    """Byte ranges of raw access-log files already stored by scripts/ingest_access_log.py.
+
+    A file is identified by host + sha256 of its first line, so a re-run or a rotated
+    (renamed) copy skips what was already ingested instead of storing it twice.
+    """
+
+    __tablename__ = "access_log_ranges"
+
+    host: Mapped[str] = mapped_column(String(255), primary_key=True)
+    file_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    start_offset: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    end_offset: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    path: Mapped[str] = mapped_column(Text, nullable=False)
+    ingested_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,169 @@
+"""Range partitions of `logs` on `ts`: ahead-of-time creation, migration, partition-drop retention.
+
+Partitions are named `logs_pYYYYMMDD` (daily) or `logs_pYYYYMMDDHH` (hourly) and cover
+`[start, start + interval)` in UTC. Rows outside every partition land in `logs_default`.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.engine import Connection
+
+from backend.core.config import settings
+from backend.db.models import Log
+
+PARENT = "logs"
+DEFAULT = "logs_default"
+_NAME_RE = re.compile(r"^logs_p(\d{8}|\d{10})$")
+_STEPS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+_COLS = ", ".join(c.name for c in Log.__table__.columns)
+
+
+def floor_ts(ts: datetime, interval: str) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    if interval == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return "logs_p" + start.strftime("%Y%m%d%H" if interval == "hour" else "%Y%m%d")
+
+
+def _lit(ts: datetime) -> str:
+    return "'" + ts.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S+00") + "'"
+
+
+def is_partitioned(conn: Connection) -> bool:
+    kind = conn.exec_driver_sql(
+        "SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (PARENT,)
+    ).scalar()
+    return kind == "p"
+
+
+def list_partitions(conn: Connection) -> list[tuple[str, datetime, datetime]]:
+    """Return `(name, start, end)` of our range partitions, oldest first (default excluded)."""
+    names = conn.exec_driver_sql(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass",
+        (PARENT,),
+    ).scalars()
+    out = []
+    for name in names:
+        m = _NAME_RE.match(name)
+        if m is None:
+            continue
+        digits = m.group(1)
+        hourly = len(digits) == 10
+        start = datetime.strptime(digits, "%Y%m%d%H" if hourly else "%Y%m%d").replace(
+            tzinfo=timezone.utc
+        )
+        out.append((name, start, start + _STEPS["hour" if hourly else "day"]))
+    return sorted(out, key=lambda p: p[1])
+
+
+def create_partition(conn: Connection, start: datetime, interval: str) -> str:
+    """Create the partition starting at `start`; rows already in `logs_default` are moved in."""
+    name = partition_name(start, interval)
+    lo, hi = _lit(start), _lit(start + _STEPS[interval])
+    has_rows = conn.exec_driver_sql(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT} WHERE ts >= {lo} AND ts < {hi})"
+    ).scalar()
+    if not has_rows:
+        conn.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ({lo}) TO ({hi})"
+        )
+        return name
+    # Postgres từ chối CREATE ... PARTITION OF khi DEFAULT đã chứa dòng thuộc khoảng này:
+    # tạo bảng rời, chuyển dòng sang, rồi ATTACH
+    conn.exec_driver_sql(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)")
+    conn.exec_driver_sql(
+        f"WITH moved AS (DELETE FROM {DEFAULT} WHERE ts >= {lo} AND ts < {hi} "
+        f"RETURNING {_COLS}) INSERT INTO {name} ({_COLS}) SELECT {_COLS} FROM moved"
+    )
+    conn.exec_driver_sql(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES FROM ({lo}) TO ({hi})"
+    )
+    return name
+
+
+def ensure_partitions(
+    conn: Connection, start: datetime, end: datetime, interval: str | None = None
+) -> list[str]:
+    """Create every missing partition between `start` and `end` (inclusive). Return new names."""
+    interval = interval or settings.LOGS_PARTITION_INTERVAL
+    step = _STEPS[interval]
+    existing = list_partitions(conn)
+    created = []
+    cur = floor_ts(start, interval)
+    while cur <= end:
+        nxt = cur + step
+        # bỏ qua khoảng đã được phủ (kể cả khi đổi interval day ↔ hour)
+        if not any(s < nxt and cur < e for _, s, e in existing):
+            created.append(create_partition(conn, cur, interval))
+        cur = nxt
+    return created
+
+
+def premake_partitions(conn: Connection, now: datetime | None = None) -> list[str]:
+    """Create the current partition plus `LOGS_PARTITIONS_AHEAD` future ones."""
+    now = now or datetime.now(timezone.utc)
+    interval = settings.LOGS_PARTITION_INTERVAL
+    ahead = _STEPS[interval] * max(0, settings.LOGS_PARTITIONS_AHEAD)
+    return ensure_partitions(conn, now, now + ahead, interval)
+
+
+def drop_expired_partitions(
+    conn: Connection, retention_days: int | None = None, now: datetime | None = None
+) -> tuple[list[str], int]:
+    """DROP partitions entirely older than the retention cutoff.
+
+    Return (dropped partition names, rows deleted from `logs_default`).
+    """
+    days = settings.RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(days=days)
+    dropped = []
+    for name, _, end in list_partitions(conn):
+        if end <= cutoff:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {name}")
+            dropped.append(name)
+    # default partition thường nhỏ → DELETE là chấp nhận được
+    res = conn.exec_driver_sql(f"DELETE FROM {DEFAULT} WHERE ts < {_lit(cutoff)}")
+    return dropped, res.rowcount
+
+
+def migrate_to_partitioned(conn: Connection, now: datetime | None = None) -> bool:
+    """Rebuild a plain `logs` heap as a partitioned table in one transaction.
+
+    Return False when `logs` is already partitioned (or missing).
+    """
+    exists = conn.exec_driver_sql("SELECT to_regclass(%s)", (PARENT,)).scalar()
+    if exists is None or is_partitioned(conn):
+        return False
+    now = now or datetime.now(timezone.utc)
+
+    conn.exec_driver_sql(f"ALTER TABLE {PARENT} RENAME TO logs_legacy")
+    # giải phóng tên index / sequence để bảng mới dùng lại
+    for idx in conn.exec_driver_sql(
+        "SELECT indexname FROM pg_indexes WHERE tablename = 'logs_legacy'"
+    ).scalars():
+        conn.exec_driver_sql(f'ALTER INDEX "{idx}" RENAME TO "legacy_{idx}"')
+    conn.exec_driver_sql("ALTER SEQUENCE IF EXISTS logs_id_seq RENAME TO logs_legacy_id_seq")
+
+    Log.metadata.tables[PARENT].create(conn)  # after_create → logs_default
+    lo, hi = conn.exec_driver_sql("SELECT min(ts), max(ts) FROM logs_legacy").one()
+    if lo is not None:
+        # dữ liệu ngoài retention đi vào DEFAULT, lần retention kế tiếp sẽ xóa
+        keep_from = max(lo, now - timedelta(days=settings.RETENTION_DAYS))
+        ensure_partitions(conn, keep_from, max(hi, keep_from))
+    conn.exec_driver_sql(f"INSERT INTO {PARENT} ({_COLS}) SELECT {_COLS} FROM logs_legacy")
+    conn.exec_driver_sql(
+        "SELECT setval(pg_get_serial_sequence('logs', 'id'), "
+        "COALESCE((SELECT max(id) FROM logs), 0) + 1, false)"
+    )
+    conn.exec_driver_sql("DROP TABLE logs_legacy")
+    return True
@@ -1,19 +1,526 @@
-"""Query helpers for analyzer & read APIs (no-op stubs for Step 2 smoke test)."""
+"""Query helpers for analyzer & read APIs."""
 
 from __future__ import annotations
 
-from datetime import datetime
-from typing import Any, Sequence
+import base64
+import operator
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Sequence, cast
 
-from sqlalchemy import asc, desc
+import orjson
+from sqlalchemy import (
+    BigInteger,
+    ColumnElement,
+    DateTime,
+    Select,
+    Text,
+    and_,
+    asc,
+    desc,
+    func,
+    literal,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import CursorResult
 from sqlalchemy.orm import Session
 
-from backend.db.models import Event
+from backend.core.config import settings
+from backend.core.hll import HyperLogLog, hash64, merge_all, precision_for, std_error
+from backend.db.models import DistinctSketch, Event, IPStat, Log, RollupWatermark
 
+IP_STATS_WATERMARK = "ip_stats"
+MINUTE = timedelta(minutes=1)
+_ROLLUP_COLS = (
+    "bucket_start",
+    "ip",
+    "endpoint",
+    "req_count",
+    "error_4xx",
+    "error_5xx",
+    "auth_fail",
+    "not_found",
+    "first_ts",
+    "last_ts",
+)
+# kind → (cột key, cột item, chỉ lấy bucket có 401/403?) trên ip_stats
+SKETCH_KINDS = {
+    "ip_endpoints": ("ip", "endpoint", False),
+    "endpoint_fail_ips": ("endpoint", "ip", True),
+}
 
-def aggregate_ip_stats(db: Session, start: datetime, end: datetime) -> int:
-    """No-op: return 0 rows aggregated (Step 2 smoke test)."""
-    return 0
+
+def _floor_minute(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def _minute_range(start: datetime, end: datetime) -> list[datetime]:
+    out, m = [], _floor_minute(start)
+    while m < end:
+        out.append(m)
+        m += MINUTE
+    return out
+
+
+def _minute_spans(minutes: Iterable[datetime]) -> list[tuple[datetime, datetime]]:
+    """Merge minute starts into contiguous [start, end) ranges (so `ts` index/pruning apply)."""
+    spans: list[tuple[datetime, datetime]] = []
+    for m in sorted(set(minutes)):
+        if spans and spans[-1][1] == m:
+            spans[-1] = (spans[-1][0], m + MINUTE)
+        else:
+            spans.append((m, m + MINUTE))
+    return spans
+
+
+Span = tuple[datetime, datetime]
+
+
+@dataclass(frozen=True)
+class BucketWindow:
+    """[start, end) as whole minute buckets [full_start, full_end) + partial edges from logs."""
+
+    full_start: datetime
+    full_end: datetime
+    edges: tuple[Span, ...]
+
+
+def split_window(start: datetime, end: datetime) -> BucketWindow:
+    """Split a window so rules count only buckets wholly inside it, plus the raw edges."""
+    floor = _floor_minute(start)
+    full_start = floor if floor == start else floor + MINUTE
+    full_end = _floor_minute(end)
+    if full_start >= full_end:  # window nằm trong 1-2 phút lẻ: đọc hết từ logs
+        return BucketWindow(full_start, full_start, ((start, end),) if start < end else ())
+    edges = tuple((a, b) for a, b in ((start, full_start), (full_end, end)) if a < b)
+    return BucketWindow(full_start, full_end, edges)
+
+
+def _rollup_minutes(db: Session, minutes: Iterable[datetime]) -> int:
+    """Recompute whole minute buckets from `logs` and upsert them. Return rows changed."""
+    spans = _minute_spans(minutes)
+    if not spans:
+        return 0
+    bucket = func.date_trunc("minute", Log.ts)
+    sel = (
+        select(
+            bucket,
+            Log.ip,
+            Log.endpoint,
+            func.count(),
+            func.count().filter(Log.status_code.between(400, 499)),
+            func.count().filter(Log.status_code >= 500),
+            func.count().filter(Log.status_code.in_([401, 403])),
+            func.count().filter(Log.status_code == 404),
+            func.min(Log.ts),
+            func.max(Log.ts),
+        )
+        .where(or_(*(and_(Log.ts >= a, Log.ts < b) for a, b in spans)))
+        .group_by(bucket, Log.ip, Log.endpoint)
+    )
+    stmt = pg_insert(IPStat).from_select(list(_ROLLUP_COLS), sel)
+    ex = stmt.excluded
+    # ghi đè (không cộng dồn) → chạy lại cùng phút cho cùng kết quả; bỏ qua update không đổi
+    stmt = stmt.on_conflict_do_update(
+        constraint="uq_ip_stats_bucket_ip_ep",
+        set_={c: ex[c] for c in _ROLLUP_COLS[3:]},
+        where=or_(*(IPStat.__table__.c[c].is_distinct_from(ex[c]) for c in _ROLLUP_COLS[3:])),
+    )
+    res = cast(CursorResult[Any], db.execute(stmt))
+    _rollup_sketches(db, spans)
+    return int(res.rowcount or 0)
+
+
+def _rollup_sketches(db: Session, spans: list[tuple[datetime, datetime]]) -> None:
+    """Rebuild the `distinct_sketches` of the given minutes from their `ip_stats` buckets."""
+    rows = db.execute(
+        select(
+            IPStat.bucket_start,
+            IPStat.ip,
+            IPStat.endpoint,
+            IPStat.auth_fail,
+            IPStat.first_ts,
+            IPStat.last_ts,
+        ).where(or_(*(and_(IPStat.bucket_start >= a, IPStat.bucket_start < b) for a, b in spans)))
+    ).all()
+    p = precision_for(settings.HLL_STD_ERROR)
+    hashes: dict[str, int] = {}
+    acc: dict[tuple[datetime, str, str], list[Any]] = {}
+    for r in rows:
+        if r.endpoint is None:
+            continue
+        for kind, (key_col, item_col, fails_only) in SKETCH_KINDS.items():
+            if fails_only and not r.auth_fail:
+                continue
+            key, item = getattr(r, key_col), getattr(r, item_col)
+            cur = acc.get((r.bucket_start, kind, key))
+            if cur is None:
+                cur = acc[(r.bucket_start, kind, key)] = [HyperLogLog(p), 0, r.first_ts, r.last_ts]
+            h = hashes.get(item)
+            if h is None:
+                h = hashes[item] = hash64(item)
+            cur[0].add_hash(h)
+            cur[1] += 1  # (phút, ip, endpoint) là duy nhất trong ip_stats → đếm chính xác
+            cur[2] = min(cur[2], r.first_ts)
+            cur[3] = max(cur[3], r.last_ts)
+    if not acc:
+        return
+    stmt = pg_insert(DistinctSketch)
+    ex = stmt.excluded
+    db.execute(
+        stmt.on_conflict_do_update(
+            constraint="uq_distinct_sketches_bucket_key",
+            set_={c: ex[c] for c in ("n_items", "first_ts", "last_ts", "sketch")},
+            where=DistinctSketch.sketch.is_distinct_from(ex.sketch),
+        ),
+        [
+            {
+                "bucket_start": minute,
+                "kind": kind,
+                "key": key,
+                "n_items": n,
+                "first_ts": first,
+                "last_ts": last,
+                "sketch": hll.to_bytes(),
+            }
+            for (minute, kind, key), (hll, n, first, last) in acc.items()
+        ],
+    )
+
+
+@dataclass
+class DistinctCount:
+    key: str
+    estimate: int
+    std_error: float  # sai số chuẩn tương đối của estimate
+    first_seen: datetime
+    last_seen: datetime
+
+
+def distinct_counts(
+    db: Session,
+    kind: str,
+    start: datetime,
+    end: datetime,
+    *,
+    min_items: int,
+    max_error: float | None = None,
+    keys: Sequence[str] | None = None,
+) -> list[DistinctCount]:
+    """Approximate distinct items per key over [start, end).
+
+    Minutes wholly inside the window come from their sketches; the partial edge minutes
+    are read from `logs` (see `split_window`). Only keys whose per-minute exact counts sum
+    to at least `min_items` are merged (the sum bounds the distinct count from above).
+    Sketches are folded to the precision of `max_error` (default `HLL_STD_ERROR`) when
+    they were stored finer.
+    """
+    win = split_window(start, end)
+    edge = _edge_items(db, kind, win.edges, keys)
+    slack = max((len(e[0]) for e in edge.values()), default=0)
+    where = [
+        DistinctSketch.kind == kind,
+        DistinctSketch.bucket_start >= win.full_start,
+        DistinctSketch.bucket_start < win.full_end,
+    ]
+    if keys is not None:
+        where.append(DistinctSketch.key.in_(keys))
+    candidates = (
+        select(DistinctSketch.key)
+        .where(*where)
+        .group_by(DistinctSketch.key)
+        .having(func.sum(DistinctSketch.n_items) >= min_items - slack)
+    )
+    rows = db.execute(
+        select(
+            DistinctSketch.key,
+            DistinctSketch.n_items,
+            DistinctSketch.sketch,
+            DistinctSketch.first_ts,
+            DistinctSketch.last_ts,
+        ).where(*where, DistinctSketch.key.in_(candidates))
+    ).all()
+    per_key: dict[str, list[Any]] = {}
+    for r in rows:
+        per_key.setdefault(r.key, []).append(r)
+    p = precision_for(max_error if max_error is not None else settings.HLL_STD_ERROR)
+    out = []
+    for key in per_key.keys() | edge.keys():
+        rs = per_key.get(key, [])
+        items, first, last = edge.get(key, (set(), None, None))
+        if sum(r.n_items for r in rs) + len(items) < min_items:
+            continue
+        merged = merge_all((HyperLogLog.from_bytes(r.sketch) for r in rs), p) or HyperLogLog(p)
+        merged.update(items)
+        firsts = [r.first_ts for r in rs] + ([first] if first is not None else [])
+        lasts = [r.last_ts for r in rs] + ([last] if last is not None else [])
+        out.append(
+            DistinctCount(
+                key=key,
+                estimate=merged.estimate(),
+                std_error=std_error(merged.p),
+                first_seen=min(firsts),
+                last_seen=max(lasts),
+            )
+        )
+    return out
+
+
+def _edge_items(
+    db: Session, kind: str, edges: Sequence[Span], keys: Sequence[str] | None
+) -> dict[str, tuple[set[str], datetime | None, datetime | None]]:
+    """Distinct (key → items, first ts, last ts) of `kind` read from raw `logs` in `edges`."""
+    if not edges:
+        return {}
+    key_col, item_col, fails_only = SKETCH_KINDS[kind]
+    k, item = getattr(Log, key_col), getattr(Log, item_col)
+    q = (
+        select(k, item, func.min(Log.ts), func.max(Log.ts))
+        .where(or_(*(and_(Log.ts >= a, Log.ts < b) for a, b in edges)), Log.endpoint.is_not(None))
+        .group_by(k, item)
+    )
+    if fails_only:
+        q = q.where(Log.status_code.in_([401, 403]))
+    if keys is not None:
+        q = q.where(k.in_(keys))
+    out: dict[str, tuple[set[str], datetime | None, datetime | None]] = {}
+    for key, it, first, last in db.execute(q):
+        items, lo, hi = out.get(key, (set(), first, last))
+        items.add(it)
+        out[key] = (items, min(lo, first), max(hi, last))
+    return out
+
+
+# xid8 → bigint (không có cast trực tiếp, đi qua text)
+_SNAPSHOT_XMIN = func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+_SNAPSHOT_XMAX = func.pg_snapshot_xmax(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+
+
+def aggregate_ip_stats(
+    db: Session,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    now: datetime | None = None,
+) -> int:
+    """Fold logs that arrived since the last run into per-minute (ip, endpoint) buckets.
+
+    New rows are found by `logs.id` above the stored watermark; every minute they touch
+    (including old minutes, for late-arriving data) is recomputed in full and upserted, so
+    re-running is idempotent and a run with nothing new costs one index lookup.
+    An id can be taken by a transaction that commits after a higher id was read (a long
+    COPY, a write-behind batch), so `last_id` only becomes `safe_id` once every
+    transaction running at that read has ended (`pg_snapshot_xmin` has passed the stored
+    `snapshot_xmax`); the run that sees this re-reads `(safe_id, last_id]`.
+    Passing `start`/`end` additionally rebuilds the minutes of that window.
+    Return the number of `ip_stats` rows inserted or changed.
+    """
+    wm = db.get(RollupWatermark, IP_STATS_WATERMARK, with_for_update=True)
+    if wm is None:
+        db.execute(
+            pg_insert(RollupWatermark)
+            .values(name=IP_STATS_WATERMARK, last_id=0, updated_at=datetime.now(timezone.utc))
+            .on_conflict_do_nothing()
+        )
+        # khóa dòng watermark: 2 lượt cron chồng nhau sẽ chạy tuần tự
+        wm = db.get(
+            RollupWatermark, IP_STATS_WATERMARK, with_for_update=True, populate_existing=True
+        )
+        assert wm is not None
+
+    # các phút cần tính lại ở lượt đầu: cửa sổ yêu cầu (nếu có) + vài phút gần nhất
+    pending: set[datetime] = set()
+    if start is not None and end is not None:
+        pending.update(_minute_range(start, end))
+
+    # max(id) và snapshot trong cùng một câu lệnh: xid < xmin đã kết thúc, xmin == xmax là
+    # không còn transaction nào khác đang chạy
+    top, xmin, xmax = db.execute(select(func.max(Log.id), _SNAPSHOT_XMIN, _SNAPSHOT_XMAX)).one()
+    hi = int(top or 0)
+    last = wm.last_id if wm.last_id <= hi else 0  # logs bị TRUNCATE ... RESTART IDENTITY
+    safe = last if wm.safe_id is None or wm.safe_id > last else wm.safe_id
+    settled = wm.snapshot_xmax is not None and xmin >= wm.snapshot_xmax
+    lo = safe if settled else last
+    wm.safe_id = hi if xmin == xmax else (last if settled else safe)
+    wm.snapshot_xmax = xmax
+    if hi == lo:
+        return _rollup_minutes(db, pending)
+
+    now = now or datetime.now(timezone.utc)
+    pending.update(_minute_range(now - timedelta(seconds=settings.ROLLUP_RECHECK_SEC), now))
+
+    changed = 0
+    step = max(1, settings.ROLLUP_MAX_IDS_PER_PASS)
+    while lo < hi:
+        upto = min(hi, lo + step)
+        minutes = db.scalars(
+            select(func.date_trunc("minute", Log.ts)).where(Log.id > lo, Log.id <= upto).distinct()
+        )
+        pending.update(_floor_minute(m) for m in minutes)
+        changed += _rollup_minutes(db, pending)
+        pending, lo = set(), upto
+
+    wm.last_id = hi
+    wm.updated_at = datetime.now(timezone.utc)
+    return changed
+
+
+# --- read APIs: keyset pagination ---
+# order_by hợp lệ → cột; mỗi cột có index (cột, id) để trang sâu cũng chỉ là một index seek
+LOG_ORDER = {"ts": Log.ts, "id": Log.id}
+EVENT_ORDER = {
+    "id": Event.id,
+    "first_seen": Event.first_seen,
+    "last_seen": Event.last_seen,
+    "count": Event.count,
+    "severity": Event.severity,
+}
+LOG_FIELDS = (
+    "id", "ts", "source", "host", "ip", "endpoint", "method", "status_code", "resp_time_ms",
+    "ua", "action_type", "user_id", "session_id", "bytes_in", "bytes_out", "referrer",
+    "query_params", "error",
+)  # fmt: skip
+EVENT_FIELDS = (
+    "id", "rule_id", "severity", "ip", "endpoint", "first_seen", "last_seen", "count", "evidence",
+)  # fmt: skip
+
+
+@dataclass
+class Page:
+    items: list[dict[str, Any]]
+    next_cursor: str | None  # None = trang cuối
+
+
+def _order(order_by: str, columns: dict[str, Any], default: str) -> tuple[str, bool]:
+    """Normalize `order_by` ('-col' = descending); unknown columns fall back to `default`."""
+    desc_order = order_by.startswith("-")
+    name = order_by[1:] if desc_order else order_by
+    if name not in columns:
+        return _order(default, columns, default)
+    return name, desc_order
+
+
+def encode_cursor(order_key: str, value: Any, row_id: int) -> str:
+    raw = orjson.dumps([order_key, value, row_id])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, order_key: str, column: Any) -> tuple[Any, int]:
+    """(order value, id) after which the next page starts; ValueError if malformed or
+    issued for another sort order."""
+    try:
+        key, value, row_id = orjson.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        )
+        if isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, int):
+            raise TypeError(value)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if key != order_key or not isinstance(row_id, int):
+        raise ValueError("cursor does not match order_by")
+    return value, row_id
+
+
+def ordered(
+    stmt: Select[Any], columns: dict[str, Any], id_col: Any, order_by: str, default: str
+) -> tuple[Select[Any], str, Any]:
+    """Apply ORDER BY (col, id) in one direction; return (stmt, order key, column)."""
+    name, desc_order = _order(order_by, columns, default)
+    col = columns[name]
+    key = f"-{name}" if desc_order else name
+    if col is id_col:
+        return stmt.order_by(desc(col) if desc_order else asc(col)), key, col
+    if desc_order:
+        return stmt.order_by(desc(col), desc(id_col)), key, col
+    return stmt.order_by(asc(col), asc(id_col)), key, col
+
+
+def _keyset_page(
+    db: Session,
+    stmt: Select[Any],
+    *,
+    columns: dict[str, Any],
+    id_col: Any,
+    fields: Sequence[str],
+    default: str,
+    order_by: str,
+    cursor: str | None,
+    limit: int,
+) -> Page:
+    stmt, key, col = ordered(stmt, columns, id_col, order_by, default)
+    if cursor:
+        value, row_id = decode_cursor(cursor, key, col)
+        after = operator.lt if key.startswith("-") else operator.gt
+        # so sánh theo hàng (col, id) > (v, id) → Postgres seek thẳng trên index (col, id)
+        stmt = stmt.where(
+            after(col, value)
+            if col is id_col
+            else after(tuple_(col, id_col), tuple_(literal(value, col.type), literal(row_id)))
+        )
+    rows = db.execute(stmt.limit(limit + 1)).mappings().all()
+    items = [jsonable(r, fields) for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(key, last[col.key], last[id_col.key])
+    return Page(items, next_cursor)
+
+
+def jsonable(row: Any, fields: Sequence[str]) -> dict[str, Any]:
+    out = {f: row[f] for f in fields}
+    return {f: v.isoformat() if isinstance(v, datetime) else v for f, v in out.items()}
+
+
+def log_filters(
+    *,
+    ts_from: datetime | None,
+    ts_to: datetime | None,
+    ip: str | None,
+    endpoint: str | None,
+    status: int | None,
+) -> list[ColumnElement[bool]]:
+    conds: list[ColumnElement[bool]] = []
+    if ts_from:
+        conds.append(Log.ts >= ts_from)
+    if ts_to:
+        conds.append(Log.ts < ts_to)
+    if ip:
+        conds.append(Log.ip == ip)
+    if endpoint:
+        conds.append(Log.endpoint == endpoint)
+    if status is not None:
+        conds.append(Log.status_code == status)
+    return conds
+
+
+def event_filters(
+    *,
+    ts_from: datetime | None,
+    ts_to: datetime | None,
+    rule_id: str | None,
+    severity: int | None,
+    ip: str | None,
+    endpoint: str | None,
+) -> list[ColumnElement[bool]]:
+    conds: list[ColumnElement[bool]] = []
+    if ts_from:
+        conds.append(Event.last_seen >= ts_from)
+    if ts_to:
+        conds.append(Event.last_seen < ts_to)
+    if rule_id:
+        conds.append(Event.rule_id == rule_id)
+    if severity is not None:
+        conds.append(Event.severity == severity)
+    if ip:
+        conds.append(Event.ip == ip)
+    if endpoint:
+        conds.append(Event.endpoint == endpoint)
+    return conds
 
 
 def fetch_logs(
@@ -25,11 +532,16 @@ def fetch_logs(
     endpoint: str | None,
     status: int | None,
     limit: int,
-    offset: int,
+    cursor: str | None,
     order_by: str,
-) -> Sequence[dict[str, Any]]:
-    """No-op: return empty list (wire API first)."""
-    return []
+) -> Page:
+    """One page of logs after `cursor` (from the previous page's `next_cursor`)."""
+    conds = log_filters(ts_from=ts_from, ts_to=ts_to, ip=ip, endpoint=endpoint, status=status)
+    stmt = select(*(getattr(Log, f) for f in LOG_FIELDS)).where(*conds)
+    return _keyset_page(
+        db, stmt, columns=LOG_ORDER, id_col=Log.id, fields=LOG_FIELDS, default="-ts",
+        order_by=order_by, cursor=cursor, limit=limit,
+    )  # fmt: skip
 
 
 def fetch_events(
@@ -42,52 +554,15 @@ def fetch_events(
     ip: str | None,
     endpoint: str | None,
     limit: int,
-    offset: int,
+    cursor: str | None,
     order_by: str,
-) -> Sequence[dict[str, Any]]:
-    q = db.query(Event)
-
-    if ts_from:
-        q = q.filter(Event.last_seen >= ts_from)
-    if ts_to:
-        q = q.filter(Event.last_seen < ts_to)
-    if rule_id:
-        q = q.filter(Event.rule_id == rule_id)
-    if severity is not None:
-        q = q.filter(Event.severity == severity)
-    if ip:
-        q = q.filter(Event.ip == ip)
-    if endpoint:
-        q = q.filter(Event.endpoint == endpoint)
-
-    # Map các lựa chọn order_by hợp lệ
-    colmap = {
-        "id": Event.id,
-        "first_seen": Event.first_seen,
-        "last_seen": Event.last_seen,
-        "count": Event.count,
-        "severity": Event.severity,
-    }
-    desc_order = order_by.startswith("-")
-    col_name = order_by[1:] if desc_order else order_by
-    col = colmap.get(col_name, Event.last_seen)
-    q = q.order_by(desc(col) if desc_order else asc(col))
-
-    q = q.offset(offset).limit(limit)
-    rows = q.all()
-
-    # Trả về dict JSON-serializable
-    return [
-        {
-            "id": r.id,
-            "rule_id": r.rule_id,
-            "severity": r.severity,
-            "ip": r.ip,
-            "endpoint": r.endpoint,
-            "first_seen": r.first_seen.isoformat(),
-            "last_seen": r.last_seen.isoformat(),
-            "count": r.count,
-            "evidence": r.evidence,
-        }
-        for r in rows
-    ]
+) -> Page:
+    """One page of events after `cursor`; time filters apply to `last_seen`."""
+    conds = event_filters(
+        ts_from=ts_from, ts_to=ts_to, rule_id=rule_id, severity=severity, ip=ip, endpoint=endpoint
+    )
+    stmt = select(*(getattr(Event, f) for f in EVENT_FIELDS)).where(*conds)
+    return _keyset_page(
+        db, stmt, columns=EVENT_ORDER, id_col=Event.id, fields=EVENT_FIELDS, default="-last_seen",
+        order_by=order_by, cursor=cursor, limit=limit,
+    )  # fmt: skip
@@ -5,9 +5,14 @@ from typing import AsyncIterator
 from fastapi import FastAPI
 
 from backend.api.routes.logs import router as logs_router
+from backend.api.routes.metrics import router as metrics_router
 from backend.api.routes.read import router as read_router
+from backend.core import metrics
 from backend.core.config import settings
 from backend.core.logger import setup_logging
+from backend.services.heavy_hitters import heavy_hitters
+from backend.services.ingest_metrics import ingest_metrics
+from backend.services.ingest_queue import ingest_queue
 
 # init logging sớm
 setup_logging(settings.LOG_LEVEL)
@@ -16,12 +21,23 @@ setup_logging(settings.LOG_LEVEL)
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     # === startup ===
-    # Place for warmups if needed
+    ingest_metrics.start()
+    if settings.INGEST_WRITE_BEHIND:
+        ingest_queue.start()
+    if settings.HEAVY_HITTERS_ENABLED:
+        heavy_hitters.start()
     yield
     # === shutdown ===
-    # Place for teardowns if needed
+    # drain write-behind queue so accepted (202) events are not lost
+    ingest_queue.stop()
+    ingest_metrics.stop()  # flush cả phút hiện tại
+    if settings.HEAVY_HITTERS_ENABLED:
+        heavy_hitters.stop()
+    metrics.mark_process_dead()
 
 
 app: FastAPI = FastAPI(title="mini-SIEM Collector API", lifespan=lifespan)
 app.include_router(logs_router)
 app.include_router(read_router)
+app.include_router(metrics_router)
+app.add_middleware(metrics.PrometheusMiddleware)
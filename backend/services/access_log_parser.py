@@ -0,0 +1,244 @@
+"""Raw nginx / apache access-log parsing into common-schema rows (see docs/architecture.md).
+
+Rows come out as tuples ordered like `LOG_COLUMNS`, ready for `LogIngestor.save_rows`.
+Large files are memory-mapped, split on line boundaries and parsed across a process pool.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import re
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TypeVar
+
+from backend.db.bulk import LogRow
+
+# $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent
+#   "$http_referer" "$http_user_agent"   (nginx "combined" == apache "%h %l %u %t ...")
+_COMBINED = (
+    r'(?P<ip>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] "(?P<request>(?:[^"\\]|\\.)*)" '
+    r"(?P<status>\d{3}) (?P<bytes>\d+|-)"
+    r'(?: "(?P<referrer>(?:[^"\\]|\\.)*)" "(?P<ua>(?:[^"\\]|\\.)*)")?'
+)
+PATTERNS: dict[str, re.Pattern[str]] = {
+    "combined": re.compile(_COMBINED + r"\s*$"),
+    # nginx: ... "$http_user_agent" $request_time [$upstream_response_time ...]  (giây, float)
+    "nginx_extended": re.compile(_COMBINED + r" (?P<rt_sec>\d+(?:\.\d+)?)(?: .*)?$"),
+    # apache: LogFormat "%h %l %u %t \"%r\" %>s %b \"%{Referer}i\" \"%{User-agent}i\" %D" (µs)
+    "apache_extended": re.compile(_COMBINED + r" (?P<rt_us>\d+)(?: .*)?$"),
+}
+
+_MONTHS = {
+    m: i + 1
+    for i, m in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    )
+}
+_TZ_CACHE: dict[str, timezone] = {}
+
+T = TypeVar("T")
+Span = tuple[int, int]  # [start, end) byte offsets trong file
+
+_FILE_ID_MAX_BYTES = 4096
+
+
+def _parse_time_local(s: str) -> datetime:
+    """`10/Oct/2000:13:55:36 -0700` → aware datetime (nhanh hơn strptime nhiều lần)."""
+    tz_s = s[21:26]
+    tz = _TZ_CACHE.get(tz_s)
+    if tz is None:
+        sign = -1 if tz_s[0] == "-" else 1
+        tz = timezone(sign * timedelta(hours=int(tz_s[1:3]), minutes=int(tz_s[3:5])))
+        _TZ_CACHE[tz_s] = tz
+    return datetime(
+        int(s[7:11]),
+        _MONTHS[s[3:6]],
+        int(s[0:2]),
+        int(s[12:14]),
+        int(s[15:17]),
+        int(s[18:20]),
+        tzinfo=tz,
+    )
+
+
+def _dash(v: str | None) -> str | None:
+    return None if v is None or v == "-" or v == "" else v
+
+
+@dataclass(frozen=True)
+class ParseOptions:
+    fmt: str = "combined"
+    host: str = "unknown"
+    source: str = "nginx"
+
+
+def parse_line(line: str, opts: ParseOptions) -> LogRow | None:
+    """Parse one access-log line; None if it does not match the format."""
+    m = PATTERNS[opts.fmt].match(line)
+    if m is None:
+        return None
+    try:
+        ts = _parse_time_local(m["time"])
+    except (KeyError, ValueError, IndexError):
+        return None
+    request = m["request"]
+    parts = request.split(" ")
+    if len(parts) >= 2:
+        method, target = parts[0], parts[1]
+    else:  # request rác (quét TLS, "-", ...) vẫn giữ lại để phân tích
+        method, target = "-", request
+    path, _, query = target.partition("?")
+    groups = m.groupdict()
+    if groups.get("rt_sec") is not None:
+        resp_ms = int(float(groups["rt_sec"]) * 1000)
+    elif groups.get("rt_us") is not None:
+        resp_ms = int(groups["rt_us"]) // 1000
+    else:
+        resp_ms = 0
+    size = m["bytes"]
+    return (
+        ts,
+        opts.source,
+        opts.host,
+        m["ip"],
+        path[:1024] or "-",
+        method[:16],
+        int(m["status"]),
+        resp_ms,
+        _dash(m["ua"]),
+        "http",
+        _dash(m["user"]),
+        None,  # session_id
+        None,  # bytes_in
+        None if size == "-" else int(size),
+        _dash(m["referrer"]),
+        query or None,
+        None,  # error
+        line,
+    )
+
+
+def parse_lines(lines: Iterator[str] | list[str], opts: ParseOptions) -> tuple[list[LogRow], int]:
+    """Return (rows, unparsed_count); blank lines are skipped."""
+    rows: list[LogRow] = []
+    bad = 0
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        row = parse_line(line, opts)
+        if row is None:
+            bad += 1
+        else:
+            rows.append(row)
+    return rows, bad
+
+
+def file_id(path: str) -> str | None:
+    """Identity of a log file that survives renames: sha256 of its first line.
+
+    None while the file has no complete first line yet.
+    """
+    with open(path, "rb") as f:
+        head = f.readline(_FILE_ID_MAX_BYTES)
+    if not head or (not head.endswith(b"\n") and len(head) < _FILE_ID_MAX_BYTES):
+        return None
+    return hashlib.sha256(head).hexdigest()
+
+
+def split_ranges(path: str, chunk_bytes: int, skip: Sequence[Span] = ()) -> list[Span]:
+    """Byte ranges of ~`chunk_bytes`, each ending right after a newline.
+
+    Ranges in `skip` (line-aligned, e.g. already ingested) are left out.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    gaps: list[Span] = []
+    pos = 0
+    for s, e in sorted(skip):
+        if s > pos:
+            gaps.append((pos, min(s, size)))
+        pos = max(pos, e)
+    if pos < size:
+        gaps.append((pos, size))
+    ranges: list[Span] = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start, stop in gaps:
+            while start < stop:
+                end = min(start + chunk_bytes, stop)
+                if end < stop:
+                    nl = mm.find(b"\n", end, stop)
+                    end = stop if nl < 0 else nl + 1
+                ranges.append((start, end))
+                start = end
+    return ranges
+
+
+def _parse_range(path: str, start: int, end: int, opts: ParseOptions) -> tuple[list[LogRow], int]:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", errors="replace")
+    return parse_lines(text.splitlines(), opts)
+
+
+def _run_range(
+    path: str,
+    start: int,
+    end: int,
+    opts: ParseOptions,
+    fn: Callable[[list[LogRow], int, Span], T],
+) -> T:
+    return fn(*_parse_range(path, start, end, opts), (start, end))
+
+
+def _chunk(rows: list[LogRow], bad: int, span: Span) -> tuple[list[LogRow], int]:
+    return rows, bad
+
+
+def process_file(
+    path: str,
+    opts: ParseOptions,
+    fn: Callable[[list[LogRow], int, Span], T],
+    *,
+    workers: int = 1,
+    chunk_bytes: int = 8 * 1024 * 1024,
+    skip: Sequence[Span] = (),
+    initializer: Callable[[], None] | None = None,
+) -> Iterator[T]:
+    """Parse `path` chunk by chunk and yield `fn(rows, unparsed_count, span)` per chunk, in
+    file order (`span` = the chunk's byte range; ranges in `skip` are not read).
+
+    With `workers > 1`, `fn` runs inside the pool processes (it must be picklable), so
+    heavy sinks such as a bulk insert scale with the parser instead of funnelling every
+    row back through the parent. At most `2 * workers` chunks are in flight.
+    """
+    ranges = split_ranges(path, chunk_bytes, skip)
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield _run_range(path, start, end, opts, fn)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer) as pool:
+        pending: deque[Future[T]] = deque()
+        for start, end in ranges:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_run_range, path, start, end, opts, fn))
+        while pending:
+            yield pending.popleft().result()
+
+
+def parse_file(
+    path: str,
+    opts: ParseOptions,
+    *,
+    workers: int = 1,
+    chunk_bytes: int = 8 * 1024 * 1024,
+) -> Iterator[tuple[list[LogRow], int]]:
+    """Yield `(rows, unparsed_count)` per chunk, in file order."""
+    return process_file(path, opts, _chunk, workers=workers, chunk_bytes=chunk_bytes)
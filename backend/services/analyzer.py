@@ -0,0 +1,183 @@
+"""Continuous rule evaluation with a durable per-rule watermark (`rule_watermarks`).
+
+Each rule is evaluated for windows ending on multiples of its step
+(`window_sec / ANALYZER_HOPS_PER_WINDOW`, at least one minute bucket), up to
+`now - ANALYZER_DELAY_SEC`. After downtime the missed window ends are replayed oldest first
+from the watermark, however old, at most `ANALYZER_MAX_CATCHUP` per rule per tick; only an
+explicit `lookback` skips windows older than `now - lookback`. A rule without a watermark
+starts at its latest due window.
+Matches go through `write_events`, so overlapping windows extend incidents instead of
+duplicating them. With a profiling engine the rolling per-rule timings are stored on the
+watermark rows as well. At most once per `_PARTITION_CHECK` a tick also creates the next
+`LOGS_PARTITIONS_AHEAD` `logs` partitions, so pruning keeps working without the retention cron.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.rules_config import RuleConfig, rules_config
+from backend.db.models import RuleWatermark
+from backend.db.partitions import is_partitioned, premake_partitions
+from backend.db.queries import aggregate_ip_stats
+from backend.services.anomaly_detector import RuleEngine, write_events
+
+log = logging.getLogger(__name__)
+
+# khóa advisory cố định cho "mini-siem analyzer" (chỉ một daemon chạy tại một thời điểm)
+ADVISORY_LOCK_KEY = 0x6D5349454D01
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# tạo partition logs sắp tới không cần mỗi tick; 1 giờ vẫn dư với interval "hour"
+_PARTITION_CHECK = timedelta(hours=1)
+
+
+def rule_step(rule_id: str) -> timedelta:
+    window_sec = rules_config.rule(rule_id, RuleConfig).window_sec or 300
+    step = max(60, window_sec // max(1, settings.ANALYZER_HOPS_PER_WINDOW))
+    return timedelta(seconds=step - step % 60)  # trùng biên bucket phút của ip_stats
+
+
+def align_up(ts: datetime, step: timedelta) -> datetime:
+    rem = (ts - _EPOCH) % step
+    return ts if not rem else ts + (step - rem)
+
+
+@dataclass
+class TickResult:
+    windows: int = 0
+    events: int = 0
+    skipped: int = 0  # window bị bỏ qua vì cũ hơn lookback (chỉ khi đặt lookback)
+    lag_sec: dict[str, int] = field(default_factory=dict)
+
+
+class Analyzer:
+    def __init__(self, engine: RuleEngine | None = None, lookback: timedelta | None = None):
+        self.engine = engine or RuleEngine()
+        self.lookback = lookback  # None = không giới hạn, bắt kịp từ watermark
+        self._partitions_at: datetime | None = None
+
+    def due_windows(
+        self, watermarks: dict[str, datetime], now: datetime
+    ) -> tuple[dict[datetime, list[str]], int]:
+        """Window ends to evaluate this tick, grouped by end; plus the number skipped."""
+        horizon = now - timedelta(seconds=settings.ANALYZER_DELAY_SEC)
+        floor = now - self.lookback if self.lookback is not None else None
+        due: dict[datetime, list[str]] = defaultdict(list)
+        skipped = 0
+        for rule in self.engine.rules:
+            step = rule_step(rule.rule_id)
+            last = watermarks.get(rule.rule_id)
+            nxt = align_up(floor if floor is not None else horizon - step, step)
+            if last is not None:
+                if floor is None or last + step >= floor:
+                    nxt = last + step
+                else:
+                    skipped += (nxt - last) // step - 1
+            for _ in range(max(1, settings.ANALYZER_MAX_CATCHUP)):
+                if nxt > horizon:
+                    break
+                due[nxt].append(rule.rule_id)
+                nxt += step
+        return dict(sorted(due.items())), skipped
+
+    def tick(self, db: Session, now: datetime | None = None) -> TickResult:
+        """Roll up new logs, evaluate due windows oldest first, commit after each window end."""
+        now = now or datetime.now(timezone.utc)
+        self._premake_partitions(db, now)
+        aggregate_ip_stats(db, now=now)
+        watermarks = dict(
+            db.execute(select(RuleWatermark.rule_id, RuleWatermark.last_end)).tuples().all()
+        )
+        due, skipped = self.due_windows(watermarks, now)
+        res = TickResult(skipped=skipped)
+        if skipped:
+            log.warning("analyzer: skipped %d windows older than lookback", skipped)
+        for end, rule_ids in due.items():
+            start = end - max(rule_step(rid) for rid in rule_ids)  # cho rule không có window_sec
+            matches = self.engine.evaluate(db, start, end, rule_ids=rule_ids)
+            res.events += write_events(db, matches, now=end)
+            res.windows += len(rule_ids)
+            for rid in rule_ids:
+                watermarks[rid] = end
+            self._save(db, {rid: end for rid in rule_ids}, now)
+            db.commit()  # tiến độ bắt kịp bền vững theo từng mốc end
+        res.lag_sec = {
+            r.rule_id: int((now - watermarks[r.rule_id]).total_seconds())
+            for r in self.engine.rules
+            if r.rule_id in watermarks
+        }
+        self._save(db, {rid: watermarks[rid] for rid in res.lag_sec}, now)
+        if self.engine.profiler is not None:
+            self._save_profile(db)
+        return res
+
+    def _premake_partitions(self, db: Session, now: datetime) -> None:
+        if self._partitions_at is not None and now - self._partitions_at < _PARTITION_CHECK:
+            return
+        self._partitions_at = now
+        conn = db.connection()
+        if not is_partitioned(conn):  # logs heap cũ chưa migrate_db
+            return
+        created = premake_partitions(conn, now)
+        db.commit()  # tạo partition khóa bảng cha: commit ngay, không giữ qua rollup
+        if created:
+            log.info("analyzer: created logs partitions %s", ", ".join(created))
+
+    @staticmethod
+    def _save(db: Session, ends: dict[str, datetime], now: datetime) -> None:
+        if not ends:
+            return
+        rows = [
+            {
+                "rule_id": rid,
+                "last_end": end,
+                "lag_sec": int((now - end).total_seconds()),
+                "updated_at": now,
+            }
+            for rid, end in ends.items()
+        ]
+        stmt = pg_insert(RuleWatermark).values(rows)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[RuleWatermark.rule_id],
+                set_={
+                    "last_end": func.greatest(RuleWatermark.last_end, stmt.excluded.last_end),
+                    "lag_sec": stmt.excluded.lag_sec,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+
+    def _save_profile(self, db: Session) -> None:
+        assert self.engine.profiler is not None
+        rows = [
+            {"rule_id": rid, "avg_wall_ms": s.wall_ms, "avg_db_ms": s.db_ms, "avg_rows": s.rows}
+            for rid, s in self.engine.profiler.stats.items()
+        ]
+        if rows:  # rule đã đo đều có watermark (_save ở trên); bulk UPDATE theo primary key
+            db.execute(update(RuleWatermark), rows)
+
+
+@contextmanager
+def single_instance(engine: Engine, key: int = ADVISORY_LOCK_KEY) -> Iterator[bool]:
+    """Hold a session-level advisory lock for the block; yield False if another holder exists."""
+    with engine.connect() as conn:
+        got = bool(conn.scalar(select(func.pg_try_advisory_lock(key))))
+        conn.commit()
+        try:
+            yield got
+        finally:
+            if got:
+                conn.execute(select(func.pg_advisory_unlock(key)))
+                conn.commit()
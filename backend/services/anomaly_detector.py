@@ -1,17 +1,65 @@
-"""Rule Engine — evaluates logs over a sliding window and writes events."""
+"""Rule Engine — evaluates logs over a sliding window and writes events.
+
+Count-threshold rules (R-001, R-002, R-004, R-005) sum per-minute `ip_stats` buckets over
+their own `window_sec`: minutes wholly inside the window come from the buckets and the
+partial minutes at either edge from raw `logs` (`split_window`). Signature rules (R-003)
+still scan raw `logs`. Bucket rules expose an `AggregatePlan`, and the engine merges
+plans sharing a GROUP BY key into one scan with per-rule `FILTER (WHERE ...)` aggregates
+(see `run_plans`). Distinct-count rules (R-006, R-007) merge the per-minute HyperLogLog
+sketches in `distinct_sketches`, plus the raw items of the edge minutes.
+"""
 
 from __future__ import annotations
 
+from collections.abc import Callable, Collection, Mapping, Sequence
 from dataclasses import dataclass
-from datetime import datetime
-from typing import Protocol
-
-from sqlalchemy import func, or_
-from sqlalchemy.orm import Session
-
-from backend.core.rules_config import rules_config
-from backend.db.models import Event, Log
-from backend.db.queries import aggregate_ip_stats
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import pairwise
+from typing import Any, Protocol
+
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    Subquery,
+    and_,
+    bindparam,
+    case,
+    false,
+    func,
+    or_,
+    select,
+    true,
+    union_all,
+)
+from sqlalchemy.orm import InstrumentedAttribute, Session
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.util import ClauseAdapter
+
+from backend.core.config import settings
+from backend.core.rules_config import (
+    AdminProbingConfig,
+    BruteForceConfig,
+    DDoSConfig,
+    DistributedBruteForceConfig,
+    EndpointScanConfig,
+    Http5xxConfig,
+    RuleConfig,
+    SQLiConfig,
+    rules_config,
+)
+from backend.core.signatures import pattern_version
+from backend.db.models import IPStat, Log
+from backend.db.queries import (
+    BucketWindow,
+    Span,
+    aggregate_ip_stats,
+    distinct_counts,
+    split_window,
+)
+from backend.services import heavy_hitters
+from backend.services.incidents import incident_cache
+from backend.services.rule_profiler import RuleProfiler
 
 
 @dataclass
@@ -32,63 +80,176 @@ class Rule(Protocol):
     def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]: ...
 
 
+def rule_window(rule_id: str, start: datetime, end: datetime) -> tuple[datetime, datetime]:
+    """[end - window_sec, end) from rules.yaml; the caller's window if the rule has none."""
+    window_sec = rules_config.rule(rule_id, RuleConfig).window_sec
+    if not window_sec:
+        return start, end
+    return end - timedelta(seconds=window_sec), end
+
+
+def _between(col: Any, spans: Sequence[Span]) -> ColumnElement[bool]:
+    return or_(false(), *(and_(col >= a, col < b) for a, b in spans))
+
+
+def _edge_source(windows: Sequence[BucketWindow]) -> Subquery:
+    """`ip_stats`-shaped rows: whole buckets, plus the partial edges aggregated from `logs`.
+
+    Edges are cut at every plan bound, so each edge row lies wholly inside or outside each
+    plan's window; column `raw` tells edge rows from buckets, so a minute that is an edge
+    for one rule and a whole bucket for another is never counted twice.
+    """
+    c = IPStat.__table__.c
+    buckets = select(
+        c.bucket_start,
+        c.ip,
+        c.endpoint,
+        c.req_count,
+        c.error_4xx,
+        c.error_5xx,
+        c.auth_fail,
+        c.not_found,
+        c.first_ts,
+        c.last_ts,
+        false().label("raw"),
+    ).where(_between(c.bucket_start, [(w.full_start, w.full_end) for w in windows]))
+
+    edges = [e for w in windows for e in w.edges]
+    cuts = sorted({t for e in edges for t in e})
+    segments = [(a, b) for a, b in pairwise(cuts) if any(x <= a and b <= y for x, y in edges)]
+    segment = case(*((Log.ts < b, i) for i, (_, b) in enumerate(segments)))
+    n = func.count()
+    raw = (
+        select(
+            func.min(Log.ts),
+            Log.ip,
+            Log.endpoint,
+            n,
+            n.filter(Log.status_code.between(400, 499)),
+            n.filter(Log.status_code >= 500),
+            n.filter(Log.status_code.in_([401, 403])),
+            n.filter(Log.status_code == 404),
+            func.min(Log.ts),
+            func.max(Log.ts),
+            true(),
+        )
+        .where(_between(Log.ts, segments))
+        .group_by(segment, Log.ip, Log.endpoint)
+    )
+    return union_all(buckets, raw).subquery("ip_stats_window")
+
+
+@dataclass
+class AggregatePlan:
+    """One rule's GROUP BY over `ip_stats`, in a form the engine can merge with others.
+
+    `aggregates` are un-filtered aggregate functions; the planner appends
+    `FILTER (WHERE <window> AND where)`. `having` receives the filtered aggregates by name.
+    """
+
+    rule_id: str
+    key: InstrumentedAttribute[Any]
+    start: datetime
+    end: datetime
+    where: ColumnElement[bool]
+    aggregates: dict[str, FunctionElement[Any]]
+    having: Callable[[Mapping[str, ColumnElement[Any]]], ColumnElement[bool]]
+    to_match: Callable[[Any, Mapping[str, Any]], RuleMatch]
+
+
+def _seen() -> dict[str, FunctionElement[Any]]:
+    return {"first_seen": func.min(IPStat.first_ts), "last_seen": func.max(IPStat.last_ts)}
+
+
+def run_plans(db: Session, plans: Sequence[AggregatePlan]) -> list[list[RuleMatch]]:
+    """Evaluate plans with one scan of `ip_stats` per distinct key; results in plan order.
+
+    Only buckets lying wholly inside a plan's [start, end) count for it; when a bound is not
+    on a minute, the partial edge minutes are read from raw `logs` (see `_edge_source`).
+    """
+    out: list[list[RuleMatch]] = [[] for _ in plans]
+    groups: dict[str, list[int]] = {}
+    for i, p in enumerate(plans):
+        groups.setdefault(p.key.key, []).append(i)
+
+    for idxs in groups.values():
+        windows = {i: split_window(plans[i].start, plans[i].end) for i in idxs}
+        bucket: Any
+        if any(w.edges for w in windows.values()):
+            src = _edge_source(list(windows.values()))
+            adapt: Callable[[Any], Any] = ClauseAdapter(src).traverse
+            bucket, raw = src.c.bucket_start, src.c.raw
+        else:  # mọi biên đều chẵn phút: quét thẳng ip_stats như trước
+            adapt, bucket, raw = (lambda e: e), IPStat.bucket_start, None
+        key = adapt(plans[idxs[0]].key.expression)
+        cols: list[Any] = [key.label("k")]
+        conds, hits = [], []
+        for i in idxs:
+            p, w = plans[i], windows[i]
+            in_window = _between(bucket, [(w.full_start, w.full_end)])
+            if raw is not None:
+                in_window = or_(and_(~raw, in_window), and_(raw, _between(bucket, w.edges)))
+            cond = and_(in_window, adapt(p.where))
+            aggs = {n: adapt(fn).filter(cond) for n, fn in p.aggregates.items()}
+            cols += [a.label(f"r{i}_{n}") for n, a in aggs.items()]
+            hit = p.having(aggs)
+            cols.append(hit.label(f"r{i}_hit"))
+            conds.append(cond)
+            hits.append(hit)
+        lo = min(w.full_start for w in windows.values())
+        hi = max(w.full_end for w in windows.values())
+        q = (
+            select(*cols)
+            .where(or_(*conds) if raw is not None else and_(bucket >= lo, bucket < hi, or_(*conds)))
+            .group_by(key)
+            .having(or_(*hits))
+        )
+        for row in db.execute(q).mappings():
+            for i in idxs:
+                if row[f"r{i}_hit"]:
+                    vals = {n: row[f"r{i}_{n}"] for n in plans[i].aggregates}
+                    out[i].append(plans[i].to_match(row["k"], vals))
+    return out
+
+
 class BruteForceRule:
     rule_id = "R-001"
 
-    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+    def plan(self, start: datetime, end: datetime) -> AggregatePlan:
         """Đếm số lần login thất bại (401/403) tới endpoint cấu hình theo IP trong window."""
-        cfg = rules_config.get(self.rule_id) or {}
-        min_failures = int(cfg.get("min_failures", 8))
-        login_endpoint = cfg.get("login_endpoint", "/login")
-        severity = int(cfg.get("severity", 4))
-
-        # SELECT ip, MIN(ts) AS first_seen, MAX(ts) AS last_seen, COUNT(*) AS cnt
-        # FROM logs
-        # WHERE ts >= start AND ts < end
-        #   AND endpoint = login_endpoint
-        #   AND status_code IN (401,403)
-        # GROUP BY ip
-        # HAVING COUNT(*) >= min_failures
-
-        q = (
-            db.query(
-                Log.ip.label("ip"),
-                func.min(Log.ts).label("first_seen"),
-                func.max(Log.ts).label("last_seen"),
-                func.count(Log.id).label("cnt"),
+        cfg = rules_config.rule(self.rule_id, BruteForceConfig)
+        min_failures, login_endpoint, severity = cfg.min_failures, cfg.login_endpoint, cfg.severity
+
+        # ≈ SELECT ip, MIN(first_ts), MAX(last_ts), SUM(auth_fail) FROM ip_stats
+        #   WHERE bucket in window AND endpoint = login_endpoint AND auth_fail > 0
+        #   GROUP BY ip HAVING SUM(auth_fail) >= min_failures
+        def to_match(ip: Any, v: Mapping[str, Any]) -> RuleMatch:
+            cnt = int(v["cnt"])
+            evidence = f"{cnt} failed logins to {login_endpoint} within {(end - start).total_seconds():.0f}s"
+            return RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=v["first_seen"],
+                last_seen=v["last_seen"],
+                ip=ip,
+                endpoint=login_endpoint,
+                count=cnt,
+                evidence=evidence,
             )
-            .filter(
-                Log.ts >= start,
-                Log.ts < end,
-                Log.endpoint == login_endpoint,
-                Log.status_code.in_([401, 403]),
-            )
-            .group_by(Log.ip)
-            .having(func.count(Log.id) >= min_failures)
+
+        return AggregatePlan(
+            rule_id=self.rule_id,
+            key=IPStat.ip,
+            start=start,
+            end=end,
+            where=and_(IPStat.endpoint == login_endpoint, IPStat.auth_fail > 0),
+            aggregates={"cnt": func.sum(IPStat.auth_fail), **_seen()},
+            having=lambda a: a["cnt"] >= min_failures,
+            to_match=to_match,
         )
 
-        matches: list[RuleMatch] = []
-        for row in q.all():
-            ip = row.ip
-            first_seen = row.first_seen
-            last_seen = row.last_seen
-            cnt = int(row.cnt)
-            evidence = (
-                f"{cnt} failed logins to {login_endpoint} within {(end-start).total_seconds():.0f}s"
-            )
-            matches.append(
-                RuleMatch(
-                    rule_id=self.rule_id,
-                    severity=severity,
-                    first_seen=first_seen,
-                    last_seen=last_seen,
-                    ip=ip,
-                    endpoint=login_endpoint,
-                    count=cnt,
-                    evidence=evidence,
-                )
-            )
-        return matches
+    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+        return run_plans(db, [self.plan(start, end)])[0]
 
 
 class SQLiSignatureRule:
@@ -97,48 +258,21 @@ class SQLiSignatureRule:
     def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
         """
         Dò các dấu hiệu SQLi trong window [start, end):
-          - So khớp pattern (case-insensitive) trên query_params và endpoint
+          - Dòng có signature đã được gắn lúc ingest (logs.sig_mask, xem core/signatures.py);
+            dòng chưa gắn hoặc gắn bằng bộ pattern khác (sig_version) được so khớp lại
           - (Optional) chỉ xét các endpoint trong danh sách cấu hình
           - Gom theo IP; nếu số hit >= min_hits_per_ip thì tạo 1 sự kiện
         """
-        cfg = rules_config.get(self.rule_id) or {}
-        severity = int(cfg.get("severity", 3))
-        min_hits = int(cfg.get("min_hits_per_ip", 3))
-        endpoints = cfg.get("endpoints") or []
-        patterns: list[str] = list(cfg.get("patterns", []))
+        cfg = rules_config.rule(self.rule_id, SQLiConfig)
+        severity = cfg.severity
+        patterns = cfg.patterns
 
         # Không có pattern thì không làm gì
         if not patterns:
             return []
 
-        # Xây dựng mệnh đề OR cho pattern (ILIKE)
-        like_clauses = []
-        for p in patterns:
-            # dùng ILIKE cho Postgres (case-insensitive)
-            like = f"%{p}%"
-            like_clauses.append(func.lower(Log.query_params).like(like.lower()))
-            like_clauses.append(func.lower(Log.endpoint).like(like.lower()))
-
-        q = (
-            db.query(
-                Log.ip.label("ip"),
-                func.min(Log.ts).label("first_seen"),
-                func.max(Log.ts).label("last_seen"),
-                func.count(Log.id).label("cnt"),
-            )
-            .filter(Log.ts >= start, Log.ts < end)
-            .filter(or_(*like_clauses))
-        )
-
-        # Nếu có whitelist endpoint, lọc thêm
-        if endpoints:
-            q = q.filter(Log.endpoint.in_(endpoints))
-
-        # Gom theo IP để đưa ra cảnh báo theo nguồn tấn công
-        q = q.group_by(Log.ip).having(func.count(Log.id) >= min_hits)
-
         matches: list[RuleMatch] = []
-        for row in q.all():
+        for row in db.execute(_sqli_query(cfg), {"start": start, "end": end}):
             ip = row.ip
             first_seen = row.first_seen
             last_seen = row.last_seen
@@ -160,103 +294,358 @@ class SQLiSignatureRule:
         return matches
 
 
+@lru_cache(maxsize=8)
+def _sqli_query(cfg: SQLiConfig) -> Select[Any]:
+    """Query template per config version; the window comes in as :start / :end.
+
+    Rows tagged with these patterns come from the partial index `ix_logs_sig_ts`. Rows never
+    tagged or tagged with another pattern set (an edit of rules.yaml, a backtest with tuned
+    rules) are matched again by substring, as the automaton does.
+    """
+    version = pattern_version(cfg.patterns)
+    where = [Log.ts >= bindparam("start"), Log.ts < bindparam("end")]
+    # Nếu có whitelist endpoint, lọc thêm
+    if cfg.endpoints:
+        where.append(Log.endpoint.in_(cfg.endpoints))
+    tagged = select(Log.ip, Log.ts, Log.id).where(
+        *where, Log.sig_mask != 0, Log.sig_version == version
+    )
+    # tách IS NULL / < / > để ix_logs_ts_sig_version loại dòng đã gắn đúng ngay trong index
+    stale = select(Log.ip, Log.ts, Log.id).where(
+        *where,
+        or_(Log.sig_version.is_(None), Log.sig_version < version, Log.sig_version > version),
+        or_(
+            false(),
+            *(
+                func.strpos(func.lower(col), p.lower()) > 0
+                for p in cfg.patterns
+                if p
+                for col in (Log.endpoint, Log.query_params)
+            ),
+        ),
+    )
+    hits = union_all(tagged, stale).subquery()
+    # Gom theo IP để đưa ra cảnh báo theo nguồn tấn công
+    return (
+        select(
+            hits.c.ip.label("ip"),
+            func.min(hits.c.ts).label("first_seen"),
+            func.max(hits.c.ts).label("last_seen"),
+            func.count(hits.c.id).label("cnt"),
+        )
+        .group_by(hits.c.ip)
+        .having(func.count(hits.c.id) >= cfg.min_hits_per_ip)
+    )
+
+
 class Http5xxSpikeRule:
     rule_id = "R-004"
 
+    def plan(self, start: datetime, end: datetime) -> AggregatePlan:
+        """Endpoint có tỉ lệ 5xx >= error_rate_threshold trong window (đủ min_requests)."""
+        cfg = rules_config.rule(self.rule_id, Http5xxConfig)
+        rate, min_requests, severity = cfg.error_rate_threshold, cfg.min_requests, cfg.severity
+
+        def to_match(endpoint: Any, v: Mapping[str, Any]) -> RuleMatch:
+            cnt, total = int(v["cnt"]), int(v["req"])
+            return RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=v["first_seen"],
+                last_seen=v["last_seen"],
+                ip=None,  # spike theo endpoint, không gắn với 1 IP
+                endpoint=endpoint,
+                count=cnt,
+                evidence=f"{cnt}/{total} responses were 5xx ({cnt / total:.0%})",
+            )
+
+        return AggregatePlan(
+            rule_id=self.rule_id,
+            key=IPStat.endpoint,
+            start=start,
+            end=end,
+            where=true(),
+            aggregates={
+                "cnt": func.sum(IPStat.error_5xx),
+                "req": func.sum(IPStat.req_count),
+                **_seen(),
+            },
+            having=lambda a: and_(
+                a["req"] >= min_requests, a["cnt"] > 0, a["cnt"] >= rate * a["req"]
+            ),
+            to_match=to_match,
+        )
+
     def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
-        # TODO: Step 2.4
-        return []
+        return run_plans(db, [self.plan(start, end)])[0]
 
 
 class AdminProbingRule:
     rule_id = "R-005"
 
+    def plan(self, start: datetime, end: datetime) -> AggregatePlan | None:
+        """IP nhận >= min_404s lỗi 404 trên các đường dẫn nhạy cảm (prefix) trong window."""
+        cfg = rules_config.rule(self.rule_id, AdminProbingConfig)
+        min_404s, severity = cfg.min_404s, cfg.severity
+        if not cfg.sensitive_paths:
+            return None
+
+        def to_match(ip: Any, v: Mapping[str, Any]) -> RuleMatch:
+            cnt = int(v["cnt"])
+            return RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=v["first_seen"],
+                last_seen=v["last_seen"],
+                ip=ip,
+                endpoint=None,
+                count=cnt,
+                evidence=f"{cnt} 404s across {v['paths']} sensitive paths",
+            )
+
+        return AggregatePlan(
+            rule_id=self.rule_id,
+            key=IPStat.ip,
+            start=start,
+            end=end,
+            where=_probe_filter(cfg.sensitive_paths),
+            aggregates={
+                "cnt": func.sum(IPStat.not_found),
+                "paths": func.count(IPStat.endpoint.distinct()),
+                **_seen(),
+            },
+            having=lambda a: a["cnt"] >= min_404s,
+            to_match=to_match,
+        )
+
+    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+        p = self.plan(start, end)
+        return run_plans(db, [p])[0] if p is not None else []
+
+
+@lru_cache(maxsize=8)
+def _probe_filter(paths: tuple[str, ...]) -> ColumnElement[bool]:
+    return and_(
+        IPStat.not_found > 0,
+        or_(*(IPStat.endpoint.startswith(p, autoescape=True) for p in paths)),
+    )
+
+
+class EndpointScanRule:
+    rule_id = "R-006"
+
+    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+        """IP chạm >= min_distinct_endpoints endpoint khác nhau trong window (ước lượng HLL)."""
+        cfg = rules_config.rule(self.rule_id, EndpointScanConfig)
+        min_distinct, severity = cfg.min_distinct_endpoints, cfg.severity
+
+        counts = distinct_counts(
+            db, "ip_endpoints", start, end, min_items=min_distinct, max_error=cfg.max_error
+        )
+        return [
+            RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=c.first_seen,
+                last_seen=c.last_seen,
+                ip=c.key,
+                endpoint=None,
+                count=c.estimate,
+                evidence=f"~{c.estimate} distinct endpoints (±{c.std_error:.1%})",
+            )
+            for c in counts
+            if c.estimate >= min_distinct
+        ]
+
+
+class DistributedBruteForceRule:
+    rule_id = "R-007"
+
     def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
-        # TODO: Step 2.5
-        return []
+        """Login endpoint nhận 401/403 từ >= min_distinct_ips IP khác nhau (ước lượng HLL)."""
+        cfg = rules_config.rule(self.rule_id, DistributedBruteForceConfig)
+        min_ips, severity = cfg.min_distinct_ips, cfg.severity
+
+        counts = distinct_counts(
+            db,
+            "endpoint_fail_ips",
+            start,
+            end,
+            min_items=min_ips,
+            max_error=cfg.max_error,
+            keys=[cfg.login_endpoint],
+        )
+        return [
+            RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=c.first_seen,
+                last_seen=c.last_seen,
+                ip=None,  # tấn công phân tán: gắn với endpoint, không với 1 IP
+                endpoint=c.key,
+                count=c.estimate,
+                evidence=f"failed logins from ~{c.estimate} distinct IPs (±{c.std_error:.1%})",
+            )
+            for c in counts
+            if c.estimate >= min_ips
+        ]
 
 
 class RuleEngine:
     """Coordinates windowing, aggregation, rule evaluation, and event writes."""
 
-    def __init__(self, rules: list[Rule] | None = None) -> None:
+    def __init__(
+        self,
+        rules: list[Rule] | None = None,
+        evaluator: str | None = None,
+        profiler: RuleProfiler | None = None,
+    ) -> None:
+        self.evaluator = evaluator or settings.RULE_EVALUATOR
+        self._run_plans = run_plans
+        if self.evaluator == "numpy":  # phụ thuộc tùy chọn, chỉ import khi được chọn
+            try:
+                from backend.services import vector_rules
+            except ImportError as e:
+                raise RuntimeError(
+                    "RULE_EVALUATOR=numpy requires numpy (pip install 'mini-siem[fast]')"
+                ) from e
+            self._run_plans = vector_rules.run_plans
         self.rules = rules or [
             BruteForceRule(),
             DDOSLightRule(),
             SQLiSignatureRule(),
             Http5xxSpikeRule(),
             AdminProbingRule(),
+            EndpointScanRule(),
+            DistributedBruteForceRule(),
         ]
-        rules_config.load()
+        self.profiler = profiler  # set → mỗi rule chạy riêng để đo (không gộp scan)
+        rules_config.load()  # nạp lại ngay khi tạo engine; sau đó chỉ reload khi file đổi
+
+    def evaluate(
+        self,
+        db: Session,
+        start: datetime,
+        end: datetime,
+        rule_ids: Collection[str] | None = None,
+    ) -> list[RuleMatch]:
+        """Run every rule (or only `rule_ids`) over its own window; mergeable rules share scans.
+
+        With a `profiler` attached every rule runs alone and is measured separately.
+        """
+        rules_config.reload_if_changed()  # rules.yaml đổi → version mới áp dụng từ window này
+        per_rule: list[list[RuleMatch]] = [[] for _ in self.rules]
+        plans: list[AggregatePlan] = []
+        slots: list[int] = []
+        for i, r in enumerate(self.rules):
+            if rule_ids is not None and r.rule_id not in rule_ids:
+                continue
+            r_start, r_end = rule_window(r.rule_id, start, end)
+            make_plan = getattr(r, "plan", None)
+            p = make_plan(r_start, r_end) if make_plan is not None else None
+            if self.profiler is not None:
+                with self.profiler.measure(db, r.rule_id, end) as rec:
+                    found = self._run_plans(db, [p])[0] if p else r.evaluate(db, r_start, r_end)
+                    rec.matches = len(found)
+                per_rule[i] = found
+                continue
+            if p is None:  # rule không gộp được (hoặc không có plan lần này) → query riêng
+                per_rule[i] = r.evaluate(db, r_start, r_end)
+                continue
+            plans.append(p)
+            slots.append(i)
+        for i, found in zip(slots, self._run_plans(db, plans)):
+            per_rule[i] = found
+        return [m for found in per_rule for m in found]
 
     def process_window(self, db: Session, start: datetime, end: datetime) -> int:
-        # 1) (Optional) rollup — để 0 trong Step 2 tối thiểu
-        aggregate_ip_stats(db, start, end)
+        # 1) rollup tăng dần các log mới vào ip_stats (rẻ nếu không có gì mới)
+        aggregate_ip_stats(db)
 
-        # 2) evaluate rules
-        matches: list[RuleMatch] = []
-        for r in self.rules:
-            matches.extend(r.evaluate(db, start, end))
-
-        # 3) persist events (MVP: insert mới; Step 4 sẽ merge/idempotent)
-        written = 0
-        for m in matches:
-            db.add(
-                Event(
-                    rule_id=m.rule_id,
-                    severity=m.severity,
-                    ip=m.ip,
-                    endpoint=m.endpoint,
-                    first_seen=m.first_seen,
-                    last_seen=m.last_seen,
-                    count=m.count,
-                    evidence=m.evidence,
-                    source="rules",
-                )
-            )
-            written += 1
-        return written
+        # 2) evaluate rules — mỗi rule dùng window_sec riêng, kết thúc tại `end`
+        matches = self.evaluate(db, start, end)
+
+        # 3) gộp vào incident đang mở (chạy lại cùng window không tạo event trùng)
+        return write_events(db, matches, now=end)
+
+
+def write_events(
+    db: Session, matches: Sequence[RuleMatch], source: str = "rules", now: datetime | None = None
+) -> int:
+    """Merge matches into open incidents (see services/incidents.py). Return incidents touched."""
+    return incident_cache.merge(db, matches, source=source, now=now)
 
 
 class DDOSLightRule:
     rule_id = "R-002"
 
-    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+    def plan(self, start: datetime, end: datetime) -> AggregatePlan | None:
         """Phát hiện IP có số lượng request vượt ngưỡng trong cửa sổ [start, end)."""
-        cfg = rules_config.get(self.rule_id) or {}
-        threshold = int(cfg.get("req_per_ip_threshold", 400))
-        focus_endpoint = cfg.get("endpoint")  # có thể None
-        severity = int(cfg.get("severity", 4))
-
-        q = db.query(
-            Log.ip.label("ip"),
-            func.min(Log.ts).label("first_seen"),
-            func.max(Log.ts).label("last_seen"),
-            func.count(Log.id).label("cnt"),
-        ).filter(Log.ts >= start, Log.ts < end)
-        if focus_endpoint:
-            q = q.filter(Log.endpoint == focus_endpoint)
-
-        q = q.group_by(Log.ip).having(func.count(Log.id) >= threshold)
-
-        matches: list[RuleMatch] = []
-        for row in q.all():
-            ip = row.ip
-            first_seen = row.first_seen
-            last_seen = row.last_seen
-            cnt = int(row.cnt)
+        cfg = rules_config.rule(self.rule_id, DDoSConfig)
+        if settings.HEAVY_HITTERS_ENABLED and not cfg.exact_check:
+            return None  # → evaluate(): chỉ đọc cận trên từ heavy_hitters
+        return self._plan(cfg, start, end, settings.HEAVY_HITTERS_ENABLED)
+
+    def _plan(
+        self, cfg: DDoSConfig, start: datetime, end: datetime, candidates_only: bool
+    ) -> AggregatePlan:
+        threshold, severity = cfg.req_per_ip_threshold, cfg.severity
+        focus_endpoint = cfg.endpoint  # có thể None
+        where = IPStat.endpoint == focus_endpoint if focus_endpoint else true()
+        if candidates_only:
+            # chỉ GROUP BY các IP có thể vượt ngưỡng theo snapshot heavy hitters; snapshot
+            # thiếu phút nào (chưa flush) hoặc floor cộng lại đã chạm ngưỡng → đếm đủ mọi IP
+            bounds = heavy_hitters.upper_bounds("ip", start, end, threshold).subquery()
+            covered = heavy_hitters.covers("ip", start, end, threshold)
+            where = and_(where, or_(~covered, IPStat.ip.in_(select(bounds.c.key))))
+
+        def to_match(ip: Any, v: Mapping[str, Any]) -> RuleMatch:
+            cnt = int(v["cnt"])
             ep = focus_endpoint or "<any>"
-            evidence = f"{cnt} requests in {(end-start).total_seconds():.0f}s to {ep}"
-            matches.append(
-                RuleMatch(
-                    rule_id=self.rule_id,
-                    severity=severity,
-                    first_seen=first_seen,
-                    last_seen=last_seen,
-                    ip=ip,
-                    endpoint=focus_endpoint,  # None nếu theo dõi all
-                    count=cnt,
-                    evidence=evidence,
-                )
+            evidence = f"{cnt} requests in {(end - start).total_seconds():.0f}s to {ep}"
+            return RuleMatch(
+                rule_id=self.rule_id,
+                severity=severity,
+                first_seen=v["first_seen"],
+                last_seen=v["last_seen"],
+                ip=ip,
+                endpoint=focus_endpoint,  # None nếu theo dõi all
+                count=cnt,
+                evidence=evidence,
             )
-        return matches
+
+        return AggregatePlan(
+            rule_id=self.rule_id,
+            key=IPStat.ip,
+            start=start,
+            end=end,
+            where=where,
+            aggregates={"cnt": func.sum(IPStat.req_count), **_seen()},
+            having=lambda a: a["cnt"] >= threshold,
+            to_match=to_match,
+        )
+
+    def evaluate(self, db: Session, start: datetime, end: datetime) -> list[RuleMatch]:
+        p = self.plan(start, end)
+        if p is not None:
+            return run_plans(db, [p])[0]
+        cfg = rules_config.rule(self.rule_id, DDoSConfig)
+        threshold = cfg.req_per_ip_threshold
+        if not db.scalar(select(heavy_hitters.covers("ip", start, end, threshold))):
+            return run_plans(db, [self._plan(cfg, start, end, False)])[0]
+        # heavy hitters không đếm lại: count là cận trên, mốc thời gian theo phút
+        q = heavy_hitters.upper_bounds("ip", start, end, threshold)
+        return [
+            RuleMatch(
+                rule_id=self.rule_id,
+                severity=cfg.severity,
+                first_seen=row.first_seen,
+                last_seen=row.last_seen,
+                ip=row.key,
+                endpoint=None,
+                count=int(row.upper),
+                evidence=f"<= {int(row.upper)} requests in {(end - start).total_seconds():.0f}s "
+                "(heavy-hitter upper bound)",
+            )
+            for row in db.execute(q)
+        ]
@@ -0,0 +1,99 @@
+"""Ingest de-duplication by explicit `Idempotency-Key`.
+
+Identical events are never dropped by content: a flood of the same request line is
+exactly what R-001/R-002 count. Only a batch retried with the same key is recognised.
+Memory is bounded by `IDEMPOTENCY_CACHE_SIZE` cached batch responses.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import orjson
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.models import IngestIdempotency
+
+
+class IdempotencyStore:
+    """`Idempotency-Key` → stored response. Bounded LRU in memory, table as fallback."""
+
+    def __init__(self, max_entries: int | None = None, ttl_sec: int | None = None) -> None:
+        self.max_entries = max_entries or settings.IDEMPOTENCY_CACHE_SIZE
+        self.ttl_sec = ttl_sec or settings.IDEMPOTENCY_TTL_SEC
+        self._cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_hash(api_key: str, key: str) -> str:
+        # gắn với API key để 2 client khác nhau không đụng key của nhau
+        return hashlib.sha256(f"{api_key}\x00{key}".encode()).hexdigest()
+
+    def _since(self) -> datetime:
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl_sec)
+
+    def lookup(self, db: Session, key_hash: str) -> dict[str, Any] | None:
+        """Response of the committed batch that owns `key_hash`, if any."""
+        now = time.time()
+        with self._lock:
+            hit = self._cache.get(key_hash)
+            if hit is not None and now - hit[0] < self.ttl_sec:
+                self._cache.move_to_end(key_hash)
+                return hit[1]
+        stored = db.scalar(
+            select(IngestIdempotency.response).where(
+                IngestIdempotency.key_hash == key_hash,
+                IngestIdempotency.created_at >= self._since(),
+            )
+        )
+        if stored is None:
+            return None
+        resp: dict[str, Any] = orjson.loads(stored)
+        self._remember(key_hash, resp)
+        return resp
+
+    def claim(self, db: Session, key_hash: str, response: dict[str, Any] | None = None) -> bool:
+        """Take the key in `db`'s transaction; False if another batch already owns it.
+
+        Check and insert are one statement: INSERT .. ON CONFLICT waits for a concurrent
+        transaction holding the same key, so two racing retries never both write rows.
+        An expired key is taken over. The key only sticks if the transaction commits.
+        """
+        stmt = pg_insert(IngestIdempotency).values(
+            key_hash=key_hash,
+            created_at=datetime.now(timezone.utc),
+            response=orjson.dumps(response or {}).decode(),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IngestIdempotency.key_hash],
+            set_={"created_at": stmt.excluded.created_at, "response": stmt.excluded.response},
+            where=IngestIdempotency.created_at < self._since(),
+        )
+        return db.scalar(stmt.returning(IngestIdempotency.key_hash)) is not None
+
+    def complete(self, db: Session, key_hash: str, response: dict[str, Any]) -> None:
+        """Attach the final response to a key claimed earlier in the same transaction."""
+        db.execute(
+            update(IngestIdempotency)
+            .where(IngestIdempotency.key_hash == key_hash)
+            .values(response=orjson.dumps(response).decode())
+        )
+        # không cache ở đây: transaction có thể còn rollback; lookup sau sẽ nạp từ DB
+
+    def _remember(self, h: str, response: dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[h] = (time.time(), response)
+            self._cache.move_to_end(h)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+
+idempotency_store = IdempotencyStore()
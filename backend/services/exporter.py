@@ -0,0 +1,137 @@
+"""Streaming bulk export of `logs` / `events` as NDJSON or CSV.
+
+`Export.chunks()` runs the query on its own session through a server-side cursor
+(`yield_per=EXPORT_BATCH_ROWS`) and yields one encoded chunk per batch, so memory is bounded
+by the batch size whatever the result size. `stream()` drives it from the event loop one
+batch at a time in the threadpool; when the client disconnects the response task is
+cancelled and `Export.cancel()` sends a Postgres cancel request for the running query.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import threading
+from collections.abc import AsyncIterator, Generator, Sequence
+from datetime import datetime
+from typing import Any
+
+import anyio
+import orjson
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Select
+from sqlalchemy.exc import DBAPIError
+
+from backend.core.config import settings
+from backend.db.database import session_scope
+
+log = logging.getLogger(__name__)
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+# ô text mở đầu bằng các ký tự này bị Excel / Sheets hiểu là công thức (CSV injection)
+_FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+
+
+def encode_ndjson(rows: Sequence[Any]) -> bytes:
+    # orjson tự serialize datetime (RFC 3339); mỗi batch một lần join
+    return b"".join(orjson.dumps(dict(r)) + b"\n" for r in rows)
+
+
+def _csv_cell(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, str) and v.startswith(_FORMULA_START):
+        return "'" + v  # log do client gửi: không để spreadsheet chạy như công thức
+    return v
+
+
+def encode_csv(rows: Sequence[Any], fields: Sequence[str], header: bool = False) -> bytes:
+    """CSV rows; text cells that a spreadsheet would evaluate get a leading `'`."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(fields)
+    for r in rows:
+        w.writerow(_csv_cell(r[f]) for f in fields)
+    return buf.getvalue().encode()
+
+
+class Export:
+    def __init__(self, stmt: Select[Any], fields: Sequence[str], fmt: str) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        self.stmt = stmt
+        self.fields = tuple(fields)
+        self.fmt = fmt
+        self.rows = 0
+        self._lock = threading.Lock()
+        self._dbapi_conn: Any = None  # chỉ set khi query đang chạy trên connection này
+        self._cancelled = False
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.fmt]
+
+    def chunks(self) -> Generator[bytes, None, None]:
+        """Encoded batches; the header row first for CSV."""
+        if self.fmt == "csv":
+            yield encode_csv([], self.fields, header=True)
+        with session_scope() as db:
+            conn = db.connection()
+            with self._lock:
+                if self._cancelled:
+                    return
+                self._dbapi_conn = conn.connection.dbapi_connection
+            try:
+                result = db.execute(
+                    self.stmt.execution_options(yield_per=settings.EXPORT_BATCH_ROWS)
+                ).mappings()
+                for batch in result.partitions(settings.EXPORT_BATCH_ROWS):
+                    if self._cancelled:
+                        return
+                    self.rows += len(batch)
+                    if self.fmt == "csv":
+                        yield encode_csv(batch, self.fields)
+                    else:
+                        yield encode_ndjson(batch)
+            except DBAPIError:
+                if not self._cancelled:
+                    raise
+                db.rollback()  # transaction đã hỏng vì QueryCanceled
+                log.info("export cancelled after %d rows", self.rows)  # QueryCanceled
+            finally:
+                with self._lock:  # sau đây connection về pool: không được cancel nhầm query khác
+                    self._dbapi_conn = None
+
+    def cancel(self) -> None:
+        """Stop the export; thread-safe. Cancels the query if one is running."""
+        with self._lock:
+            self._cancelled = True
+            if self._dbapi_conn is not None:
+                self._dbapi_conn.cancel()
+
+
+async def stream(export: Export) -> AsyncIterator[bytes]:
+    """Async body for StreamingResponse; cancels the export if the response is abandoned."""
+    it = export.chunks()
+    step = threading.Lock()  # next() và close() không được chạy chồng nhau
+
+    def _next() -> bytes | None:
+        with step:
+            return next(it, None)
+
+    def _close() -> None:
+        with step:
+            it.close()
+
+    done = False
+    try:
+        while (chunk := await run_in_threadpool(_next)) is not None:
+            yield chunk
+        done = True
+    finally:
+        if not done:
+            export.cancel()
+        with anyio.CancelScope(shield=True):  # task đã bị cancel vẫn phải trả connection
+            await run_in_threadpool(_close)
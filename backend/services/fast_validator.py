@@ -0,0 +1,151 @@
+"""Columnar batch validator producing row tuples ready for bulk insert.
+
+Checks one field at a time across the whole batch instead of building one
+`LogEvent` model per event. Common JSON types take a fast path; anything unusual
+is handed to a pydantic `TypeAdapter` of the same type, so accept/reject
+decisions stay identical to `LogEvent`.
+"""
+
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Sequence
+
+from pydantic import TypeAdapter
+
+from backend.db.bulk import LOG_COLUMNS, LogRow
+from backend.db.models import COMMON_SCHEMA_OPTIONAL, COMMON_SCHEMA_REQUIRED
+
+# Reason codes cho từng event bị loại
+NOT_OBJECT = "not_object"
+MISSING_FIELD = "missing_field"
+INVALID_TYPE = "invalid_type"
+INVALID_TS = "invalid_ts"
+INVALID_PAYLOAD = "invalid_payload"  # body không có dạng {"events": [...]}
+
+_INT_FIELDS = {"status_code", "resp_time_ms", "bytes_in", "bytes_out"}
+_REQUIRED = set(COMMON_SCHEMA_REQUIRED)
+# `raw` không thuộc common schema nhưng LogEvent vẫn nhận nó như optional
+_KNOWN = _REQUIRED | set(COMMON_SCHEMA_OPTIONAL) | {"raw"}
+if _KNOWN != set(LOG_COLUMNS):  # không dùng assert: `python -O` sẽ bỏ qua
+    raise RuntimeError("LOG_COLUMNS out of sync with COMMON_SCHEMA_*")
+
+_str_adapter: TypeAdapter[str] = TypeAdapter(str)
+_int_adapter: TypeAdapter[int] = TypeAdapter(int)
+_dt_adapter: TypeAdapter[datetime] = TypeAdapter(datetime)
+_fromiso = datetime.fromisoformat
+# dạng ISO mà fromisoformat và LogEvent parse giống hệt nhau; dạng khác (vd. khoảng trắng
+# trước offset, fromisoformat nhận nhưng LogEvent từ chối) luôn qua _dt_adapter
+_ISO_TS = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[Tt ]\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?(?:[Zz]|[+-]\d{2}:\d{2})?)?"
+)
+_ISO_TS_TZ = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?(?:Z|[+-]\d{2}:\d{2})")
+
+
+def _parse_ts(v: Any) -> datetime:
+    dt: datetime | None = None
+    if type(v) is str and _ISO_TS.fullmatch(v):
+        s = v[:-1] + "+00:00" if v[-1] in "Zz" else v
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            dt = None
+    if dt is None:
+        dt = v if isinstance(v, datetime) else _dt_adapter.validate_python(v)
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _fast_ts_column(col: list[Any]) -> bool:
+    """Parse a column of `...Z` / `...+HH:MM` ISO strings in place; False → use slow path."""
+    if set(map(type, col)) != {str}:
+        return False
+    if not all(map(_ISO_TS_TZ.fullmatch, col)):
+        return False
+    try:
+        parsed = [_fromiso(v[:-1] + "+00:00" if v[-1] == "Z" else v) for v in col]
+    except ValueError:
+        return False
+    col[:] = parsed
+    return True
+
+
+_ADAPTERS: dict[str, TypeAdapter[Any]] = {"str": _str_adapter, "int": _int_adapter}
+_SCHEMA: tuple[tuple[str, bool, str], ...] = tuple(
+    (name, name in _REQUIRED, "ts" if name == "ts" else "int" if name in _INT_FIELDS else "str")
+    for name in LOG_COLUMNS
+)
+
+
+@dataclass(frozen=True)
+class Reject:
+    index: int
+    reason: str
+    field: str | None = None
+
+
+@dataclass
+class ColumnarBatch:
+    rows: list[LogRow] = field(default_factory=list)
+    indexes: list[int] = field(default_factory=list)  # vị trí gốc của từng row
+    rejects: list[Reject] = field(default_factory=list)
+
+    def reject_counts(self) -> dict[str, int]:
+        return dict(Counter(r.reason for r in self.rejects))
+
+
+class FastValidator:
+    """Validate a list of raw event dicts column by column."""
+
+    def validate(self, events: Sequence[Any]) -> ColumnarBatch:
+        bad: dict[int, Reject] = {
+            i: Reject(i, NOT_OBJECT) for i, e in enumerate(events) if not isinstance(e, dict)
+        }
+        objs = [e if isinstance(e, dict) else {} for e in events] if bad else events
+        columns = [self._column(objs, name, req, kind, bad) for name, req, kind in _SCHEMA]
+
+        out = ColumnarBatch(rejects=sorted(bad.values(), key=lambda r: r.index))
+        if not bad:
+            out.rows = list(zip(*columns))
+            out.indexes = list(range(len(events)))
+            return out
+        for i, row in enumerate(zip(*columns)):
+            if i not in bad:
+                out.rows.append(row)
+                out.indexes.append(i)
+        return out
+
+    @staticmethod
+    def _column(
+        objs: Sequence[Any], name: str, required: bool, kind: str, bad: dict[int, Reject]
+    ) -> list[Any]:
+        """Extract + check one field for the whole batch; record the first failure per event."""
+        col = [e.get(name) for e in objs]
+        if kind == "ts":
+            if _fast_ts_column(col):
+                return col
+            slow: Sequence[int] = range(len(col))
+        else:
+            exact = str if kind == "str" else int
+            types = set(map(type, col))  # chạy ở tốc độ C; đa số batch dừng ở đây
+            if types == {exact} or (not required and types <= {exact, type(None)}):
+                return col
+            slow = [i for i, v in enumerate(col) if type(v) is not exact]
+        for i in slow:
+            v = col[i]
+            if v is None:
+                if required and i not in bad:
+                    reason = MISSING_FIELD if name not in objs[i] else INVALID_TYPE
+                    bad[i] = Reject(i, reason, name)
+                continue
+            try:
+                col[i] = _parse_ts(v) if kind == "ts" else _ADAPTERS[kind].validate_python(v)
+            except (TypeError, ValueError):
+                if i not in bad:
+                    bad[i] = Reject(i, INVALID_TS if kind == "ts" else INVALID_TYPE, name)
+        return col
+
+
+fast_validator = FastValidator()
@@ -0,0 +1,246 @@
+"""Per-minute heavy hitters (top IPs / endpoints by requests) tracked on the ingest path.
+
+`HeavyHitterTracker.observe` folds stored rows into one Space-Saving summary (with a
+Count-Min backstop, see core/topk.py) per (minute, kind), so memory is fixed by
+`HEAVY_HITTERS_TOP_K`, the sketch size and `HEAVY_HITTERS_RETAIN_MIN`, however many distinct
+IPs arrive. A background thread replaces this worker's snapshot of every changed minute in
+`heavy_hitters`; R-002 reads its candidate IPs from there (`upper_bounds`) when the
+snapshots cover its whole window (`covers`). Processes that ingest outside the API (the
+access-log CLI) flush their snapshot with every chunk they store.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    ScalarSelect,
+    Select,
+    Subquery,
+    and_,
+    delete,
+    func,
+    insert,
+    select,
+)
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.core.topk import CountMinSketch, SpaceSaving
+from backend.db.bulk import LOG_COLUMNS, LogRow
+from backend.db.database import session_scope
+from backend.db.models import HeavyHitter
+from backend.services.ingest_metrics import worker_id
+
+log = logging.getLogger(__name__)
+
+_TS, _IP, _EP = (LOG_COLUMNS.index(c) for c in ("ts", "ip", "endpoint"))
+KINDS = {"ip": _IP, "endpoint": _EP}
+
+
+def _summary() -> SpaceSaving:
+    return SpaceSaving(
+        settings.HEAVY_HITTERS_TOP_K,
+        CountMinSketch(settings.HEAVY_HITTERS_CM_WIDTH, settings.HEAVY_HITTERS_CM_DEPTH),
+    )
+
+
+@dataclass
+class _Minute:
+    summaries: dict[str, SpaceSaving] = field(
+        default_factory=lambda: {k: _summary() for k in KINDS}
+    )
+    dirty: bool = True
+
+
+class HeavyHitterTracker:
+    def __init__(
+        self, flush_interval_sec: float | None = None, clock: Callable[[], float] = time.time
+    ) -> None:
+        self._clock = clock
+        self.flush_interval = flush_interval_sec or settings.METRICS_FLUSH_INTERVAL_SEC
+        self._lock = threading.Lock()
+        self._minutes: dict[int, _Minute] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- hot path (memory only) ---
+    def observe(self, rows: Sequence[LogRow]) -> None:
+        """Count rows per (minute, ip) and (minute, endpoint); rows too old are ignored."""
+        oldest = int(self._clock() // 60) - settings.HEAVY_HITTERS_RETAIN_MIN
+        per_minute: dict[int, dict[str, Counter[str]]] = {}
+        for r in rows:
+            minute = int(r[_TS].timestamp()) // 60
+            if minute < oldest:
+                continue
+            counters = per_minute.get(minute)
+            if counters is None:
+                counters = per_minute[minute] = {k: Counter() for k in KINDS}
+            for kind, col in KINDS.items():
+                counters[kind][r[col]] += 1
+        with self._lock:
+            for minute, counters in per_minute.items():
+                m = self._minutes.get(minute)
+                if m is None:
+                    m = self._minutes[minute] = _Minute()
+                for kind, c in counters.items():
+                    m.summaries[kind].update(c.items())
+                m.dirty = True
+            for minute in [m for m in self._minutes if m < oldest]:
+                del self._minutes[minute]
+
+    def top(self, kind: str, minutes: int = 1, n: int = 10) -> list[tuple[str, int]]:
+        """Approximate top `n` keys over the last `minutes` minutes held by this worker."""
+        since = int(self._clock() // 60) - minutes + 1
+        totals: Counter[str] = Counter()
+        with self._lock:
+            for minute, m in self._minutes.items():
+                if minute >= since:
+                    totals.update(dict(m.summaries[kind].counts))
+        return totals.most_common(n)
+
+    # --- flush (background) ---
+    def flush(self, db: Session) -> int:
+        """Replace this worker's rows for every minute changed since the last flush."""
+        worker = worker_id()
+        with self._lock:
+            changed = {
+                minute: {kind: (s.top(), s.floor) for kind, s in m.summaries.items()}
+                for minute, m in self._minutes.items()
+                if m.dirty
+            }
+            for minute in changed:
+                self._minutes[minute].dirty = False
+        written = 0
+        for minute, kinds in sorted(changed.items()):
+            bucket = datetime.fromtimestamp(minute * 60, tz=timezone.utc)
+            db.execute(
+                delete(HeavyHitter).where(
+                    HeavyHitter.bucket_start == bucket, HeavyHitter.worker == worker
+                )
+            )
+            rows = [
+                {
+                    "bucket_start": bucket,
+                    "kind": kind,
+                    "worker": worker,
+                    "key": key,
+                    "count": count,
+                    "error": error,
+                    "floor": floor,
+                }
+                for kind, (top, floor) in kinds.items()
+                for key, count, error in top
+            ]
+            if rows:
+                db.execute(insert(HeavyHitter), rows)
+            written += len(rows)
+        return written
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="heavy-hitters", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(10)
+            self._thread = None
+        self._flush_safely()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._flush_safely()
+
+    def _flush_safely(self) -> None:
+        try:
+            with session_scope() as db:
+                self.flush(db)
+        except Exception:
+            log.exception("heavy hitters flush failed")
+
+
+def upper_bounds(kind: str, start: datetime, end: datetime, min_count: int) -> Select[Any]:
+    """(key, upper, first_seen, last_seen) for keys whose count over the minutes overlapping
+    [start, end) may reach `min_count`.
+
+    `upper` is the key's `count` in every (minute, worker) summary listing it plus that
+    summary's `floor` where it is not listed (= sum of all floors + sum(count - floor)).
+    Keys below the floor of every summary they occurred in are not returned.
+    """
+    hh = HeavyHitter
+    in_window = _in_window(kind, start, end)
+    summaries = _summaries(kind, start, end)
+    floors = select(func.coalesce(func.sum(summaries.c.floor), 0)).scalar_subquery()
+    upper = func.sum(hh.count - hh.floor) + floors
+    return (
+        select(
+            hh.key.label("key"),
+            upper.label("upper"),
+            func.min(hh.bucket_start).label("first_seen"),
+            (func.max(hh.bucket_start) + timedelta(minutes=1)).label("last_seen"),
+        )
+        .where(in_window)
+        .group_by(hh.key)
+        .having(upper >= min_count)
+    )
+
+
+def covers(kind: str, start: datetime, end: datetime, min_count: int) -> ScalarSelect[bool]:
+    """True when `upper_bounds` cannot miss a key reaching `min_count`: every minute
+    overlapping [start, end) has a snapshot and the floors sum to less than `min_count`.
+
+    A minute without snapshot (no traffic, or ingested by a process that has not flushed)
+    makes this False; callers then count exactly.
+    """
+    first = _first_minute(start)
+    minutes = math.ceil((end - first).total_seconds() / 60)
+    summaries = _summaries(kind, start, end)
+    return select(
+        and_(
+            func.count(summaries.c.bucket_start.distinct()) == minutes,
+            func.coalesce(func.sum(summaries.c.floor), 0) < min_count,
+        )
+    ).scalar_subquery()
+
+
+def _first_minute(start: datetime) -> datetime:
+    return start.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def _in_window(kind: str, start: datetime, end: datetime) -> ColumnElement[bool]:
+    hh = HeavyHitter
+    return and_(hh.kind == kind, hh.bucket_start >= _first_minute(start), hh.bucket_start < end)
+
+
+def _summaries(kind: str, start: datetime, end: datetime) -> Subquery:
+    """One row per (minute, worker) snapshot of `kind` overlapping [start, end), with its floor."""
+    hh = HeavyHitter
+    return (
+        select(hh.bucket_start, hh.worker, func.max(hh.floor).label("floor"))
+        .where(_in_window(kind, start, end))
+        .group_by(hh.bucket_start, hh.worker)
+        .subquery()
+    )
+
+
+def prune(db: Session, older_than: timedelta) -> int:
+    """Delete snapshots older than `older_than` (they only serve recent windows)."""
+    cutoff = datetime.now(timezone.utc) - older_than
+    res = db.execute(delete(HeavyHitter).where(HeavyHitter.bucket_start < cutoff))
+    return int(getattr(res, "rowcount", 0) or 0)
+
+
+heavy_hitters = HeavyHitterTracker()
@@ -0,0 +1,224 @@
+"""Merge rule matches into open incidents (`events` rows) instead of inserting near-duplicates.
+
+An incident is keyed by (rule_id, ip, endpoint). While it is open, a match whose `first_seen`
+is within `INCIDENT_IDLE_CLOSE_SEC` of the incident's `last_seen` extends it through one bulk
+`INSERT ... ON CONFLICT DO UPDATE` on the partial unique index `uq_events_open_incident`.
+Only the part of a match after the incident's `last_seen` is added to `count` (hits are
+assumed evenly spread over the match), so re-running an overlapping window adds nothing.
+Incidents idle for longer than that are closed (`is_open = false`) and a later match opens
+a new one. Open incidents are cached per process as key → `last_seen`, so stale ones are
+closed up front; the cache is only a hint and the SQL re-checks the gap itself.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+from sqlalchemy import Integer, and_, case, cast, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.models import Event
+
+if TYPE_CHECKING:
+    from backend.services.anomaly_detector import RuleMatch
+
+Key = tuple[str, str | None, str | None]
+
+
+def _key(m: RuleMatch) -> Key:
+    return (m.rule_id, m.ip, m.endpoint)
+
+
+def added_count(last_seen: datetime, m: RuleMatch) -> int:
+    """Hits of `m` not yet covered by an incident ending at `last_seen`."""
+    if m.last_seen <= last_seen:
+        return 0
+    if m.first_seen >= last_seen:
+        return m.count
+    span = (m.last_seen - m.first_seen).total_seconds()
+    return math.ceil(m.count * (m.last_seen - last_seen).total_seconds() / span)
+
+
+def _segments(matches: Iterable[RuleMatch], idle: timedelta) -> list[list[dict[str, Any]]]:
+    """Fold matches into incident rows; round i holds the i-th incident of every key."""
+    by_key: dict[Key, list[RuleMatch]] = defaultdict(list)
+    for m in matches:
+        by_key[_key(m)].append(m)
+    rounds: list[list[dict[str, Any]]] = []
+    for ms in by_key.values():
+        ms.sort(key=lambda m: m.first_seen)
+        segs: list[dict[str, Any]] = []
+        for m in ms:
+            cur = segs[-1] if segs else None
+            if cur is None or m.first_seen > cur["last_seen"] + idle:
+                segs.append(
+                    {
+                        "rule_id": m.rule_id,
+                        "severity": m.severity,
+                        "ip": m.ip,
+                        "endpoint": m.endpoint,
+                        "first_seen": m.first_seen,
+                        "last_seen": m.last_seen,
+                        "count": m.count,
+                        "evidence": m.evidence,
+                    }
+                )
+                continue
+            cur["count"] += added_count(cur["last_seen"], m)
+            cur["severity"] = max(cur["severity"], m.severity)
+            if m.last_seen >= cur["last_seen"]:
+                cur["last_seen"], cur["evidence"] = m.last_seen, m.evidence
+        for i, seg in enumerate(segs):
+            if len(rounds) <= i:
+                rounds.append([])
+            rounds[i].append(seg)
+    return rounds
+
+
+def fold(matches: Iterable[RuleMatch], idle: timedelta | None = None) -> list[dict[str, Any]]:
+    """Incident rows the matches would produce on an empty `events` table."""
+    idle = idle if idle is not None else timedelta(seconds=settings.INCIDENT_IDLE_CLOSE_SEC)
+    return [row for rows in _segments(matches, idle) for row in rows]
+
+
+def _key_filter(keys: Iterable[Key]) -> Any:
+    return or_(
+        *(
+            and_(
+                Event.rule_id == r,
+                Event.ip.is_not_distinct_from(ip),
+                Event.endpoint.is_not_distinct_from(ep),
+            )
+            for r, ip, ep in keys
+        )
+    )
+
+
+class IncidentCache:
+    def __init__(self) -> None:
+        self._open: dict[Key, datetime] | None = None
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._open = None
+
+    def merge(
+        self,
+        db: Session,
+        matches: Sequence[RuleMatch],
+        source: str = "rules",
+        now: datetime | None = None,
+    ) -> int:
+        """Create or extend one incident per (rule_id, ip, endpoint). Return incidents touched.
+
+        `now` is the data clock used to close idle incidents (default: newest `last_seen`).
+        """
+        if not matches:
+            return 0
+        idle = timedelta(seconds=settings.INCIDENT_IDLE_CLOSE_SEC)
+        known = self._snapshot(db)
+        touched = 0
+        for rows in _segments(matches, idle):
+            # incident cache biết đã quá hạn → đóng trước, khỏi phải đi vòng fallback
+            stale = [
+                (r["rule_id"], r["ip"], r["endpoint"])
+                for r in rows
+                if (last := known.get((r["rule_id"], r["ip"], r["endpoint"]))) is not None
+                and r["first_seen"] > last + idle
+            ]
+            if stale:
+                self._close(db, stale)
+            done = self._upsert(db, rows, source, idle)
+            missed = [r for r in rows if (r["rule_id"], r["ip"], r["endpoint"]) not in done]
+            if missed:  # incident mở trong DB đã quá hạn (cache không biết) → đóng rồi mở mới
+                self._close(db, [(r["rule_id"], r["ip"], r["endpoint"]) for r in missed])
+                done.update(self._upsert(db, missed, source, idle))
+            with self._lock:
+                if self._open is not None:
+                    self._open.update(done)
+            known.update(done)
+            touched += len(rows)
+        self.age_out(db, now or max(m.last_seen for m in matches))
+        return touched
+
+    def age_out(self, db: Session, now: datetime) -> int:
+        """Close incidents idle for longer than `INCIDENT_IDLE_CLOSE_SEC` at `now`."""
+        cutoff = now - timedelta(seconds=settings.INCIDENT_IDLE_CLOSE_SEC)
+        with self._lock:
+            if self._open is not None and all(v >= cutoff for v in self._open.values()):
+                return 0  # không có incident nào của process này quá hạn → khỏi UPDATE
+        res = db.execute(
+            update(Event)
+            .where(Event.is_open, Event.last_seen < cutoff)
+            .values(is_open=False)
+            .execution_options(synchronize_session=False)
+        )
+        with self._lock:
+            if self._open is not None:
+                self._open = {k: v for k, v in self._open.items() if v >= cutoff}
+        return int(getattr(res, "rowcount", 0) or 0)
+
+    # --- internals ---
+    def _snapshot(self, db: Session) -> dict[Key, datetime]:
+        with self._lock:
+            if self._open is not None:
+                return dict(self._open)
+        rows = db.execute(
+            select(Event.rule_id, Event.ip, Event.endpoint, Event.last_seen).where(Event.is_open)
+        ).all()
+        loaded = {(r, ip, ep): last for r, ip, ep, last in rows}
+        with self._lock:
+            self._open = loaded
+        return dict(loaded)
+
+    def _close(self, db: Session, keys: list[Key]) -> None:
+        db.execute(
+            update(Event)
+            .where(Event.is_open, _key_filter(keys))
+            .values(is_open=False)
+            .execution_options(synchronize_session=False)
+        )
+        with self._lock:
+            if self._open is not None:
+                for k in keys:
+                    self._open.pop(k, None)
+
+    @staticmethod
+    def _upsert(
+        db: Session, rows: list[dict[str, Any]], source: str, idle: timedelta
+    ) -> dict[Key, datetime]:
+        stmt = pg_insert(Event).values([{**r, "source": source, "is_open": True} for r in rows])
+        ex = stmt.excluded
+        cur = Event.__table__.c
+        # phần của match nằm sau last_seen hiện tại, giả định hit rải đều trong match
+        fresh = func.extract("epoch", ex.last_seen - cur.last_seen)
+        span = func.nullif(func.extract("epoch", ex.last_seen - ex.first_seen), 0)
+        added = case(
+            (ex.last_seen <= cur.last_seen, 0),
+            (ex.first_seen >= cur.last_seen, ex["count"]),
+            else_=cast(func.ceil(ex["count"] * fresh / span), Integer),
+        )
+        upsert = stmt.on_conflict_do_update(
+            index_elements=[cur.rule_id, cur.ip, cur.endpoint],
+            index_where=cur.is_open,
+            set_={
+                "first_seen": func.least(cur.first_seen, ex.first_seen),
+                "last_seen": func.greatest(cur.last_seen, ex.last_seen),
+                "count": cur["count"] + added,
+                "severity": func.greatest(cur.severity, ex.severity),
+                "evidence": case((ex.last_seen >= cur.last_seen, ex.evidence), else_=cur.evidence),
+            },
+            where=ex.first_seen <= cur.last_seen + idle,
+        ).returning(Event.rule_id, Event.ip, Event.endpoint, Event.last_seen)
+        return {(r, ip, ep): last for r, ip, ep, last in db.execute(upsert)}
+
+
+incident_cache = IncidentCache()
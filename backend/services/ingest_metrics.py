@@ -0,0 +1,254 @@
+"""In-process ingest metrics: per-minute counters + log-bucketed latency histograms.
+
+The request path only touches memory. A background thread upserts one
+`IngestMetric` row per (minute, worker) once the minute is over; the row keeps the raw
+histogram and sums, so a second flush of the same minute merges them before the
+percentiles are recomputed. A failed flush puts its minutes back for the next attempt.
+The same counts feed the Prometheus counters in `core/metrics.py`.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from backend.core import metrics
+from backend.core.config import settings
+from backend.db.database import session_scope
+from backend.db.models import IngestMetric
+
+log = logging.getLogger(__name__)
+
+# 2^5 sub-bucket mỗi bậc lũy thừa 2 → sai số tương đối tối đa ~3%
+_SUB_BITS = 5
+_SUB_COUNT = 1 << _SUB_BITS
+
+
+def _bucket_index(v: int) -> int:
+    if v < _SUB_COUNT:
+        return v
+    shift = v.bit_length() - _SUB_BITS
+    return (shift << (_SUB_BITS - 1)) + (v >> shift)
+
+
+def _bucket_bounds(idx: int) -> tuple[int, int]:
+    """Return [lo, hi) of the values that land in bucket `idx`."""
+    if idx < _SUB_COUNT:
+        return idx, idx + 1
+    shift = (idx >> (_SUB_BITS - 1)) - 1
+    lo = (idx - (shift << (_SUB_BITS - 1))) << shift
+    return lo, lo + (1 << shift)
+
+
+class LatencyHistogram:
+    """HDR-style histogram over integer microseconds with bounded relative error."""
+
+    def __init__(self) -> None:
+        self.counts: dict[int, int] = {}
+        self.total = 0
+        self.max_us = 0
+
+    def record(self, us: int) -> None:
+        us = max(0, us)
+        idx = _bucket_index(us)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.total += 1
+        self.max_us = max(self.max_us, us)
+
+    def merge(self, other: LatencyHistogram) -> None:
+        for idx, c in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + c
+        self.total += other.total
+        self.max_us = max(self.max_us, other.max_us)
+
+    def to_bytes(self) -> bytes:
+        return orjson.dumps({"max_us": self.max_us, "counts": sorted(self.counts.items())})
+
+    @classmethod
+    def from_bytes(cls, raw: bytes | None) -> LatencyHistogram:
+        h = cls()
+        if raw:  # dòng cũ (trước khi lưu histogram) không có → rỗng
+            data = orjson.loads(raw)
+            h.counts = {int(i): int(c) for i, c in data["counts"]}
+            h.total = sum(h.counts.values())
+            h.max_us = int(data["max_us"])
+        return h
+
+    def percentile(self, q: float) -> int:
+        """Value (µs) at quantile `q` in [0, 1]; bucket midpoint, capped at the observed max."""
+        if not self.total:
+            return 0
+        rank = max(1, int(q * self.total + 0.5))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                lo, hi = _bucket_bounds(idx)
+                return min((lo + hi - 1) // 2, self.max_us)
+        return self.max_us
+
+
+@dataclass
+class MinuteStats:
+    accepted: int = 0
+    dropped: int = 0
+    batches: int = 0
+    batch_events: int = 0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def merge(self, other: MinuteStats) -> None:
+        self.accepted += other.accepted
+        self.dropped += other.dropped
+        self.batches += other.batches
+        self.batch_events += other.batch_events
+        self.latency.merge(other.latency)
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class IngestMetricsRecorder:
+    def __init__(
+        self, flush_interval_sec: float | None = None, clock: Callable[[], float] = time.time
+    ) -> None:
+        self._clock = clock
+        self.flush_interval = flush_interval_sec or settings.METRICS_FLUSH_INTERVAL_SEC
+        self._lock = threading.Lock()
+        self._minutes: dict[int, MinuteStats] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # --- hot path (memory only) ---
+    def record(self, accepted: int, dropped: int, latency_ms: float, batch_size: int) -> None:
+        """Record one ingest request."""
+        minute = int(self._clock() // 60)
+        with self._lock:
+            st = self._minutes.get(minute)
+            if st is None:
+                st = self._minutes[minute] = MinuteStats()
+            st.accepted += accepted
+            st.dropped += dropped
+            st.batches += 1
+            st.batch_events += batch_size
+            st.latency.record(int(latency_ms * 1000))
+        metrics.record_ingest(accepted, dropped, batch_size)
+
+    def record_dropped(self, dropped: int) -> None:
+        """Count events refused before processing (rate limit, backpressure); no latency sample."""
+        minute = int(self._clock() // 60)
+        with self._lock:
+            st = self._minutes.setdefault(minute, MinuteStats())
+            st.dropped += dropped
+        metrics.record_ingest(0, dropped)
+
+    def snapshot(self) -> dict[int, MinuteStats]:
+        with self._lock:
+            return dict(self._minutes)
+
+    # --- flush (background) ---
+    def _take(self, include_current: bool) -> dict[int, MinuteStats]:
+        current = int(self._clock() // 60)
+        with self._lock:
+            done = {m: s for m, s in self._minutes.items() if include_current or m < current}
+            for m in done:
+                del self._minutes[m]
+        return done
+
+    def _restore(self, done: dict[int, MinuteStats]) -> None:
+        """Put minutes whose write failed back, merged with anything recorded since."""
+        with self._lock:
+            for minute, st in done.items():
+                cur = self._minutes.get(minute)
+                if cur is None:
+                    self._minutes[minute] = st
+                else:
+                    cur.merge(st)
+
+    def flush(self, db: Session, include_current: bool = False) -> int:
+        """Upsert one row per finished minute for this worker. Return rows written."""
+        done = self._take(include_current)
+        try:
+            self._write(db, done)
+        except Exception:
+            self._restore(done)
+            raise
+        return len(done)
+
+    @staticmethod
+    def _write(db: Session, done: dict[int, MinuteStats]) -> None:
+        worker = worker_id()
+        for minute, st in sorted(done.items()):
+            ts = datetime.fromtimestamp(minute * 60, tz=timezone.utc)
+            row = db.scalars(
+                select(IngestMetric)
+                .where(IngestMetric.ts_minute == ts, IngestMetric.worker == worker)
+                .with_for_update()
+            ).one_or_none()
+            total = MinuteStats()
+            if row is None:
+                row = IngestMetric(ts_minute=ts, worker=worker)
+                db.add(row)
+            else:
+                # cùng worker flush một phút 2 lần (vd. flush lúc shutdown): gộp histogram và
+                # tổng rồi mới tính lại percentile; `st` giữ nguyên để còn trả lại nếu lỗi
+                total.merge(
+                    MinuteStats(
+                        row.count_ok,
+                        row.count_dropped,
+                        row.batches,
+                        row.batch_events,
+                        LatencyHistogram.from_bytes(row.latency_hist),
+                    )
+                )
+            total.merge(st)
+            row.count_ok, row.count_dropped = total.accepted, total.dropped
+            row.batches, row.batch_events = total.batches, total.batch_events
+            row.avg_batch_size = total.batch_events // total.batches if total.batches else 0
+            row.ingest_latency_p50_ms = round(total.latency.percentile(0.50) / 1000)
+            row.ingest_latency_p95_ms = round(total.latency.percentile(0.95) / 1000)
+            row.ingest_latency_p99_ms = round(total.latency.percentile(0.99) / 1000)
+            row.latency_hist = total.latency.to_bytes()
+            db.flush()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(10)
+            self._thread = None
+        self._flush_safely(include_current=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self._flush_safely(include_current=False)
+
+    def _flush_safely(self, include_current: bool) -> None:
+        done = self._take(include_current)
+        if not done:
+            return
+        try:
+            with session_scope() as db:
+                self._write(db, done)
+        except Exception:
+            self._restore(done)  # commit cũng có thể lỗi: giữ lại cho lần flush sau
+            log.exception("ingest metrics flush failed; %d minutes kept for retry", len(done))
+
+
+ingest_metrics = IngestMetricsRecorder()
@@ -0,0 +1,229 @@
+"""Write-behind ingest pipeline: bounded in-process queue + background flusher thread.
+
+A failed flush is retried with exponential backoff (`INGEST_FLUSH_RETRIES` attempts)
+before the batch is given up and counted in `lost_events` (Prometheus
+`ingest_write_behind_lost_events_total`). While the flusher is failing, `submit` refuses
+new batches with `StoreUnavailable` so clients get a 503 instead of a 202 for data the
+server cannot write; the idle flusher probes the database with `SELECT 1` every
+`retry_after_sec()` and accepts batches again as soon as it answers.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.core import metrics
+from backend.core.config import settings
+from backend.db.bulk import LogRow
+from backend.db.database import session_scope
+from backend.services.dedup import idempotency_store
+from backend.services.log_ingestor import LogIngestor
+
+log = logging.getLogger(__name__)
+
+_MAX_BACKOFF_SEC = 30.0
+
+
+class QueueFull(Exception):
+    """Raised when the write-behind queue cannot take more batches (backpressure)."""
+
+    def __init__(self, retry_after_sec: int) -> None:
+        super().__init__("ingest queue is full")
+        self.retry_after_sec = retry_after_sec
+
+
+class StoreUnavailable(QueueFull):
+    """Raised by `submit` while flushes to the database are failing."""
+
+    def __init__(self, retry_after_sec: int) -> None:
+        super().__init__(retry_after_sec)
+        self.args = ("ingest store is unavailable",)
+
+
+@dataclass
+class _Pending:
+    rows: Sequence[LogRow]
+    enqueued_at: float
+    idempotency: tuple[str, dict[str, Any]] | None = None  # (key_hash, response)
+
+
+class IngestQueue:
+    """Merge many small /api/ingest requests into few large DB transactions.
+
+    A flush happens when the buffered events reach `flush_max_events` or when the
+    oldest buffered batch is older than `flush_max_age_ms`, whichever comes first.
+    Ingest metrics are recorded by the request itself, not by the flusher.
+    """
+
+    def __init__(
+        self,
+        max_batches: int | None = None,
+        flush_max_events: int | None = None,
+        flush_max_age_ms: int | None = None,
+        retries: int | None = None,
+        retry_backoff_ms: int | None = None,
+        session_factory: Callable[[], AbstractContextManager[Session]] = session_scope,
+    ) -> None:
+        self.max_batches = max_batches or settings.INGEST_QUEUE_MAX_BATCHES
+        self.flush_max_events = flush_max_events or settings.INGEST_FLUSH_MAX_EVENTS
+        self.flush_max_age = (flush_max_age_ms or settings.INGEST_FLUSH_MAX_AGE_MS) / 1000.0
+        self.retries = settings.INGEST_FLUSH_RETRIES if retries is None else retries
+        self.retry_backoff = (
+            settings.INGEST_FLUSH_RETRY_BACKOFF_MS if retry_backoff_ms is None else retry_backoff_ms
+        ) / 1000.0
+        self.lost_events = 0
+        self._failing = False
+        self._session_factory = session_factory
+        self._q: queue.Queue[_Pending | None] = queue.Queue(maxsize=self.max_batches)
+        self._thread: threading.Thread | None = None
+        self._svc = LogIngestor()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def retry_after_sec(self) -> int:
+        return max(1, math.ceil(self.flush_max_age))
+
+    @property
+    def failing(self) -> bool:
+        """True from a failed flush attempt until the next successful flush or probe."""
+        return self._failing
+
+    def submit(
+        self, rows: Sequence[LogRow], idempotency: tuple[str, dict[str, Any]] | None = None
+    ) -> None:
+        """Enqueue validated rows; raise `QueueFull` instead of blocking the request.
+
+        `idempotency` = (key_hash, response) is claimed in the transaction that writes the
+        rows; if another batch already owns the key, the rows are skipped.
+        """
+        if self._failing:
+            raise StoreUnavailable(self.retry_after_sec())
+        try:
+            self._q.put_nowait(_Pending(rows, time.monotonic(), idempotency))
+        except queue.Full:
+            raise QueueFull(self.retry_after_sec()) from None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Signal the flusher, let it drain everything already queued, then join."""
+        if not self.running:
+            return
+        self._q.put(None)  # sentinel; chờ nếu queue đang đầy thay vì bỏ dữ liệu
+        assert self._thread is not None
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.error("ingest flusher did not drain within %.1fs", timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                first = self._q.get(timeout=self.retry_after_sec() if self._failing else None)
+            except queue.Empty:
+                self._probe()
+                continue
+            if first is None:
+                break
+            buf = [first]
+            n_events = len(first.rows)
+            deadline = first.enqueued_at + self.flush_max_age
+            while n_events < self.flush_max_events:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                buf.append(item)
+                n_events += len(item.rows)
+            self._flush(buf)
+        # drain phần còn lại (nếu có) trước khi thoát
+        self._flush(list(self._drain()))
+
+    def _drain(self) -> Iterator[_Pending]:
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                yield item
+
+    def _probe(self) -> None:
+        """Clear `failing` once the database answers again (no batch needs to arrive)."""
+        try:
+            with self._session_factory() as db:
+                db.execute(text("SELECT 1"))
+        except Exception:
+            log.debug("ingest store still unavailable", exc_info=True)
+            return
+        log.info("ingest store is reachable again; accepting batches")
+        self._failing = False
+
+    def _flush(self, buf: list[_Pending]) -> None:
+        if not buf:
+            return
+        n_rows = sum(len(p.rows) for p in buf)
+        t0 = time.perf_counter_ns()
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                with self._session_factory() as db:
+                    rows = [
+                        r
+                        for p in buf
+                        if p.idempotency is None or idempotency_store.claim(db, *p.idempotency)
+                        for r in p.rows
+                    ]
+                    self._svc.save_rows(db, rows)
+                break
+            except Exception:
+                self._failing = True
+                if attempt == self.retries:
+                    log.exception(
+                        "write-behind flush failed %d times; %d events lost", attempt + 1, n_rows
+                    )
+                    self.lost_events += n_rows
+                    metrics.WRITE_BEHIND_LOST.inc(n_rows)
+                    return
+                log.warning(
+                    "write-behind flush failed (attempt %d), retrying in %.1fs",
+                    attempt + 1,
+                    delay,
+                    exc_info=True,
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, _MAX_BACKOFF_SEC)
+        self._failing = False
+        log.debug(
+            "flushed %d events from %d requests in %.1fms",
+            n_rows,
+            len(buf),
+            (time.perf_counter_ns() - t0) / 1e6,
+        )
+
+
+ingest_queue = IngestQueue()
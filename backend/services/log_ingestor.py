@@ -1,12 +1,25 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Sequence, Tuple
 
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
-from backend.db.models import IngestMetric, Log
+from backend.core.config import settings
+from backend.core.signatures import sqli_matcher
+from backend.db.bulk import LOG_COLUMNS, STORED_LOG_COLUMNS, LogRow, write_log_rows
+from backend.services.anomaly_detector import write_events
+from backend.services.fast_validator import (
+    INVALID_PAYLOAD,
+    ColumnarBatch,
+    Reject,
+    fast_validator,
+)
+from backend.services.heavy_hitters import heavy_hitters
+from backend.services.stream_detector import stream_engine
+
+_EP, _QS = LOG_COLUMNS.index("endpoint"), LOG_COLUMNS.index("query_params")
 
 
 # Pydantic schema for strict validation
@@ -36,7 +49,15 @@ class IngestPayload(BaseModel):
     events: List[LogEvent] = Field(default_factory=list)
 
 
+def event_to_row(e: LogEvent) -> LogRow:
+    """Flatten a validated event into a tuple ordered like `LOG_COLUMNS`."""
+    return tuple(getattr(e, c) for c in LOG_COLUMNS)
+
+
 class LogIngestor:
+    def __init__(self, write_mode: str | None = None) -> None:
+        self.write_mode = write_mode or settings.INGEST_WRITE_MODE
+
     def validate_batch(
         self, payload: Dict[str, Any]
     ) -> Tuple[List[LogEvent], List[Dict[str, Any]]]:
@@ -59,47 +80,27 @@ class LogIngestor:
                 rejected.append(e.model_dump())
         return accepted, rejected
 
+    def validate_rows(self, payload: Any) -> ColumnarBatch:
+        """Fast path: validate each event independently, return rows ready for `save_rows`."""
+        events = payload.get("events", []) if isinstance(payload, dict) else None
+        if not isinstance(events, list):
+            return ColumnarBatch(rejects=[Reject(0, INVALID_PAYLOAD)])
+        return fast_validator.validate(events)
+
     def save_batch(self, db: Session, rows: List[LogEvent]) -> int:
         """Persist validated events into DB. Returns number inserted."""
+        return self.save_rows(db, [event_to_row(e) for e in rows])
+
+    def save_rows(self, db: Session, rows: Sequence[LogRow]) -> int:
+        """Persist row tuples (ordered like `LOG_COLUMNS`) with the configured write mode."""
         if not rows:
             return 0
-        db.add_all(
-            [
-                Log(
-                    ts=e.ts,
-                    source=e.source,
-                    host=e.host,
-                    ip=e.ip,
-                    endpoint=e.endpoint,
-                    method=e.method,
-                    status_code=e.status_code,
-                    resp_time_ms=e.resp_time_ms,
-                    ua=e.ua,
-                    action_type=e.action_type,
-                    user_id=e.user_id,
-                    session_id=e.session_id,
-                    bytes_in=e.bytes_in,
-                    bytes_out=e.bytes_out,
-                    referrer=e.referrer,
-                    query_params=e.query_params,
-                    error=e.error,
-                    raw=e.raw,
-                )
-                for e in rows
-            ]
-        )
-        return len(rows)
-
-    def update_metrics(
-        self, db: Session, accepted: int, dropped: int, p95_ms: int, batch_size: int
-    ) -> None:
-        now_minute = datetime.now(timezone.utc).replace(second=0, microsecond=0)
-        db.add(
-            IngestMetric(
-                ts_minute=now_minute,
-                count_ok=accepted,
-                count_dropped=dropped,
-                avg_batch_size=batch_size,
-                ingest_latency_p95_ms=p95_ms,
-            )
-        )
+        sig = sqli_matcher()  # một automaton cho cả batch
+        stored = [r + (sig.mask(r[_EP], r[_QS]), sig.version) for r in rows]
+        n = write_log_rows(db, stored, self.write_mode, STORED_LOG_COLUMNS)
+        if settings.HEAVY_HITTERS_ENABLED:
+            heavy_hitters.observe(rows)  # chỉ RAM; thread nền ghi snapshot
+        if settings.STREAM_RULES_ENABLED:
+            # cảnh báo ngay khi vượt ngưỡng; Event đi chung transaction với batch log
+            write_events(db, stream_engine.observe(rows), source="stream")
+        return n
@@ -0,0 +1,123 @@
+"""Incremental NDJSON decoding (optionally gzip) for the streaming ingest endpoint."""
+
+from __future__ import annotations
+
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator, Iterator
+from typing import Any
+
+import orjson
+
+# Giới hạn đầu ra mỗi lần giải nén để bộ nhớ không phình theo tỉ lệ nén
+_INFLATE_STEP = 64 * 1024
+
+
+class LineTooLong(Exception):
+    pass
+
+
+class InvalidLine:
+    """Marker yielded in place of a parsed object when a line cannot be decoded."""
+
+    __slots__ = ("reason",)
+
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+
+
+class LineSplitter:
+    """Split a byte stream into lines without ever holding more than one partial line."""
+
+    def __init__(self, max_line_bytes: int) -> None:
+        self.max_line_bytes = max_line_bytes
+        self._tail = b""
+        self._skipping = False  # đang bỏ qua phần còn lại của một dòng quá dài
+
+    def feed(self, data: bytes) -> Iterator[bytes | LineTooLong]:
+        start = 0
+        while True:
+            nl = data.find(b"\n", start)
+            if nl < 0:
+                break
+            piece = data[start:nl]
+            start = nl + 1
+            if self._skipping:
+                self._skipping = False
+                continue
+            line = self._tail + piece if self._tail else piece
+            self._tail = b""
+            yield LineTooLong() if len(line) > self.max_line_bytes else line
+        if self._skipping:
+            return
+        rest = data[start:]
+        if len(self._tail) + len(rest) > self.max_line_bytes:
+            self._tail = b""
+            self._skipping = True
+            yield LineTooLong()
+        else:
+            self._tail += rest
+
+    def close(self) -> Iterator[bytes]:
+        if self._tail and not self._skipping:
+            yield self._tail
+        self._tail = b""
+
+
+async def _inflate(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """Gunzip a stream of one or more concatenated gzip members (RFC 1952 §2.2).
+
+    Raises `zlib.error` if the input ends inside a member (truncated upload).
+    """
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip wrapper
+    pending = False  # đã nhận byte của member hiện tại mà chưa tới trailer
+    async for chunk in chunks:
+        data = chunk
+        while data:
+            if d.eof:
+                # member mới bắt đầu ngay sau trailer của member trước
+                d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            pending = True
+            out = d.decompress(data, _INFLATE_STEP)
+            if out:
+                yield out
+            if d.eof:
+                pending = False
+                data = d.unused_data
+            else:
+                data = d.unconsumed_tail
+    tail = d.flush()
+    if tail:
+        yield tail
+    if pending:
+        raise zlib.error("truncated gzip stream")
+
+
+async def iter_ndjson(
+    chunks: AsyncIterable[bytes], *, gzip: bool, max_line_bytes: int
+) -> AsyncIterator[tuple[int, Any]]:
+    """Yield `(line_no, obj)` for each non-blank line; `obj` is `InvalidLine` on failure.
+
+    Raises `zlib.error` if the gzip stream is corrupt or truncated.
+    """
+    source = _inflate(chunks) if gzip else chunks
+    splitter = LineSplitter(max_line_bytes)
+    line_no = 0
+
+    def _decode(line: bytes | LineTooLong) -> Any:
+        if isinstance(line, LineTooLong):
+            return InvalidLine("line_too_long")
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            return InvalidLine("invalid_json")
+
+    async for data in source:
+        for line in splitter.feed(data):
+            line_no += 1
+            if isinstance(line, bytes) and not line.strip():
+                continue
+            yield line_no, _decode(line)
+    for line in splitter.close():
+        line_no += 1
+        if line.strip():
+            yield line_no, _decode(line)
@@ -0,0 +1,133 @@
+"""Per-API-key token buckets (measured in events) for ingest admission control."""
+
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+from sqlalchemy import text
+
+from backend.core.config import settings
+from backend.db.database import session_scope
+
+
+@dataclass(frozen=True)
+class RateDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_sec: int  # số giây tới khi bucket đầy lại
+    retry_after_sec: int = 0
+
+    def headers(self) -> dict[str, str]:
+        h = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset_sec),
+        }
+        if not self.allowed:
+            h["Retry-After"] = str(self.retry_after_sec)
+        return h
+
+
+class BucketStore(Protocol):
+    def take(self, key: str, cost: int, rate_per_sec: float, capacity: int) -> tuple[bool, float]:
+        """Refill, then subtract `cost` if enough tokens. Return (allowed, tokens_left)."""
+        ...
+
+
+class MemoryBucketStore:
+    """In-process buckets without a global lock.
+
+    Each bucket is a small list mutated in place; dict get/setdefault are atomic under
+    the GIL, so concurrent requests never block each other. Two threads racing on the
+    same key can at worst both see the pre-update balance (a one-request over-admit).
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._buckets: dict[str, list[float]] = {}
+
+    def take(self, key: str, cost: int, rate_per_sec: float, capacity: int) -> tuple[bool, float]:
+        now = self._clock()
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets.setdefault(key, [float(capacity), now])
+        tokens = min(float(capacity), b[0] + (now - b[1]) * rate_per_sec)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        b[0], b[1] = tokens, now
+        return allowed, tokens
+
+
+_DB_TAKE = text(
+    """
+    INSERT INTO rate_limit_buckets AS b (key_hash, tokens, allowed, updated_at)
+    VALUES (:key, :capacity - :cost, true, clock_timestamp())
+    ON CONFLICT (key_hash) DO UPDATE SET
+        allowed = LEAST(:capacity, b.tokens
+            + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) >= :cost,
+        tokens = LEAST(:capacity, b.tokens
+            + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate)
+            - CASE WHEN LEAST(:capacity, b.tokens
+                + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate) >= :cost
+              THEN :cost ELSE 0 END,
+        updated_at = clock_timestamp()
+    RETURNING allowed, tokens
+    """
+)
+
+
+class DbBucketStore:
+    """Buckets shared by every worker, updated by one atomic upsert per admission check."""
+
+    def take(self, key: str, cost: int, rate_per_sec: float, capacity: int) -> tuple[bool, float]:
+        with session_scope() as db:
+            row = db.execute(
+                _DB_TAKE,
+                {
+                    "key": hashlib.sha256(key.encode()).hexdigest(),
+                    "cost": cost,
+                    "capacity": capacity,
+                    "rate": rate_per_sec,
+                },
+            ).one()
+        return bool(row.allowed), float(row.tokens)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        per_min: int | None = None,
+        burst: int | None = None,
+        store: BucketStore | None = None,
+    ) -> None:
+        self.per_min = settings.RATE_LIMIT_PER_MIN if per_min is None else per_min
+        self.capacity = burst or settings.RATE_LIMIT_BURST or self.per_min
+        self.rate_per_sec = self.per_min / 60.0
+        if store is None:
+            store = DbBucketStore() if settings.RATE_LIMIT_STORE == "db" else MemoryBucketStore()
+        self.store = store
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_min > 0
+
+    def check(self, key: str, cost: int) -> RateDecision:
+        """Charge `cost` events to `key`'s bucket.
+
+        A batch bigger than the bucket is charged at full capacity: it only passes when the
+        bucket is full and then empties it, instead of being rejected forever.
+        """
+        cost = min(cost, self.capacity)
+        allowed, tokens = self.store.take(key, cost, self.rate_per_sec, self.capacity)
+        reset = math.ceil((self.capacity - tokens) / self.rate_per_sec)
+        retry = 0 if allowed else max(1, math.ceil((cost - tokens) / self.rate_per_sec))
+        return RateDecision(allowed, self.capacity, int(tokens), reset, retry)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,133 @@
+"""Per-rule profiling for `RuleEngine` (wall time, DB time, rows, matches, EXPLAIN).
+
+With a profiler attached, `RuleEngine.evaluate` runs every rule on its own (no merged
+`ip_stats` scans, so each rule's cost is its own) inside `RuleProfiler.measure`, which
+times the cursor executions of the session's connection. With `explain=True` every
+SELECT is re-run as `EXPLAIN (ANALYZE, BUFFERS)` on a separate cursor after it finished;
+that doubles the DB work and is excluded from `db_ms`. Rolling per-rule averages
+(`RollingStats`, EWMA) are what the analyzer stores in `rule_watermarks`.
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+@dataclass
+class RuleProfile:
+    rule_id: str
+    window_end: datetime
+    wall_ms: float = 0.0
+    db_ms: float = 0.0
+    queries: int = 0
+    rows: int = 0
+    matches: int = 0
+    explain: list[str] = field(default_factory=list)
+
+
+@dataclass
+class RollingStats:
+    """Exponentially weighted averages over the windows profiled so far."""
+
+    windows: int = 0
+    wall_ms: float = 0.0
+    db_ms: float = 0.0
+    rows: float = 0.0
+
+    def add(self, p: RuleProfile, alpha: float) -> None:
+        a = 1.0 if not self.windows else alpha
+        self.windows += 1
+        self.wall_ms += a * (p.wall_ms - self.wall_ms)
+        self.db_ms += a * (p.db_ms - self.db_ms)
+        self.rows += a * (p.rows - self.rows)
+
+
+class RuleProfiler:
+    def __init__(self, explain: bool = False, alpha: float = 0.2) -> None:
+        self.explain = explain
+        self.alpha = alpha
+        self.records: list[RuleProfile] = []
+        self.stats: dict[str, RollingStats] = {}
+
+    @contextmanager
+    def measure(self, db: Session, rule_id: str, window_end: datetime) -> Iterator[RuleProfile]:
+        """Profile the block; queries of `db`'s connection are attributed to `rule_id`."""
+        rec = RuleProfile(rule_id, window_end)
+        conn = db.connection()
+        started: list[float] = []
+
+        def before(*_: Any) -> None:
+            started.append(time.perf_counter())
+
+        def after(conn: Any, cursor: Any, statement: str, params: Any, *_: Any) -> None:
+            rec.db_ms += (time.perf_counter() - started.pop()) * 1000
+            rec.queries += 1
+            rec.rows += max(cursor.rowcount or 0, 0)
+            if self.explain and statement.lstrip()[:6].upper() in ("SELECT", "WITH"):
+                rec.explain.append(_explain(conn, statement, params))
+
+        event.listen(conn, "before_cursor_execute", before)
+        event.listen(conn, "after_cursor_execute", after)
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        finally:
+            rec.wall_ms = (time.perf_counter() - t0) * 1000
+            event.remove(conn, "before_cursor_execute", before)
+            event.remove(conn, "after_cursor_execute", after)
+            self.records.append(rec)
+            self.stats.setdefault(rule_id, RollingStats()).add(rec, self.alpha)
+
+    def take(self) -> list[RuleProfile]:
+        """Records since the last call (the rolling stats keep everything)."""
+        out, self.records = self.records, []
+        return out
+
+
+def _explain(conn: Any, statement: str, params: Any) -> str:
+    # cursor DBAPI riêng: không đi qua event của SQLAlchemy, không đụng kết quả query gốc
+    cur = conn.connection.dbapi_connection.cursor()
+    try:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement, params)
+        return "\n".join(r[0] for r in cur.fetchall())
+    finally:
+        cur.close()
+
+
+def report_json(records: list[RuleProfile]) -> list[dict[str, Any]]:
+    return [{**asdict(r), "window_end": r.window_end.isoformat()} for r in records]
+
+
+def report_table(records: list[RuleProfile]) -> str:
+    """One line per rule: windows, wall/DB time (total, max), rows and matches."""
+    per_rule: dict[str, list[RuleProfile]] = {}
+    for r in records:
+        per_rule.setdefault(r.rule_id, []).append(r)
+    head = ("rule", "windows", "wall_ms", "max_ms", "db_ms", "queries", "rows", "matches")
+    lines = [head]
+    for rid, rs in sorted(per_rule.items(), key=lambda kv: -sum(r.wall_ms for r in kv[1])):
+        lines.append(
+            (
+                rid,
+                str(len(rs)),
+                f"{sum(r.wall_ms for r in rs):.1f}",
+                f"{max(r.wall_ms for r in rs):.1f}",
+                f"{sum(r.db_ms for r in rs):.1f}",
+                str(sum(r.queries for r in rs)),
+                str(sum(r.rows for r in rs)),
+                str(sum(r.matches for r in rs)),
+            )
+        )
+    widths = [max(len(row[i]) for row in lines) for i in range(len(head))]
+    return "\n".join(
+        "  ".join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths)))
+        for row in lines
+    )
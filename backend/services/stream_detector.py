@@ -0,0 +1,329 @@
+"""Streaming evaluation of the count-threshold rules, fed from the ingest path.
+
+State is kept per (rule, key) as one-second buckets, so the oldest edge of a window is cut
+at second resolution instead of pulling in a whole minute of older traffic.
+`StreamingRuleEngine.matches(now)` returns what `RuleEngine.evaluate` would find for a
+window ending at a whole-second `now`; `observe` counts the window that ends with the
+second of the newest row (`RuleEngine.evaluate` with `end` = that second + 1s). A match
+is emitted the moment a key crosses its threshold and re-arms once the key drops below
+it again. Keys with no bucket inside the window are evicted, and at most
+`STREAM_MAX_KEYS` keys per rule are kept (least recently seen first).
+The stream clock is the newest `ts` seen, but rows more than `STREAM_MAX_CLOCK_SKEW_SEC`
+ahead of the wall clock are skipped (counted in `future_rows`): one bad timestamp would
+otherwise move the clock ahead and push every current row out of the window.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import Counter, OrderedDict, deque
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from backend.core.config import settings
+from backend.core.rules_config import (
+    AdminProbingConfig,
+    BruteForceConfig,
+    DDoSConfig,
+    Http5xxConfig,
+    rules_config,
+)
+from backend.db.bulk import LOG_COLUMNS, LogRow
+from backend.services.anomaly_detector import RuleMatch
+
+_TS, _IP, _EP, _STATUS = (LOG_COLUMNS.index(c) for c in ("ts", "ip", "endpoint", "status_code"))
+
+
+@dataclass
+class StreamRule:
+    """A threshold rule over per-key counters: `counts(row)` increments, `check(sums)` fires."""
+
+    rule_id: str
+    severity: int
+    window_sec: int
+    key: Callable[[LogRow], str | None]  # None = dòng không liên quan tới rule
+    counts: Callable[[LogRow], tuple[int, ...]]
+    check: Callable[[list[int]], bool]
+    describe: Callable[[str, list[int], int], tuple[str | None, str | None, int, str]]
+    tag: Callable[[LogRow], str] | None = None  # đếm giá trị phân biệt (distinct) nếu cần
+
+
+@dataclass
+class _Bucket:
+    second: int
+    counts: list[int]
+    first: datetime
+    last: datetime
+    tags: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass
+class _KeyState:
+    buckets: deque[_Bucket] = field(default_factory=deque)
+    sums: list[int] = field(default_factory=list)
+    tags: Counter[str] = field(default_factory=Counter)
+    fired: bool = False
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_SECOND = timedelta(seconds=1)
+
+
+def _second(ts: datetime) -> int:
+    return (ts - _EPOCH) // _SECOND
+
+
+def _window_start(end: int, rule: StreamRule) -> int:
+    # cùng biên với RuleEngine: [end - window_sec, end), end là giây đầu tiên ngoài window
+    return end - rule.window_sec
+
+
+def build_stream_rules() -> list[StreamRule]:
+    """Stream equivalents of R-001, R-002, R-004 and R-005 from rules.yaml."""
+    rules: list[StreamRule] = []
+
+    c1 = rules_config.rule("R-001", BruteForceConfig)
+    min_failures, login = c1.min_failures, c1.login_endpoint
+    win1 = c1.window_sec or 300
+    rules.append(
+        StreamRule(
+            rule_id="R-001",
+            severity=c1.severity,
+            window_sec=win1,
+            key=lambda r: r[_IP] if r[_EP] == login and r[_STATUS] in (401, 403) else None,
+            counts=lambda r: (1,),
+            check=lambda s: s[0] >= min_failures,
+            describe=lambda k, s, n: (
+                k,
+                login,
+                s[0],
+                f"{s[0]} failed logins to {login} within {win1}s",
+            ),
+        )
+    )
+
+    c2 = rules_config.rule("R-002", DDoSConfig)
+    threshold, focus = c2.req_per_ip_threshold, c2.endpoint
+    win2 = c2.window_sec or 60
+    rules.append(
+        StreamRule(
+            rule_id="R-002",
+            severity=c2.severity,
+            window_sec=win2,
+            key=lambda r: r[_IP] if not focus or r[_EP] == focus else None,
+            counts=lambda r: (1,),
+            check=lambda s: s[0] >= threshold,
+            describe=lambda k, s, n: (
+                k,
+                focus,
+                s[0],
+                f"{s[0]} requests in {win2}s to {focus or '<any>'}",
+            ),
+        )
+    )
+
+    c4 = rules_config.rule("R-004", Http5xxConfig)
+    rate, min_requests = c4.error_rate_threshold, c4.min_requests
+    rules.append(
+        StreamRule(
+            rule_id="R-004",
+            severity=c4.severity,
+            window_sec=c4.window_sec or 300,
+            key=lambda r: r[_EP],
+            counts=lambda r: (1, 1 if r[_STATUS] >= 500 else 0),
+            check=lambda s: s[0] >= min_requests and s[1] > 0 and s[1] >= rate * s[0],
+            describe=lambda k, s, n: (
+                None,
+                k,
+                s[1],
+                f"{s[1]}/{s[0]} responses were 5xx ({s[1] / s[0]:.0%})",
+            ),
+        )
+    )
+
+    c5 = rules_config.rule("R-005", AdminProbingConfig)
+    paths, min_404s = c5.sensitive_paths, c5.min_404s
+    if paths:
+        rules.append(
+            StreamRule(
+                rule_id="R-005",
+                severity=c5.severity,
+                window_sec=c5.window_sec or 300,
+                key=lambda r: r[_IP] if r[_STATUS] == 404 and r[_EP].startswith(paths) else None,
+                counts=lambda r: (1,),
+                check=lambda s: s[0] >= min_404s,
+                describe=lambda k, s, n: (k, None, s[0], f"{s[0]} 404s across {n} sensitive paths"),
+                tag=lambda r: r[_EP],
+            )
+        )
+    return rules
+
+
+class StreamingRuleEngine:
+    def __init__(self, rules: Sequence[StreamRule] | None = None, max_keys: int | None = None):
+        self._rules: list[StreamRule] | None = list(rules) if rules is not None else None
+        self._from_config = rules is None
+        self._version = 0  # version rules.yaml của self._rules
+        self.max_keys = max_keys or settings.STREAM_MAX_KEYS
+        self._state: list[OrderedDict[str, _KeyState]] = []
+        self._clock: datetime | None = None  # ts lớn nhất đã thấy (đồng hồ của stream)
+        self.future_rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> list[StreamRule]:
+        if self._from_config:
+            if not rules_config.version:  # nạp rules.yaml lần đầu dùng, không phải lúc import
+                rules_config.load()
+            else:
+                rules_config.reload_if_changed()
+            if self._rules is None or self._version != rules_config.version:
+                # ngưỡng mới áp dụng ngay; bucket đang đếm được giữ nguyên
+                self._rules, self._version = build_stream_rules(), rules_config.version
+        assert self._rules is not None
+        if len(self._state) != len(self._rules):
+            self._state = [OrderedDict() for _ in self._rules]
+        return self._rules
+
+    def key_count(self) -> int:
+        return sum(len(s) for s in self._state)
+
+    def observe(self, rows: Sequence[LogRow]) -> list[RuleMatch]:
+        """Feed stored rows; return matches for keys that just crossed a threshold."""
+        out: list[RuleMatch] = []
+        horizon = datetime.now(timezone.utc) + timedelta(seconds=settings.STREAM_MAX_CLOCK_SKEW_SEC)
+        with self._lock:
+            rules = self.rules
+            for row in rows:
+                ts: datetime = row[_TS]
+                if ts > horizon:  # đồng hồ client sai: không được kéo đồng hồ stream đi trước
+                    self.future_rows += 1
+                    continue
+                second = _second(ts)
+                if self._clock is None or ts > self._clock:
+                    # dọn key rảnh mỗi phút stream là đủ; _touch tự cắt window của key nó chạm
+                    advanced = self._clock is None or second // 60 > _second(self._clock) // 60
+                    self._clock = ts
+                    if advanced:
+                        self._sweep()
+                for rule, states in zip(rules, self._state):
+                    key = rule.key(row)
+                    if key is None:
+                        continue
+                    m = self._touch(rule, states, key, row, second)
+                    if m is not None:
+                        out.append(m)
+        return out
+
+    def matches(self, now: datetime) -> list[RuleMatch]:
+        """Every key currently over its threshold for windows ending at `now`.
+
+        A `now` inside a second counts that whole second (the stream has no finer buckets).
+        """
+        out: list[RuleMatch] = []
+        end = _second(now) + (1 if now.microsecond else 0)
+        with self._lock:
+            for rule, states in zip(self.rules, self._state):
+                start = _window_start(end, rule)
+                for key, st in states.items():
+                    window = [b for b in st.buckets if start <= b.second < end]
+                    if not window:
+                        continue
+                    sums = [sum(c) for c in zip(*(b.counts for b in window))]
+                    tags: Counter[str] = Counter()
+                    for b in window:
+                        tags.update(b.tags)
+                    if rule.check(sums):
+                        out.append(self._match(rule, key, sums, len(tags), window))
+        return out
+
+    # --- internals ---
+    def _window_start(self, rule: StreamRule) -> int:
+        assert self._clock is not None
+        return _window_start(_second(self._clock) + 1, rule)
+
+    def _touch(
+        self,
+        rule: StreamRule,
+        states: OrderedDict[str, _KeyState],
+        key: str,
+        row: LogRow,
+        second: int,
+    ) -> RuleMatch | None:
+        start = self._window_start(rule)
+        if second < start:  # đến quá trễ, đã ra khỏi window
+            return None
+        st = states.get(key)
+        if st is None:
+            st = states[key] = _KeyState()
+            if len(states) > self.max_keys:
+                states.popitem(last=False)
+        else:
+            states.move_to_end(key)
+        self._evict(st, start)
+
+        ts: datetime = row[_TS]
+        inc = rule.counts(row)
+        bucket = next((b for b in reversed(st.buckets) if b.second == second), None)
+        if bucket is None:
+            bucket = _Bucket(second, [0] * len(inc), ts, ts)
+            st.buckets.append(bucket)
+            if len(st.buckets) > 1 and st.buckets[-2].second > second:  # dòng đến lệch thứ tự
+                st.buckets = deque(sorted(st.buckets, key=lambda b: b.second))
+        if not st.sums:
+            st.sums = [0] * len(inc)
+        for i, v in enumerate(inc):
+            bucket.counts[i] += v
+            st.sums[i] += v
+        bucket.first, bucket.last = min(bucket.first, ts), max(bucket.last, ts)
+        if rule.tag is not None:
+            tag = rule.tag(row)
+            bucket.tags[tag] += 1
+            st.tags[tag] += 1
+
+        hit = rule.check(st.sums)
+        if hit and not st.fired:
+            st.fired = True
+            return self._match(rule, key, st.sums, len(st.tags), st.buckets)
+        st.fired = hit
+        return None
+
+    @staticmethod
+    def _evict(st: _KeyState, start: int) -> None:
+        while st.buckets and st.buckets[0].second < start:
+            old = st.buckets.popleft()
+            for i, v in enumerate(old.counts):
+                st.sums[i] -= v
+            st.tags.subtract(old.tags)
+            st.tags = +st.tags  # bỏ các tag về 0
+
+    def _sweep(self) -> None:
+        """Evict expired buckets everywhere and drop idle keys (runs once per stream minute)."""
+        for rule, states in zip(self.rules, self._state):
+            start = self._window_start(rule)
+            for key in list(states):
+                st = states[key]
+                self._evict(st, start)
+                if not st.buckets:
+                    del states[key]
+                elif st.fired and not rule.check(st.sums):
+                    st.fired = False
+
+    @staticmethod
+    def _match(rule: StreamRule, key: str, sums: list[int], n_tags: int, buckets: Any) -> RuleMatch:
+        ip, endpoint, count, evidence = rule.describe(key, sums, n_tags)
+        return RuleMatch(
+            rule_id=rule.rule_id,
+            severity=rule.severity,
+            first_seen=min(b.first for b in buckets),
+            last_seen=max(b.last for b in buckets),
+            ip=ip,
+            endpoint=endpoint,
+            count=count,
+            evidence=evidence,
+        )
+
+
+stream_engine = StreamingRuleEngine()
@@ -0,0 +1,313 @@
+"""Vectorized (NumPy) evaluation of the count-threshold rules (`RULE_EVALUATOR=numpy`).
+
+Optional: needs `numpy` (`pip install 'mini-siem[fast]'`). The union of the plan windows is
+fetched from `logs` once with `COPY ... TO STDOUT` into columns (ts as int64 µs, status,
+factorized ip / endpoint codes) and folded into the same per-minute (ip, endpoint) buckets as `ip_stats`
+(sort + `ufunc.reduceat`). Each plan is then a masked `bincount` / `ufunc.at` over the
+buckets, and matches are built by the plan's own `to_match`, so results equal
+`anomaly_detector.run_plans` once `ip_stats` is up to date. Plans of other rules go to SQL.
+"""
+
+from __future__ import annotations
+
+import io
+import re
+from collections.abc import Callable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlalchemy import BigInteger, Select, cast, func, select
+from sqlalchemy.orm import Session
+
+from backend.core.rules_config import (
+    AdminProbingConfig,
+    BruteForceConfig,
+    DDoSConfig,
+    Http5xxConfig,
+    rules_config,
+)
+from backend.db.bulk import supports_copy
+from backend.db.models import Log
+from backend.db.queries import Span, split_window
+from backend.services import anomaly_detector
+from backend.services.anomaly_detector import AggregatePlan, RuleMatch
+
+I64 = NDArray[np.int64]
+MINUTE_US = 60_000_000
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _us(ts: datetime) -> int:
+    return (ts - _EPOCH) // timedelta(microseconds=1)
+
+
+def _dt(us: Any) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(us))
+
+
+@dataclass
+class Window:
+    """Logs of a time range, column by column; `ip` / `ep` index into `ips` / `endpoints`."""
+
+    ts: I64
+    status: I64
+    ip: I64
+    ep: I64
+    ips: list[str]
+    endpoints: list[str]
+
+
+@dataclass
+class Buckets:
+    """Per-minute (ip, endpoint) aggregates, the in-memory twin of `ip_stats`."""
+
+    minute: I64
+    ip: I64
+    ep: I64
+    req: I64
+    error_5xx: I64
+    auth_fail: I64
+    not_found: I64
+    first: I64
+    last: I64
+    raw: NDArray[np.bool_]  # True: phần lẻ ở biên window (xem `bucketize(edges=...)`)
+
+
+def fetch_window(db: Session, start: datetime, end: datetime) -> Window:
+    """Logs with `ts` in [start, end)."""
+    stmt = select(
+        # double đủ chính xác tới µs cho epoch hiện tại và rẻ hơn numeric của extract()
+        cast(func.round(func.date_part("epoch", Log.ts) * 1_000_000), BigInteger),
+        Log.status_code,
+        Log.ip,
+        Log.endpoint,
+    ).where(Log.ts >= start, Log.ts < end)
+    if supports_copy(db):
+        return _fetch_copy(db, stmt)
+    return _fetch_rows(db, stmt)
+
+
+def _factorize(values: Sequence[Any]) -> tuple[I64, list[Any]]:
+    codes: dict[Any, int] = {}
+    arr = np.fromiter((codes.setdefault(v, len(codes)) for v in values), np.int64, len(values))
+    return arr, list(codes)
+
+
+_COPY_ESCAPES = {b"b": b"\b", b"f": b"\f", b"n": b"\n", b"r": b"\r", b"t": b"\t", b"v": b"\v"}
+_COPY_ESCAPE_RE = re.compile(rb"\\(.)")
+
+
+def _copy_text(value: bytes) -> str:
+    if b"\\" in value:
+        value = _COPY_ESCAPE_RE.sub(lambda m: _COPY_ESCAPES.get(m.group(1), m.group(1)), value)
+    return value.decode("utf-8")
+
+
+def _fetch_copy(db: Session, stmt: Select[Any]) -> Window:
+    """`COPY (SELECT ...) TO STDOUT`: no per-row Python objects except the split fields."""
+    sql = str(stmt.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    buf = io.BytesIO()
+    dbapi_conn = db.connection().connection.driver_connection
+    with dbapi_conn.cursor() as cur:  # type: ignore[union-attr]
+        cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT text)", buf)
+    fields = buf.getvalue().replace(b"\n", b"\t").split(b"\t")[:-1]
+    ip, ips = _factorize(fields[2::4])
+    ep, endpoints = _factorize(fields[3::4])
+    return Window(
+        ts=np.array(fields[0::4], dtype=np.int64),
+        status=np.array(fields[1::4], dtype=np.int64),
+        ip=ip,
+        ep=ep,
+        ips=[_copy_text(v) for v in ips],
+        endpoints=[_copy_text(v) for v in endpoints],
+    )
+
+
+def _fetch_rows(db: Session, stmt: Select[Any]) -> Window:
+    rows = db.execute(stmt).all()
+    if not rows:
+        e = np.empty(0, np.int64)
+        return Window(e, e, e, e, [], [])
+    ts, status, ips, eps = zip(*rows)
+    ip, ip_names = _factorize(ips)
+    ep, ep_names = _factorize(eps)
+    return Window(
+        ts=np.fromiter(ts, np.int64, len(ts)),
+        status=np.fromiter(status, np.int64, len(status)),
+        ip=ip,
+        ep=ep,
+        ips=ip_names,
+        endpoints=ep_names,
+    )
+
+
+def bucketize(w: Window, edges: Sequence[Span] | None = None) -> Buckets:
+    """Group rows by (minute, ip, endpoint) with one argsort and `reduceat`.
+
+    With `edges`, only rows inside them are grouped, with minutes also split at every edge
+    bound and `raw` set: the twin of the partial-edge rows of `anomaly_detector.run_plans`.
+    """
+    cut_us: I64 = np.empty(0, np.int64)
+    if edges is not None:
+        cut_us = np.unique(np.fromiter((_us(t) for e in edges for t in e), np.int64))
+        keep = np.zeros(len(w.ts), bool)
+        for a, b in edges:
+            keep |= (w.ts >= _us(a)) & (w.ts < _us(b))
+        w = Window(w.ts[keep], w.status[keep], w.ip[keep], w.ep[keep], w.ips, w.endpoints)
+    if not len(w.ts):
+        e = np.empty(0, np.int64)
+        return Buckets(e, e, e, e, e, e, e, e, e, np.empty(0, bool))
+    n_ip, n_ep = len(w.ips), len(w.endpoints)
+    n_seg = len(cut_us) + 1
+    slot = (w.ts // MINUTE_US) * n_seg + np.searchsorted(cut_us, w.ts, side="right")
+    m0 = int(slot.min())
+    comp = ((slot - m0) * n_ip + w.ip) * n_ep + w.ep
+    order = np.argsort(comp, kind="stable")
+    comp = comp[order]
+    starts = np.flatnonzero(np.r_[True, comp[1:] != comp[:-1]])
+    status, ts = w.status[order], w.ts[order]
+
+    def count(mask: NDArray[np.bool_]) -> I64:
+        return np.add.reduceat(mask.astype(np.int64), starts)
+
+    key = comp[starts]
+    return Buckets(
+        minute=(key // (n_ep * n_ip) + m0) // n_seg,
+        ip=(key // n_ep) % n_ip,
+        ep=key % n_ep,
+        req=np.diff(np.r_[starts, len(comp)]),
+        error_5xx=count(status >= 500),
+        auth_fail=count((status == 401) | (status == 403)),
+        not_found=count(status == 404),
+        first=np.minimum.reduceat(ts, starts),
+        last=np.maximum.reduceat(ts, starts),
+        raw=np.full(len(starts), edges is not None),
+    )
+
+
+def _concat(a: Buckets, b: Buckets) -> Buckets:
+    return Buckets(
+        *(np.concatenate([getattr(a, f), getattr(b, f)]) for f in Buckets.__annotations__)
+    )
+
+
+@dataclass
+class _Groups:
+    """Per-key reductions of the buckets selected by a plan."""
+
+    present: NDArray[np.bool_]
+    first: I64
+    last: I64
+    sums: dict[str, I64]
+
+
+def _group(keys: I64, n: int, b: Buckets, mask: NDArray[np.bool_], **cols: I64) -> _Groups:
+    k = keys[mask]
+    first = np.full(n, np.iinfo(np.int64).max)
+    last = np.full(n, np.iinfo(np.int64).min)
+    np.minimum.at(first, k, b.first[mask])
+    np.maximum.at(last, k, b.last[mask])
+    return _Groups(
+        present=np.bincount(k, minlength=n) > 0,
+        first=first,
+        last=last,
+        sums={
+            c: np.bincount(k, weights=v[mask], minlength=n).astype(np.int64)
+            for c, v in cols.items()
+        },
+    )
+
+
+def _in_window(b: Buckets, p: AggregatePlan) -> NDArray[np.bool_]:
+    """Whole minutes inside the plan window, plus its edge rows (same split as the SQL)."""
+    win = split_window(p.start, p.end)
+    m = b.minute * MINUTE_US
+    mask = ~b.raw & (m >= _us(win.full_start)) & (m < _us(win.full_end))
+    for lo, hi in win.edges:
+        # dòng biên không vắt qua biên plan nào → xét một ts đại diện là đủ
+        mask |= b.raw & (b.first >= _us(lo)) & (b.first < _us(hi))
+    return mask
+
+
+def _code(names: list[str], name: str | None) -> int:
+    try:
+        return names.index(name) if name is not None else -1
+    except ValueError:
+        return -1
+
+
+def _emit(
+    p: AggregatePlan, names: list[str], g: _Groups, hit: NDArray[np.bool_], **extra: I64
+) -> list[RuleMatch]:
+    out = []
+    for k in np.flatnonzero(g.present & hit):
+        vals: dict[str, Any] = {c: int(v[k]) for c, v in {**g.sums, **extra}.items()}
+        vals["first_seen"], vals["last_seen"] = _dt(g.first[k]), _dt(g.last[k])
+        out.append(p.to_match(names[k], vals))
+    return out
+
+
+def _brute_force(p: AggregatePlan, w: Window, b: Buckets) -> list[RuleMatch]:
+    cfg = rules_config.rule(p.rule_id, BruteForceConfig)
+    login = _code(w.endpoints, cfg.login_endpoint)
+    mask = _in_window(b, p) & (b.ep == login) & (b.auth_fail > 0)
+    g = _group(b.ip, len(w.ips), b, mask, cnt=b.auth_fail)
+    return _emit(p, w.ips, g, g.sums["cnt"] >= cfg.min_failures)
+
+
+def _ddos(p: AggregatePlan, w: Window, b: Buckets) -> list[RuleMatch]:
+    cfg = rules_config.rule(p.rule_id, DDoSConfig)
+    mask = _in_window(b, p)
+    if cfg.endpoint:
+        mask &= b.ep == _code(w.endpoints, cfg.endpoint)
+    g = _group(b.ip, len(w.ips), b, mask, cnt=b.req)
+    return _emit(p, w.ips, g, g.sums["cnt"] >= cfg.req_per_ip_threshold)
+
+
+def _http5xx(p: AggregatePlan, w: Window, b: Buckets) -> list[RuleMatch]:
+    cfg = rules_config.rule(p.rule_id, Http5xxConfig)
+    g = _group(b.ep, len(w.endpoints), b, _in_window(b, p), cnt=b.error_5xx, req=b.req)
+    cnt, req = g.sums["cnt"], g.sums["req"]
+    hit = (req >= cfg.min_requests) & (cnt > 0) & (cnt >= cfg.error_rate_threshold * req)
+    return _emit(p, w.endpoints, g, hit)
+
+
+def _admin_probing(p: AggregatePlan, w: Window, b: Buckets) -> list[RuleMatch]:
+    cfg = rules_config.rule(p.rule_id, AdminProbingConfig)
+    paths = cfg.sensitive_paths
+    sensitive = np.fromiter((e.startswith(paths) for e in w.endpoints), bool, len(w.endpoints))
+    mask = _in_window(b, p) & (b.not_found > 0) & sensitive[b.ep]
+    n_ip = len(w.ips)
+    g = _group(b.ip, n_ip, b, mask, cnt=b.not_found)
+    # số endpoint phân biệt mỗi IP = số cặp (ip, endpoint) duy nhất
+    pairs = np.unique(b.ip[mask] * len(w.endpoints) + b.ep[mask])
+    distinct = np.bincount(pairs // len(w.endpoints), minlength=n_ip).astype(np.int64)
+    return _emit(p, w.ips, g, g.sums["cnt"] >= cfg.min_404s, paths=distinct)
+
+
+VECTOR_RULES: dict[str, Callable[[AggregatePlan, Window, Buckets], list[RuleMatch]]] = {
+    "R-001": _brute_force,
+    "R-002": _ddos,
+    "R-004": _http5xx,
+    "R-005": _admin_probing,
+}
+
+
+def run_plans(db: Session, plans: Sequence[AggregatePlan]) -> list[list[RuleMatch]]:
+    """Drop-in for `anomaly_detector.run_plans`: one fetch for all vectorizable plans."""
+    out: list[list[RuleMatch]] = [[] for _ in plans]
+    vec = [i for i, p in enumerate(plans) if p.rule_id in VECTOR_RULES]
+    rest = [i for i, p in enumerate(plans) if p.rule_id not in VECTOR_RULES]
+    if rest:
+        for i, found in zip(rest, anomaly_detector.run_plans(db, [plans[i] for i in rest])):
+            out[i] = found
+    if vec:
+        w = fetch_window(db, min(plans[i].start for i in vec), max(plans[i].end for i in vec))
+        edges = [e for i in vec for e in split_window(plans[i].start, plans[i].end).edges]
+        b = _concat(bucketize(w), bucketize(w, edges)) if edges else bucketize(w)
+        for i in vec:
+            out[i] = VECTOR_RULES[plans[i].rule_id](plans[i], w, b)
+    return out
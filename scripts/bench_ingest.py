@@ -0,0 +1,74 @@
+"""Benchmark LogIngestor.save_batch write modes (orm / core / copy).
+
+Each run happens inside a transaction that is rolled back, so the DB is left untouched.
+
+    python -m scripts.bench_ingest --sizes 1000 10000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import sessionmaker
+
+from backend.db.bulk import WRITE_MODES
+from backend.db.database import get_engine
+from backend.services.log_ingestor import LogEvent, LogIngestor
+
+
+def make_events(n: int) -> list[LogEvent]:
+    base = datetime.now(timezone.utc)
+    endpoints = ["/", "/login", "/products", "/search", "/cart/add"]
+    return [
+        LogEvent(
+            ts=base - timedelta(milliseconds=i),
+            source="bench",
+            host="bench.local",
+            ip=f"10.{i % 250}.{(i // 250) % 250}.{random.randint(1, 254)}",
+            endpoint=random.choice(endpoints),
+            method="GET",
+            status_code=random.choice([200, 200, 200, 401, 404, 500]),
+            resp_time_ms=random.randint(1, 300),
+            ua="bench/1.0",
+            action_type="view",
+            query_params="q=shoes\tsize=42" if i % 10 == 0 else None,
+        )
+        for i in range(n)
+    ]
+
+
+def run_once(mode: str, events: list[LogEvent]) -> float:
+    SessionLocal = sessionmaker(bind=get_engine(), autoflush=False)
+    with SessionLocal() as s:
+        t0 = time.perf_counter()
+        LogIngestor(write_mode=mode).save_batch(s, events)
+        s.flush()
+        elapsed = time.perf_counter() - t0
+        s.rollback()
+    return elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--modes", nargs="+", default=list(WRITE_MODES), choices=WRITE_MODES)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"{'events':>8} {'mode':>5} {'best_s':>9} {'events/s':>11} {'vs orm':>7}")
+    for n in args.sizes:
+        events = make_events(n)
+        baseline: float | None = None
+        for mode in args.modes:
+            best = min(run_once(mode, events) for _ in range(args.repeat))
+            if mode == "orm":
+                baseline = best
+            speedup = f"{baseline / best:6.1f}x" if baseline else "     -"
+            print(f"{n:>8} {mode:>5} {best:>9.3f} {n / best:>11,.0f} {speedup:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark the threshold-rule evaluators (SQL over ip_stats vs NumPy over logs).
+
+Rows are generated server-side inside a transaction that is rolled back, so the DB is
+left untouched. Needs the optional `numpy` dependency.
+
+    python -m scripts.bench_rules --sizes 1000000 10000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from backend.db.database import get_engine
+from backend.db.queries import aggregate_ip_stats
+from backend.services.anomaly_detector import RuleEngine
+
+WINDOW = timedelta(minutes=5)
+
+# ~N/50 IP, 8 endpoint; status lệch về 200, có 401/404/5xx để các rule đều có việc
+_SEED_SQL = text(
+    """
+    INSERT INTO logs (ts, source, host, ip, endpoint, method, status_code, resp_time_ms)
+    SELECT :start + (g % 300000) * interval '1 millisecond',
+           'bench', 'bench.local',
+           '10.' || (g % :n_ip / 65536) || '.' || (g % :n_ip / 256 % 256) || '.' || (g % :n_ip % 256),
+           (ARRAY['/', '/login', '/search', '/pay', '/admin', '/admin/users', '/.git/HEAD', '/cart'])
+               [1 + (g * 7919) % 8],
+           'GET',
+           (ARRAY[200, 200, 200, 200, 401, 403, 404, 500, 502, 200])[1 + (g * 104729) % 10],
+           1
+    FROM generate_series(1::bigint, :n) AS g
+    """
+)
+
+
+def run(n: int, end: datetime) -> None:
+    SessionLocal = sessionmaker(bind=get_engine(), autoflush=False)
+    with SessionLocal() as s:
+        t0 = time.perf_counter()
+        s.execute(_SEED_SQL, {"start": end - WINDOW, "n": n, "n_ip": max(1, n // 50)})
+        t1 = time.perf_counter()
+        aggregate_ip_stats(s, end - WINDOW, end, now=end)
+        t2 = time.perf_counter()
+        sql = RuleEngine(evaluator="sql").evaluate(s, end - WINDOW, end)
+        t3 = time.perf_counter()
+        vec = RuleEngine(evaluator="numpy").evaluate(s, end - WINDOW, end)
+        t4 = time.perf_counter()
+        s.rollback()
+
+    same = sorted(map(repr, sql)) == sorted(map(repr, vec))
+    print(
+        f"rows={n:>10,}  seed={t1 - t0:7.2f}s  rollup={t2 - t1:7.2f}s  "
+        f"sql={t3 - t2:7.3f}s  numpy={t4 - t3:7.3f}s  matches={len(sql)} same={same}"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", type=int, default=[1_000_000, 10_000_000])
+    args = ap.parse_args()
+    end = datetime(2030, 1, 1, tzinfo=timezone.utc)  # xa dữ liệu thật
+    for n in args.sizes:
+        run(n, end)
+
+
+if __name__ == "__main__":
+    main()
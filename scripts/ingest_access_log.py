@@ -0,0 +1,214 @@
+"""Backfill or tail a raw nginx/apache access log into `logs`.
+
+A backfill records each stored byte range in `access_log_ranges` (in the transaction that
+writes its rows), so re-running it, or backfilling a rotated copy, only reads the rest.
+
+    python -m scripts.ingest_access_log /var/log/nginx/access.log --host web-1 --workers 4
+    python -m scripts.ingest_access_log /var/log/nginx/access.log --host web-1 --follow
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.bulk import LogRow
+from backend.db.database import get_engine, session_scope
+from backend.db.models import AccessLogRange
+from backend.services.access_log_parser import (
+    PATTERNS,
+    ParseOptions,
+    Span,
+    file_id,
+    parse_lines,
+    process_file,
+)
+from backend.services.heavy_hitters import heavy_hitters
+from backend.services.log_ingestor import LogIngestor
+
+# (host, file_id, path) của file đang backfill
+Source = tuple[str, str, str]
+
+
+class Progress:
+    def __init__(self) -> None:
+        self.t0 = time.perf_counter()
+        self.lines = 0
+        self.bad = 0
+        self.stored = 0
+        self.skipped = 0
+
+    def add(self, stats: tuple[int, int, int, int]) -> None:
+        self.lines += stats[0]
+        self.bad += stats[1]
+        self.stored += stats[2]
+        self.skipped += stats[3]
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.perf_counter() - self.t0, 1e-9)
+        tag = "done" if final else "progress"
+        print(
+            f"[{tag}] lines={self.lines} stored={self.stored} skipped={self.skipped} "
+            f"unparsed={self.bad} → {self.lines / elapsed:,.0f} lines/s"
+        )
+
+
+def claim_range(s: Session, source: Source, span: Span) -> bool:
+    """Record `span` of the file in `s`'s transaction; False if it was stored before."""
+    host, fid, path = source
+    stmt = pg_insert(AccessLogRange).values(
+        host=host,
+        file_id=fid,
+        start_offset=span[0],
+        end_offset=span[1],
+        path=path,
+        ingested_at=datetime.now(timezone.utc),
+    )
+    return (
+        s.scalar(stmt.on_conflict_do_nothing().returning(AccessLogRange.start_offset)) is not None
+    )
+
+
+def stored_ranges(source: Source) -> list[Span]:
+    host, fid, _ = source
+    with session_scope() as s:
+        q = select(AccessLogRange.start_offset, AccessLogRange.end_offset).where(
+            AccessLogRange.host == host, AccessLogRange.file_id == fid
+        )
+        return [(a, b) for a, b in s.execute(q)]
+
+
+def store(
+    rows: list[LogRow],
+    bad: int,
+    span: Span | None = None,
+    *,
+    source: Source | None = None,
+    batch_size: int = 5000,
+    dry_run: bool = False,
+) -> tuple[int, int, int, int]:
+    """Write one parsed chunk in one transaction; return (lines, unparsed, stored, skipped).
+
+    With `source`, the chunk's byte range is claimed in the same transaction, so a range
+    already stored (e.g. by a concurrent run) is skipped. This process' heavy-hitter
+    snapshot is flushed in the same transaction. Runs inside the pool workers during a
+    parallel backfill.
+    """
+    lines = len(rows) + bad
+    if dry_run:
+        return lines, bad, 0, 0
+    ingestor = LogIngestor()
+    with session_scope() as s:
+        if source is not None and span is not None and not claim_range(s, source, span):
+            return lines, bad, 0, lines
+        for i in range(0, len(rows), batch_size):
+            ingestor.save_rows(s, rows[i : i + batch_size])
+        if settings.HEAVY_HITTERS_ENABLED:
+            # không có thread flush như API: thiếu snapshot thì R-002 phải đếm lại mọi IP
+            heavy_hitters.flush(s)
+    return lines, bad, len(rows), 0
+
+
+def _init_worker() -> None:
+    # không dùng lại kết nối kế thừa từ process cha sau fork
+    get_engine().dispose(close=False)
+
+
+def backfill(args: argparse.Namespace, opts: ParseOptions) -> Progress:
+    p = Progress()
+    last = time.monotonic()
+    fid = file_id(args.path)
+    source = (opts.host, fid, os.path.realpath(args.path)) if fid else None
+    skip = stored_ranges(source) if source and not args.dry_run else []
+    if skip:
+        done = sum(e - s for s, e in skip)
+        print(f"[resume] {done:,} bytes of this file already stored, skipping them")
+    sink = partial(store, source=source, batch_size=args.batch_size, dry_run=args.dry_run)
+    for stats in process_file(
+        args.path,
+        opts,
+        sink,
+        workers=args.workers,
+        chunk_bytes=args.chunk_mb * 1024 * 1024,
+        skip=skip,
+        initializer=_init_worker,
+    ):
+        p.add(stats)
+        if time.monotonic() - last >= 5:
+            p.report()
+            last = time.monotonic()
+    return p
+
+
+def follow(args: argparse.Namespace, opts: ParseOptions) -> Progress:
+    """Tail the file from its end; reopen on rotation (inode change) or truncation."""
+    p = Progress()
+    sink = partial(store, batch_size=args.batch_size, dry_run=args.dry_run)
+    f = open(args.path, encoding="utf-8", errors="replace")  # noqa: SIM115 (mở lại khi rotate)
+    f.seek(0, os.SEEK_END)
+    buf: list[str] = []
+    pending = ""
+    last_flush = last_report = time.monotonic()
+    try:
+        while True:
+            line = f.readline()
+            if line:
+                if not line.endswith("\n"):  # dòng đang được ghi dở
+                    pending += line
+                    continue
+                buf.append(pending + line)
+                pending = ""
+            else:
+                try:
+                    st = os.stat(args.path)
+                    if st.st_ino != os.fstat(f.fileno()).st_ino or st.st_size < f.tell():
+                        f.close()
+                        f = open(args.path, encoding="utf-8", errors="replace")  # noqa: SIM115
+                        continue
+                except FileNotFoundError:
+                    pass  # đang rotate, file mới chưa xuất hiện
+                time.sleep(args.poll_sec)
+            now = time.monotonic()
+            if buf and (len(buf) >= args.batch_size or now - last_flush >= args.poll_sec):
+                p.add(sink(*parse_lines(buf, opts)))
+                buf, last_flush = [], now
+            if now - last_report >= 5:
+                p.report()
+                last_report = now
+    except KeyboardInterrupt:
+        if buf:
+            p.add(sink(*parse_lines(buf, opts)))
+    finally:
+        f.close()
+    return p
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("path")
+    ap.add_argument("--format", dest="fmt", choices=sorted(PATTERNS), default="combined")
+    ap.add_argument("--host", default=os.uname().nodename)
+    ap.add_argument("--source", default="nginx")
+    ap.add_argument("--follow", action="store_true", help="tail the file instead of backfilling")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-mb", dest="chunk_mb", type=int, default=8)
+    ap.add_argument("--batch-size", dest="batch_size", type=int, default=5000)
+    ap.add_argument("--poll-sec", dest="poll_sec", type=float, default=0.5)
+    ap.add_argument("--dry-run", action="store_true", help="parse only, do not write")
+    args = ap.parse_args()
+
+    opts = ParseOptions(fmt=args.fmt, host=args.host, source=args.source)
+    p = follow(args, opts) if args.follow else backfill(args, opts)
+    p.report(final=True)
+
+
+if __name__ == "__main__":
+    main()
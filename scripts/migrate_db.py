@@ -4,9 +4,9 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from backend.db.database import get_engine
-from backend.db.models import Base
+from backend.db.migrations import upgrade_schema
 
 if __name__ == "__main__":
     engine = get_engine()
-    Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
     print("✅ Database schema created/migrated.")
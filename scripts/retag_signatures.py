@@ -0,0 +1,63 @@
+"""Re-tag `logs.sig_mask` with the current R-003 patterns (after an upgrade or a pattern edit).
+
+R-003 matches untagged / stale rows by substring at query time; this backfill rewrites
+them in id batches (one transaction each) so R-003 reads them from the partial index again.
+
+python -m scripts.retag_signatures --batch-size 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import cast
+
+from sqlalchemy import Table, bindparam, or_, select, update
+from sqlalchemy.orm import Session
+
+from backend.core.signatures import sqli_matcher
+from backend.db.database import session_scope
+from backend.db.models import Log
+
+
+def retag_batch(db: Session, after_id: int, batch_size: int) -> tuple[int, int | None]:
+    """Re-tag up to `batch_size` stale rows with id > `after_id`; (rows, last id or None)."""
+    ac = sqli_matcher()
+    v = ac.version
+    rows = db.execute(
+        select(Log.id, Log.ts, Log.endpoint, Log.query_params)
+        .where(Log.id > after_id, or_(Log.sig_version.is_(None), Log.sig_version != v))
+        .order_by(Log.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0, None
+    table = cast(Table, Log.__table__)
+    c = table.c
+    db.execute(
+        update(table)
+        .where(c.id == bindparam("b_id"), c.ts == bindparam("b_ts"))
+        .values(sig_mask=bindparam("b_mask"), sig_version=v),
+        [{"b_id": r.id, "b_ts": r.ts, "b_mask": ac.mask(r.endpoint, r.query_params)} for r in rows],
+    )
+    return len(rows), rows[-1].id
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", dest="batch_size", type=int, default=10_000)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    total, last_id = 0, 0
+    while True:
+        with session_scope() as s:
+            n, last = retag_batch(s, last_id, args.batch_size)
+        if last is None:
+            break
+        total, last_id = total + n, last
+    print(f"retagged={total} elapsed={time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
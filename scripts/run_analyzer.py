@@ -1,25 +1,94 @@
-"""Run RuleEngine for a recent window (cron-friendly)."""
+"""Run RuleEngine over the windows due since each rule's watermark.
+
+python -m scripts.run_analyzer                       # one tick (cron-friendly)
+python -m scripts.run_analyzer --daemon              # loop every ANALYZER_POLL_SEC
+python -m scripts.run_analyzer --profile --explain --profile-json prof.json
+                                                     # per-rule timings (+ query plans)
+"""
 
 from __future__ import annotations
 
 import argparse
-from datetime import datetime, timedelta, timezone
+import json
+import signal
+import sys
+import threading
+from datetime import timedelta
+from types import FrameType
 
-from backend.db.database import session_scope
+from backend.core.config import settings
+from backend.db.database import get_engine, session_scope
+from backend.services.analyzer import Analyzer, TickResult, single_instance
 from backend.services.anomaly_detector import RuleEngine
+from backend.services.rule_profiler import RuleProfiler, report_json, report_table
+
+
+def _report(res: TickResult) -> None:
+    lag = ", ".join(f"{rid}={sec}s" for rid, sec in sorted(res.lag_sec.items()))
+    print(f"windows={res.windows} events={res.events} skipped={res.skipped} lag: {lag}")
+
+
+def _report_profile(profiler: RuleProfiler, json_path: str | None) -> None:
+    records = profiler.take()
+    if records:
+        print(report_table(records))
+    if json_path:  # JSON Lines: mỗi dòng một (rule, window)
+        with open(json_path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(rec) + "\n" for rec in report_json(records))
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--window-sec", dest="window_sec", type=int, default=300)
-    ap.add_argument("--lookback-minutes", dest="lookback_minutes", type=int, default=15)
+    ap.add_argument(
+        "--lookback-minutes",
+        dest="lookback_minutes",
+        type=int,
+        default=None,
+        help="cap the catch-up: skip window ends older than this (default: resume from the "
+        "watermark however old)",
+    )
+    ap.add_argument("--daemon", action="store_true", help="keep running")
+    ap.add_argument("--poll-sec", dest="poll_sec", type=float, default=settings.ANALYZER_POLL_SEC)
+    ap.add_argument(
+        "--profile",
+        action="store_true",
+        help="run rules one by one and report wall/DB time, rows and matches per rule",
+    )
+    ap.add_argument(
+        "--explain",
+        action="store_true",
+        help="with --profile: capture EXPLAIN (ANALYZE, BUFFERS) of every rule query",
+    )
+    ap.add_argument(
+        "--profile-json",
+        dest="profile_json",
+        default=None,
+        help="with --profile: append per-window records to this file (JSON Lines)",
+    )
     args = ap.parse_args()
 
-    end = datetime.now(timezone.utc)
-    start = end - timedelta(seconds=args.window_sec)
-    with session_scope() as s:
-        written = RuleEngine().process_window(s, start, end)
-        print(f"window [{start}..{end}) → events written: {written}")
+    profiler = RuleProfiler(explain=args.explain) if args.profile or args.explain else None
+    lookback = timedelta(minutes=args.lookback_minutes) if args.lookback_minutes else None
+    analyzer = Analyzer(engine=RuleEngine(profiler=profiler), lookback=lookback)
+    stop = threading.Event()
+
+    def _stop(signum: int, frame: FrameType | None) -> None:
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    with single_instance(get_engine()) as ok:
+        if not ok:
+            print("another analyzer holds the advisory lock; exiting", file=sys.stderr)
+            sys.exit(1)
+        while True:
+            with session_scope() as s:
+                _report(analyzer.tick(s))
+            if profiler is not None:
+                _report_profile(profiler, args.profile_json)
+            if not args.daemon or stop.wait(args.poll_sec):
+                break
 
 
 if __name__ == "__main__":
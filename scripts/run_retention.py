@@ -0,0 +1,36 @@
+"""Partition maintenance for `logs` (cron-friendly, e.g. hourly).
+
+Creates upcoming partitions ahead of time, then drops partitions older than
+RETENTION_DAYS instead of running DELETE on the table.
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import timedelta
+
+from backend.core.config import settings
+from backend.db.database import get_engine, session_scope
+from backend.db.partitions import drop_expired_partitions, premake_partitions
+from backend.services.heavy_hitters import prune
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--retention-days", dest="retention_days", type=int, default=None)
+    args = ap.parse_args()
+
+    days = settings.RETENTION_DAYS if args.retention_days is None else args.retention_days
+    with get_engine().begin() as conn:
+        created = premake_partitions(conn)
+        dropped, deleted = drop_expired_partitions(conn, days)
+    with session_scope() as s:
+        hh_deleted = prune(s, timedelta(days=days))
+    print(
+        f"created={created} dropped={dropped} default_rows_deleted={deleted} "
+        f"heavy_hitters_deleted={hh_deleted}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
 from collections.abc import Iterator
+from dataclasses import replace
 
 import pytest
 from sqlalchemy.orm import Session, sessionmaker
 
+from backend.core.rules_config import rules_config
 from backend.db.database import get_engine
 from backend.db.models import Base
 
@@ -17,7 +19,19 @@ def _setup_db() -> Iterator[None]:
     yield
     # best-effort truncate (some tables may not exist in early steps)
     with engine.begin() as conn:
-        for tbl in ("events", "ip_stats", "logs"):
+        for tbl in (
+            "events",
+            "ip_stats",
+            "distinct_sketches",
+            "heavy_hitters",
+            "logs",
+            "rate_limit_buckets",
+            "ingest_metrics",
+            "ingest_idempotency",
+            "rollup_watermarks",
+            "rule_watermarks",
+            "access_log_ranges",
+        ):
             try:
                 conn.exec_driver_sql(f'TRUNCATE TABLE "{tbl}" RESTART IDENTITY CASCADE;')
             except Exception:
@@ -31,3 +45,13 @@ def db() -> Iterator[Session]:
     SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
     with SessionLocal() as s:
         yield s
+
+
+@pytest.fixture()
+def restore_rules() -> Iterator[None]:
+    """Put the global rules config (file and live version) back after the test."""
+    path, current, rejected = rules_config._path, rules_config._current, rules_config._rejected
+    yield
+    rules_config._path, rules_config._rejected = path, rejected
+    # version mới: engine / matcher build theo bản của test sẽ build lại
+    rules_config._current = replace(current, version=rules_config.version + 1)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.database import get_engine
+from backend.db.models import Event, Log, RuleWatermark
+from backend.db.partitions import floor_ts, list_partitions, partition_name
+from backend.main import app
+from backend.services.analyzer import Analyzer, rule_step, single_instance
+
+NOW = datetime(2025, 10, 1, 12, 0, 10, tzinfo=timezone.utc)
+
+
+def test_due_windows_are_aligned_bounded_and_skip_past_lookback() -> None:
+    analyzer = Analyzer(lookback=timedelta(minutes=15))
+    due, skipped = analyzer.due_windows({}, NOW)
+    assert skipped == 0
+    assert min(due) == datetime(2025, 10, 1, 11, 46, tzinfo=timezone.utc)
+    assert max(due) <= NOW - timedelta(seconds=settings.ANALYZER_DELAY_SEC)
+    assert all(e.second == 0 and e.minute % (rule_step(r).seconds // 60) == 0
+               for e, rids in due.items() for r in rids)  # fmt: skip
+
+    old = {r.rule_id: NOW - timedelta(hours=1) for r in analyzer.engine.rules}
+    _, skipped = analyzer.due_windows(old, NOW)
+    assert skipped > 0
+    recent = {r.rule_id: NOW - timedelta(minutes=3) for r in analyzer.engine.rules}
+    due, _ = analyzer.due_windows(recent, NOW)
+    assert sum(len(r) for r in due.values()) <= 3 * len(analyzer.engine.rules)
+
+
+def test_due_windows_resume_from_an_old_watermark_by_default() -> None:
+    analyzer = Analyzer()
+    due, _ = analyzer.due_windows({}, NOW)  # chưa có watermark: chỉ window mới nhất mỗi rule
+    assert sorted(r for rids in due.values() for r in rids) == [
+        r.rule_id for r in analyzer.engine.rules
+    ]
+    assert max(due) <= NOW - timedelta(seconds=settings.ANALYZER_DELAY_SEC)
+
+    old = {r.rule_id: NOW - timedelta(days=2) for r in analyzer.engine.rules}
+    due, skipped = analyzer.due_windows(old, NOW)  # sau 2 ngày dừng: không bỏ window nào
+    assert skipped == 0
+    for r in analyzer.engine.rules:
+        ends = sorted(e for e, rids in due.items() if r.rule_id in rids)
+        step = rule_step(r.rule_id)
+        assert ends[0] == old[r.rule_id] + step and len(ends) == settings.ANALYZER_MAX_CATCHUP
+
+
+def test_tick_advances_watermarks_and_does_not_duplicate(db: Session) -> None:
+    row = {"ts": NOW - timedelta(minutes=4), "ip": "198.51.100.9", "endpoint": "/",
+           "method": "GET", "status_code": 200, "resp_time_ms": 5}  # fmt: skip
+    db.execute(insert(Log), [row] * 400)
+    db.commit()
+
+    analyzer = Analyzer(lookback=timedelta(minutes=10))
+    first = analyzer.tick(db, NOW)
+    db.commit()
+    assert first.windows > 0 and first.events >= 1
+    again = analyzer.tick(db, NOW + timedelta(seconds=5))
+    db.commit()
+    assert again.windows == 0
+
+    events = db.query(Event).filter(Event.rule_id == "R-002").all()
+    assert [(e.ip, e.count) for e in events] == [("198.51.100.9", 400)]
+    wm = db.get(RuleWatermark, "R-002")
+    assert wm is not None and wm.last_end == datetime(2025, 10, 1, 11, 59, tzinfo=timezone.utc)
+
+    body = TestClient(app).get("/api/analyzer").json()
+    assert {r["rule_id"] for r in body["rules"]} == {r.rule_id for r in analyzer.engine.rules}
+    assert body["max_lag_sec"] >= 70
+
+
+def test_single_instance_lock() -> None:
+    with single_instance(get_engine()) as first, single_instance(get_engine()) as second:
+        assert first and not second
+    with single_instance(get_engine()) as again:
+        assert again
+
+
+def test_tick_creates_upcoming_log_partitions(db: Session) -> None:
+    analyzer = Analyzer()
+    analyzer.tick(db, NOW)
+    db.commit()
+    conn = db.connection()
+    names = {name for name, _, _ in list_partitions(conn)}
+    ahead = [partition_name(floor_ts(NOW, "day") + timedelta(days=d), "day") for d in range(4)]
+    assert set(ahead) <= names
+
+    for name in ahead:  # không để partition của test lại cho các test khác
+        conn.exec_driver_sql(f"DROP TABLE {name}")
+    db.commit()
+    analyzer.tick(db, NOW + timedelta(minutes=5))  # chưa tới lượt kiểm tra → không tạo lại
+    db.commit()
+    assert not {n for n, _, _ in list_partitions(db.connection())} & set(ahead)
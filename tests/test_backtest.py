@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log
+from backend.db.queries import aggregate_ip_stats
+from backend.services.backtest import daily_report, run_backtest, window_ends
+
+DAY = datetime(2025, 9, 1, tzinfo=timezone.utc)
+
+
+def _burst(ts: datetime, ip: str, n: int) -> list[dict[str, object]]:
+    row = {"ts": ts, "ip": ip, "endpoint": "/", "method": "GET",
+           "status_code": 200, "resp_time_ms": 5}  # fmt: skip
+    return [row] * n
+
+
+def test_window_ends_are_aligned_and_exclusive_of_start() -> None:
+    ends = window_ends(["R-002"], DAY, DAY + timedelta(minutes=3))
+    assert list(ends) == [DAY + timedelta(minutes=m) for m in (1, 2, 3)]
+
+
+@pytest.mark.usefixtures("restore_rules")
+def test_parallel_backtest_matches_sequential(db: Session, tmp_path: Path) -> None:
+    rows = (
+        _burst(DAY + timedelta(hours=23, minutes=50, seconds=10), "198.51.100.1", 450)
+        + _burst(DAY + timedelta(hours=24, minutes=5, seconds=10), "198.51.100.2", 420)
+        + _burst(DAY + timedelta(hours=24, minutes=30), "198.51.100.2", 410)
+    )
+    db.execute(insert(Log), rows)
+    aggregate_ip_stats(db)
+    db.commit()
+
+    start, end = DAY + timedelta(hours=23, minutes=30), DAY + timedelta(hours=25)
+    seq, windows = run_backtest(start, end, workers=1, shard=timedelta(hours=1))
+    par, par_windows = run_backtest(start, end, workers=2, shard=timedelta(minutes=7))
+    assert windows == par_windows > 0
+    assert [(m.rule_id, m.ip, m.count, m.first_seen) for m in par] == [
+        (m.rule_id, m.ip, m.count, m.first_seen) for m in seq
+    ]
+    report = {(d.isoformat(), r): v for (d, r), v in daily_report(par).items()}
+    assert report[("2025-09-01", "R-002")] == (1, 1)
+    # hai burst cách nhau > INCIDENT_IDLE_CLOSE_SEC → hai incident
+    assert report[("2025-09-02", "R-002")] == (2, 2)
+
+    tuned = tmp_path / "rules.yaml"
+    tuned.write_text("R-002:\n  window_sec: 60\n  req_per_ip_threshold: 430\n")
+    fewer, _ = run_backtest(start, end, workers=2, rules_path=str(tuned))
+    assert [(m.rule_id, m.ip) for m in fewer] == [("R-002", "198.51.100.1")]
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log
+from backend.services.log_ingestor import LogIngestor
+
+event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/search",
+    "method": "GET",
+    "status_code": 200,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "search",
+}
+
+
+@pytest.mark.parametrize("mode", ["orm", "core", "copy"])
+def test_save_batch_write_modes(db: Session, mode: str) -> None:
+    tricky = dict(event, query_params="q=a\tb\\c\nd", error=None, bytes_out=10)
+    svc = LogIngestor(write_mode=mode)
+    ok, bad = svc.validate_batch({"events": [event, tricky]})
+    assert not bad
+
+    assert svc.save_batch(db, ok) == 2
+    db.commit()
+
+    rows = db.query(Log).order_by(Log.id).all()
+    assert len(rows) == 2
+    assert rows[0].ts.isoformat() == "2025-01-01T00:00:00+00:00"
+    assert rows[1].query_params == "q=a\tb\\c\nd"
+    assert rows[1].error is None and rows[1].bytes_out == 10
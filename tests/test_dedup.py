@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+import backend.api.routes.logs as logs_routes
+from backend.core.config import settings
+from backend.db.database import session_scope
+from backend.db.models import Log
+from backend.main import app
+from backend.services.dedup import idempotency_store
+from backend.services.ingest_queue import IngestQueue
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "dev-key-1"}
+
+event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/login",
+    "method": "POST",
+    "status_code": 401,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "login",
+}
+
+
+def test_identical_events_without_key_are_all_stored(db: Session) -> None:
+    # flood 500 dòng giống hệt nhau: chính là thứ R-001/R-002 phải đếm
+    r = client.post("/api/ingest", json={"events": [event] * 500}, headers=HEADERS)
+    assert r.json()["accepted"] == 500
+    r = client.post("/api/ingest", json={"events": [event]}, headers=HEADERS)
+    assert r.json()["accepted"] == 1
+    assert db.query(Log).count() == 501
+
+
+def test_idempotency_key_replays_response(db: Session) -> None:
+    headers = dict(HEADERS, **{"Idempotency-Key": "batch-42"})
+    body = {"events": [dict(event, ip="198.51.100.9")]}
+    r1 = client.post("/api/ingest", json=body, headers=headers)
+    r2 = client.post("/api/ingest", json=body, headers=headers)
+
+    assert r2.headers.get("Idempotent-Replayed") == "true"
+    assert r2.json() == r1.json()
+    assert db.query(Log).count() == 1
+
+
+def test_concurrent_retries_with_same_key_write_once(db: Session) -> None:
+    h = idempotency_store.key_hash("dev-key-1", "batch-7")
+    with session_scope() as first:
+        assert idempotency_store.claim(first, h)
+        results: list[bool] = []
+        # retry thứ hai phải chờ transaction đầu tiên, rồi thua
+        t = threading.Thread(target=lambda: results.append(_claim_in_new_tx(h)))
+        t.start()
+        time.sleep(0.3)
+        assert t.is_alive() and not results
+        idempotency_store.complete(first, h, {"accepted": 3})
+    t.join(5)
+    assert results == [False]
+    assert idempotency_store.lookup(db, h) == {"accepted": 3}
+
+
+def _claim_in_new_tx(h: str) -> bool:
+    with session_scope() as s:
+        return idempotency_store.claim(s, h)
+
+
+def test_write_behind_records_key_with_the_rows(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    q = IngestQueue(max_batches=10, flush_max_age_ms=60_000)
+    monkeypatch.setattr(settings, "INGEST_WRITE_BEHIND", True)
+    monkeypatch.setattr(logs_routes, "ingest_queue", q)
+    headers = dict(HEADERS, **{"Idempotency-Key": "wb-1"})
+    body = {"events": [event, event]}
+
+    q.start()
+    r1 = client.post("/api/ingest", json=body, headers=headers)
+    r2 = client.post("/api/ingest", json=body, headers=headers)  # chưa flush: cũng được enqueue
+    q.stop()
+
+    assert r1.status_code == r2.status_code == 202
+    assert db.query(Log).count() == 2  # batch thứ hai thua claim trong transaction của flusher
+    r3 = client.post("/api/ingest", json=body, headers=headers)
+    assert r3.headers.get("Idempotent-Replayed") == "true" and r3.json() == r1.json()
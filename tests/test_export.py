@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import csv
+import io
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import anyio
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, insert, literal_column, select
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.models import Log
+from backend.main import app
+from backend.services.exporter import Export, encode_csv, stream
+
+T0 = datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _seed(db: Session, n: int) -> None:
+    rows = [{"ts": T0 + timedelta(seconds=i), "ip": f"198.51.100.{i % 2}", "endpoint": "/a,b",
+             "method": "GET", "status_code": 200, "resp_time_ms": i} for i in range(n)]  # fmt: skip
+    db.execute(insert(Log), rows)
+    db.commit()
+
+
+def test_export_streams_same_rows_as_paged_api(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _seed(db, 25)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_ROWS", 4)  # nhiều batch / chunk
+    client = TestClient(app)
+    params = {"ip": "198.51.100.0", "ts_from": "2025-10-01T12:00:03Z"}
+
+    paged = client.get("/api/logs", params=dict(params, limit=1000)).json()["items"]
+    resp = client.get("/api/logs/export", params=params)
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    lines = [orjson.loads(x) for x in resp.content.splitlines()]
+    assert [r["id"] for r in lines] == [r["id"] for r in paged] and len(lines) == 11
+    assert datetime.fromisoformat(lines[0]["ts"]) == datetime.fromisoformat(paged[0]["ts"])
+
+    resp = client.get("/api/logs/export", params=dict(params, format="csv", order_by="id"))
+    table = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [int(r["id"]) for r in table] == sorted(r["id"] for r in paged)
+    assert table[0]["endpoint"] == "/a,b" and table[0]["user_id"] == ""
+
+    assert client.get("/api/events/export").content == b""
+    assert client.get("/api/logs/export", params={"format": "xml"}).status_code == 400
+
+
+def test_csv_neutralizes_formula_cells() -> None:
+    fields = ("endpoint", "ua", "resp_time_ms")
+    rows = [
+        {"endpoint": '=HYPERLINK("http://x")', "ua": "@SUM(A1)", "resp_time_ms": -1},
+        {"endpoint": "/a", "ua": "-2+3", "resp_time_ms": 5},
+        {"endpoint": "+1", "ua": "\tcmd", "resp_time_ms": 0},
+    ]
+    got = list(csv.reader(io.StringIO(encode_csv(rows, fields).decode())))
+    assert got == [
+        ['\'=HYPERLINK("http://x")', "'@SUM(A1)", "-1"],
+        ["/a", "'-2+3", "5"],
+        ["'+1", "'\tcmd", "0"],
+    ]
+
+
+def test_cancel_stops_running_query() -> None:
+    slow = select(literal_column("1").label("x"), func.pg_sleep(30).label("s"))
+    export = Export(slow, ("x",), "ndjson")
+    errors: list[Exception] = []
+
+    def run() -> None:
+        try:
+            list(export.chunks())
+        except Exception as e:  # noqa: BLE001 - báo lỗi qua assert ở thread chính
+            errors.append(e)
+
+    t = threading.Thread(target=run)
+    t0 = time.monotonic()
+    t.start()
+    time.sleep(0.5)
+    export.cancel()
+    t.join(10)
+    assert not t.is_alive() and not errors and time.monotonic() - t0 < 5
+
+
+def test_abandoned_stream_cancels_export(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    _seed(db, 10)
+    monkeypatch.setattr(settings, "EXPORT_BATCH_ROWS", 2)
+    export = Export(select(Log.id).order_by(Log.id), ("id",), "ndjson")
+
+    async def first_chunk_then_disconnect() -> bytes:
+        body = stream(export)
+        chunk = await body.__anext__()
+        await body.aclose()  # như khi client ngắt kết nối giữa chừng
+        return chunk
+
+    assert len(anyio.run(first_chunk_then_disconnect).splitlines()) == 2
+    assert export._cancelled and export._dbapi_conn is None and export.rows == 2
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from typing import Any
+
+from backend.services.fast_validator import (
+    INVALID_TS,
+    INVALID_TYPE,
+    MISSING_FIELD,
+    NOT_OBJECT,
+    fast_validator,
+)
+from backend.services.log_ingestor import LogIngestor, event_to_row
+
+valid_event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/login",
+    "method": "POST",
+    "status_code": 401,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "login",
+}
+
+
+def _variant(**kw: Any) -> dict[str, Any]:
+    e = dict(valid_event, **kw)
+    return {k: v for k, v in e.items() if v is not ...}
+
+
+CASES: list[Any] = [
+    valid_event,
+    _variant(ts="2025-01-01 08:30:00"),  # naive → UTC
+    _variant(ts="2025-01-01T00:00:00.123+07:00"),
+    _variant(ts=1700000000),
+    _variant(ts="not-a-date"),
+    _variant(ts=...),
+    _variant(status_code="404"),
+    _variant(status_code=4.5),
+    _variant(resp_time_ms=True),
+    _variant(ip=123),
+    _variant(ua=None),
+    _variant(bytes_out=None, query_params="id=1"),
+    "not an object",
+    _variant(ts="2025-01-01T00:00:00 +07:00"),  # fromisoformat nhận, LogEvent từ chối
+    _variant(ts="2025-01-01T00:00:00.1Z"),  # ngược lại (Python 3.10)
+]
+
+
+def test_matches_pydantic_decisions_per_event() -> None:
+    svc = LogIngestor()
+    batch = fast_validator.validate(CASES)
+    for i, e in enumerate(CASES):
+        ok, _ = svc.validate_batch({"events": [e]}) if isinstance(e, dict) else ([], [e])
+        if ok:
+            assert i in batch.indexes, f"case {i} should be accepted"
+            assert batch.rows[batch.indexes.index(i)] == event_to_row(ok[0])
+        else:
+            assert i not in batch.indexes, f"case {i} should be rejected"
+
+
+def test_string_ts_column_matches_pydantic() -> None:
+    # cột ts toàn chuỗi → nhánh parse cả cột; dạng lạ phải rơi về TypeAdapter
+    events = [valid_event, *CASES[-2:]]
+    batch = fast_validator.validate(events)
+    assert batch.indexes == [0, 2]
+    assert [r.reason for r in batch.rejects] == [INVALID_TS]
+
+
+def test_reject_reasons() -> None:
+    batch = fast_validator.validate(CASES)
+    reasons = {r.index: (r.reason, r.field) for r in batch.rejects}
+    assert reasons[4] == (INVALID_TS, "ts")
+    assert reasons[5] == (MISSING_FIELD, "ts")
+    assert reasons[7] == (INVALID_TYPE, "status_code")
+    assert reasons[12] == (NOT_OBJECT, None)
+
+
+def test_one_bad_event_does_not_drop_batch() -> None:
+    batch = LogIngestor().validate_rows({"events": [valid_event, _variant(ip=...)]})
+    assert len(batch.rows) == 1
+    assert batch.reject_counts() == {MISSING_FIELD: 1}
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.core.hll import HyperLogLog, merge_all, precision_for, std_error
+from backend.db.models import DistinctSketch, Log
+from backend.db.queries import aggregate_ip_stats, distinct_counts
+from backend.services.anomaly_detector import RuleEngine
+
+
+def test_estimate_stays_within_error_bound_and_merge_is_union() -> None:
+    p = precision_for(0.02)
+    assert std_error(p) <= 0.02
+    a = HyperLogLog(p).update(f"/item/{i}" for i in range(30_000))
+    b = HyperLogLog(p).update(f"/item/{i}" for i in range(20_000, 50_000))
+    for sketch, true in ((a, 30_000), (b, 30_000), (a.merge(b), 50_000)):
+        assert abs(sketch.estimate() - true) <= 4 * std_error(p) * true
+    small = HyperLogLog(p).update(["/a", "/b", "/c", "/a"])
+    assert small.estimate() == 3  # linear counting: gần như chính xác khi ít phần tử
+
+    restored = HyperLogLog.from_bytes(a.to_bytes())
+    assert restored.p == p and restored.registers == a.registers
+    assert len(small.to_bytes()) < 100
+
+
+def test_fold_matches_a_sketch_built_at_the_lower_precision() -> None:
+    items = [f"10.0.{i // 256}.{i % 256}" for i in range(5_000)]
+    fine = HyperLogLog(14).update(items)
+    coarse = HyperLogLog(10).update(items)
+    assert fine.fold(10).registers == coarse.registers
+    merged = merge_all([fine, HyperLogLog(12).update(items[:10])])
+    assert merged is not None and merged.p == 12
+    assert merged.registers == HyperLogLog(12).update(items).registers
+
+
+def _row(ts: datetime, ip: str, endpoint: str, status: int) -> dict[str, Any]:
+    return {
+        "ts": ts,
+        "ip": ip,
+        "endpoint": endpoint,
+        "method": "GET",
+        "status_code": status,
+        "resp_time_ms": 5,
+    }
+
+
+def test_distinct_rules_read_minute_sketches(db: Session) -> None:
+    now = datetime.now(timezone.utc).replace(second=30, microsecond=0)
+    rows = []
+    # scanner: 60 endpoint khác nhau, mỗi endpoint 2 lần ở 2 phút khác nhau
+    for i in range(120):
+        rows.append(_row(now - timedelta(minutes=i % 7), "203.0.113.9", f"/p/{i % 60}", 404))
+    # 25 IP, mỗi IP 1 lần login sai → không IP nào đủ ngưỡng R-001 (3)
+    for i in range(25):
+        rows.append(_row(now - timedelta(minutes=i % 4), f"198.51.100.{i}", "/login", 401))
+    db.execute(insert(Log), rows)
+    db.commit()
+
+    aggregate_ip_stats(db, now=now)
+    db.commit()
+    # mỗi phút 1 sketch/IP; tổng n_items (120 > 60) chỉ là cận trên
+    scan = db.query(DistinctSketch).filter_by(kind="ip_endpoints", key="203.0.113.9").all()
+    assert len(scan) == 7 and sum(s.n_items for s in scan) == 120
+
+    start = now - timedelta(minutes=10)
+    [c] = distinct_counts(db, "ip_endpoints", start, now, min_items=50)
+    assert c.key == "203.0.113.9" and abs(c.estimate - 60) <= 60 * 3 * c.std_error
+    assert distinct_counts(db, "ip_endpoints", start, now, min_items=121) == []
+
+    matches = RuleEngine().evaluate(db, start, now + timedelta(minutes=1))
+    by_rule = {m.rule_id: m for m in matches}
+    assert by_rule["R-006"].ip == "203.0.113.9" and by_rule["R-006"].count == c.estimate
+    assert by_rule["R-007"].endpoint == "/login" and abs(by_rule["R-007"].count - 25) <= 1
+    assert "R-001" not in by_rule
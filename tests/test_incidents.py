@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.models import Event, Log
+from backend.services.anomaly_detector import RuleEngine, RuleMatch, write_events
+from backend.services.incidents import incident_cache
+
+T0 = datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _m(start_sec: int, end_sec: int, count: int, ip: str = "198.51.100.1") -> RuleMatch:
+    return RuleMatch(
+        rule_id="R-002",
+        severity=4,
+        first_seen=T0 + timedelta(seconds=start_sec),
+        last_seen=T0 + timedelta(seconds=end_sec),
+        ip=ip,
+        count=count,
+        evidence=f"{count} hits",
+    )
+
+
+def _incidents(db: Session) -> list[tuple[int, int, bool]]:
+    rows = db.query(Event).order_by(Event.id).all()
+    return [(e.count, int((e.last_seen - T0).total_seconds()), e.is_open) for e in rows]
+
+
+def test_overlapping_matches_extend_one_incident(db: Session) -> None:
+    incident_cache.clear()
+    assert write_events(db, [_m(0, 300, 600)]) == 1
+    write_events(db, [_m(0, 300, 600)])  # chạy lại cùng window → không đổi
+    write_events(db, [_m(60, 360, 600)])  # window trượt 60s → +1/5 số hit
+    write_events(db, [_m(400, 400, 7), _m(410, 420, 3)])  # nối tiếp, gộp trong batch
+    db.commit()
+    assert _incidents(db) == [(600 + 120 + 10, 420, True)]
+
+
+def test_idle_incident_is_closed_and_a_new_one_opened(db: Session) -> None:
+    incident_cache.clear()
+    idle = settings.INCIDENT_IDLE_CLOSE_SEC
+    write_events(db, [_m(0, 60, 10), _m(0, 60, 5, ip="198.51.100.2")])
+    write_events(db, [_m(60 + idle + 1, 60 + idle + 1, 4)])
+    db.commit()
+    assert _incidents(db) == [(10, 60, False), (5, 60, False), (4, 61 + idle, True)]
+
+    # incident mở bởi process khác (cache không biết): SQL tự kiểm tra khoảng cách
+    db.query(Event).filter(Event.ip == "198.51.100.2").update({"is_open": True})
+    write_events(db, [_m(2 * idle, 2 * idle, 1, ip="198.51.100.2")])
+    db.commit()
+    assert db.query(Event).filter(Event.ip == "198.51.100.2").count() == 2
+    assert [e.count for e in db.query(Event).filter(Event.is_open).order_by(Event.id)] == [4, 1]
+
+
+def test_rerunning_a_window_does_not_duplicate_events(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    row = {"ts": now - timedelta(seconds=5), "ip": "198.51.100.9", "endpoint": "/",
+           "method": "GET", "status_code": 200, "resp_time_ms": 5}  # fmt: skip
+    db.execute(insert(Log), [row] * 400)
+    engine = RuleEngine()
+    for _ in range(3):
+        engine.process_window(db, now - timedelta(minutes=5), now)
+    db.commit()
+    events = db.query(Event).filter(Event.rule_id == "R-002").all()
+    assert [(e.ip, e.count) for e in events] == [("198.51.100.9", 400)]
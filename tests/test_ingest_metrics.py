@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from backend.db.models import IngestMetric
+from backend.services.ingest_metrics import IngestMetricsRecorder, LatencyHistogram
+
+
+def test_histogram_percentiles_within_relative_error() -> None:
+    h = LatencyHistogram()
+    values = list(range(1, 100_001))
+    random.shuffle(values)
+    for v in values:
+        h.record(v)
+    for q in (0.5, 0.95, 0.99):
+        exact = q * 100_000
+        assert abs(h.percentile(q) - exact) / exact < 0.04
+
+
+def test_one_row_per_minute_and_worker(db: Session) -> None:
+    rec = IngestMetricsRecorder(clock=lambda: 1_700_000_000.0)
+    for ms in range(1, 101):
+        rec.record(accepted=10, dropped=1, latency_ms=ms, batch_size=11)
+    rec.record_dropped(5)
+
+    assert rec.flush(db) == 0  # phút hiện tại chưa kết thúc → không ghi gì
+    assert rec.flush(db, include_current=True) == 1
+    db.commit()
+
+    rows = db.query(IngestMetric).all()
+    assert len(rows) == 1
+    m = rows[0]
+    assert (m.count_ok, m.count_dropped, m.avg_batch_size) == (1000, 105, 11)
+    assert 48 <= m.ingest_latency_p50_ms <= 52
+    assert 93 <= m.ingest_latency_p95_ms <= 97
+    assert 97 <= m.ingest_latency_p99_ms <= 100
+
+
+def test_second_flush_of_a_minute_merges_histograms(db: Session) -> None:
+    rec = IngestMetricsRecorder(clock=lambda: 1_700_000_000.0)
+    for ms in range(1, 51):
+        rec.record(accepted=1, dropped=0, latency_ms=ms, batch_size=10)
+    assert rec.flush(db, include_current=True) == 1
+    db.commit()
+    for ms in range(51, 101):  # cùng phút, flush lại (vd. lúc shutdown)
+        rec.record(accepted=1, dropped=0, latency_ms=ms, batch_size=30)
+    assert rec.flush(db, include_current=True) == 1
+    db.commit()
+
+    m = db.query(IngestMetric).one()
+    assert (m.count_ok, m.avg_batch_size) == (100, 20)
+    assert 48 <= m.ingest_latency_p50_ms <= 52  # không phải max(p50 của từng lần) ≈ 75
+    assert 97 <= m.ingest_latency_p99_ms <= 100
+
+
+def test_failed_flush_keeps_minutes_for_the_next_one(db: Session) -> None:
+    rec = IngestMetricsRecorder(clock=lambda: 1_700_000_000.0)
+    rec.record(accepted=3, dropped=0, latency_ms=5, batch_size=3)
+    broken = Session(bind=create_engine("postgresql+psycopg2://nobody@127.0.0.1:1/none"))
+    with pytest.raises(OperationalError):
+        rec.flush(broken, include_current=True)
+    rec.record(accepted=2, dropped=1, latency_ms=5, batch_size=3)
+
+    assert rec.flush(db, include_current=True) == 1
+    db.commit()
+    m = db.query(IngestMetric).one()
+    assert (m.count_ok, m.count_dropped) == (5, 1)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import backend.api.routes.logs as logs_routes
+from backend.core.config import settings
+from backend.db.models import Log
+from backend.main import app
+from backend.services.ingest_queue import IngestQueue, QueueFull, StoreUnavailable, _Pending
+from backend.services.log_ingestor import LogIngestor, event_to_row
+
+event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/login",
+    "method": "POST",
+    "status_code": 401,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "login",
+}
+
+
+def _rows(n: int) -> list[tuple]:
+    ok, _ = LogIngestor().validate_batch({"events": [event] * n})
+    return [event_to_row(e) for e in ok]
+
+
+def test_flusher_merges_batches_and_drains_on_stop(db: Session) -> None:
+    q = IngestQueue(max_batches=10, flush_max_events=1000, flush_max_age_ms=60_000)
+    q.start()
+    for _ in range(3):
+        q.submit(_rows(2))
+    q.stop()  # flush_max_age is long: rows only land because stop() drains
+
+    assert db.query(Log).count() == 6
+
+
+def test_queue_full_raises_with_retry_after() -> None:
+    q = IngestQueue(max_batches=1, flush_max_age_ms=2500)
+    q.submit(_rows(1))
+    with pytest.raises(QueueFull) as exc:
+        q.submit(_rows(1))
+    assert exc.value.retry_after_sec == 3
+
+
+def test_ingest_endpoint_returns_202_then_429(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "INGEST_WRITE_BEHIND", True)
+    monkeypatch.setattr(logs_routes, "ingest_queue", IngestQueue(max_batches=1))
+    client = TestClient(app)
+    headers = {"X-API-Key": "dev-key-1"}
+
+    r = client.post("/api/ingest", json={"events": [event]}, headers=headers)
+    assert r.status_code == 202
+    assert r.json()["accepted"] == 1
+
+    r = client.post("/api/ingest", json={"events": [event]}, headers=headers)
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "1"
+
+
+def test_failed_flush_is_retried_and_refuses_new_batches(db: Session) -> None:
+    calls = 0
+    real = IngestQueue()._session_factory
+
+    @contextmanager
+    def flaky() -> Iterator[Session]:
+        nonlocal calls
+        calls += 1
+        if calls <= 2:
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+        with real() as s:
+            yield s
+
+    q = IngestQueue(retries=3, retry_backoff_ms=1, session_factory=flaky)
+    q._flush([_Pending(_rows(2), 0.0)])
+    assert calls == 3 and not q.failing and q.lost_events == 0
+    assert db.query(Log).count() == 2
+
+    calls = -10  # hỏng hẳn: hết lượt retry thì bỏ batch và đếm
+    q._flush([_Pending(_rows(3), 0.0)])
+    assert q.failing and q.lost_events == 3
+    with pytest.raises(StoreUnavailable):
+        q.submit(_rows(1))
+
+
+def test_ingest_recovers_once_the_database_answers_again(db: Session) -> None:
+    down = True
+    real = IngestQueue()._session_factory
+
+    @contextmanager
+    def outage() -> Iterator[Session]:
+        if down:
+            raise OperationalError("SELECT 1", {}, Exception("connection refused"))
+        with real() as s:
+            yield s
+
+    q = IngestQueue(retries=0, flush_max_age_ms=100, session_factory=outage)
+    q._flush([_Pending(_rows(1), 0.0)])  # hết retry: batch mất, queue vào trạng thái failing
+    q._probe()
+    assert q.failing
+
+    q.start()
+    down = False
+    deadline = time.monotonic() + 5
+    while q.failing and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not q.failing  # flusher rảnh tự probe, không cần batch mới
+
+    q.submit(_rows(2))
+    q.stop()
+    assert q.lost_events == 1
+    assert db.query(Log).count() == 2
+
+
+def test_ingest_endpoint_returns_503_while_flushes_fail(monkeypatch: pytest.MonkeyPatch) -> None:
+    q = IngestQueue(max_batches=10)
+    q._failing = True
+    monkeypatch.setattr(settings, "INGEST_WRITE_BEHIND", True)
+    monkeypatch.setattr(logs_routes, "ingest_queue", q)
+    r = TestClient(app).post(
+        "/api/ingest", json={"events": [event]}, headers={"X-API-Key": "dev-key-1"}
+    )
+    assert r.status_code == 503 and r.headers["Retry-After"] == "1"
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import gzip
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.models import Log
+from backend.main import app
+from backend.services.ndjson_stream import LineSplitter, LineTooLong
+
+client = TestClient(app)
+HEADERS = {"X-API-Key": "dev-key-1", "Content-Type": "application/x-ndjson"}
+
+event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/login",
+    "method": "POST",
+    "status_code": 401,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "login",
+}
+
+
+def _body() -> bytes:
+    good = [orjson.dumps(dict(event, resp_time_ms=i)) for i in range(4)]
+    bad_schema = {k: v for k, v in event.items() if k != "ip"}
+    lines = good[:3] + [b"{not json", b"", orjson.dumps(bad_schema), good[0]]  # 7: lặp dòng 1
+    return b"\n".join(lines) + b"\n" + good[3]  # last line without newline
+
+
+@pytest.mark.parametrize("gz", [False, True])
+def test_stream_ingest_reports_per_line_rejects(
+    db: Session, gz: bool, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "INGEST_STREAM_CHUNK_EVENTS", 2)
+    headers = dict(HEADERS, **({"Content-Encoding": "gzip"} if gz else {}))
+    body = gzip.compress(_body()) if gz else _body()
+
+    r = client.post("/api/ingest/stream", content=body, headers=headers)
+    assert r.status_code == 200
+    j = r.json()
+    assert j["accepted"] == 5  # dòng lặp vẫn được ghi: không lọc theo nội dung
+    assert j["dropped"] == 2
+    assert j["rejects"]["invalid_json"] == 1
+    assert j["rejects"]["invalid_schema"] == 1
+    assert j["rejected_lines"] == [4, 6]
+    assert db.query(Log).count() == 5
+
+
+def test_stream_ingest_rejects_other_content_types() -> None:
+    headers = dict(HEADERS, **{"Content-Type": "application/json"})
+    r = client.post("/api/ingest/stream", content=b"{}", headers=headers)
+    assert r.status_code == 415
+
+
+def test_line_splitter_bounds_long_lines() -> None:
+    sp = LineSplitter(max_line_bytes=8)
+    out = list(sp.feed(b"short\n0123456789")) + list(sp.feed(b"abc\nok\n"))
+    assert out[0] == b"short"
+    assert isinstance(out[1], LineTooLong)
+    assert out[2:] == [b"ok"]
+
+
+def test_stream_ingest_gzip_members_and_truncation(db: Session) -> None:
+    headers = dict(HEADERS, **{"Content-Encoding": "gzip"})
+    lines = [orjson.dumps(dict(event, resp_time_ms=i)) + b"\n" for i in range(3)]
+    # cat a.gz b.gz: nhiều member nối nhau vẫn là một body gzip hợp lệ
+    body = b"".join(gzip.compress(x) for x in lines)
+    r = client.post("/api/ingest/stream", content=body, headers=headers)
+    assert r.status_code == 200 and r.json()["lines"] == 3
+
+    r = client.post(
+        "/api/ingest/stream", content=gzip.compress(b"".join(lines))[:-6], headers=headers
+    )
+    assert r.status_code == 400
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from backend.db.models import IPStat, Log, RollupWatermark
+from backend.db.queries import IP_STATS_WATERMARK, aggregate_ip_stats
+
+T0 = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+NOW = T0 + timedelta(hours=1)  # phút "gần đây" không trùng dữ liệu test
+
+
+def _log(ts: datetime, status: int, ip: str = "203.0.113.10", endpoint: str = "/login") -> Log:
+    return Log(ts=ts, ip=ip, endpoint=endpoint, method="GET", status_code=status, resp_time_ms=5)
+
+
+def _buckets(db: Session) -> dict[tuple, tuple[int, int, int]]:
+    db.expire_all()
+    return {
+        (s.bucket_start, s.ip, s.endpoint): (s.req_count, s.error_4xx, s.error_5xx)
+        for s in db.query(IPStat)
+    }
+
+
+def test_rollup_is_incremental_idempotent_and_handles_late_rows(db: Session) -> None:
+    db.add_all(
+        [
+            _log(T0 + timedelta(seconds=5), 401),
+            _log(T0 + timedelta(seconds=50), 200),
+            _log(T0 + timedelta(seconds=70), 503),
+            _log(T0 + timedelta(seconds=80), 200, endpoint="/"),
+        ]
+    )
+    db.commit()
+
+    assert aggregate_ip_stats(db, now=NOW) == 3
+    db.commit()
+    key = ("203.0.113.10", "/login")
+    expected = {
+        (T0, *key): (2, 1, 0),
+        (T0 + timedelta(minutes=1), *key): (1, 0, 1),
+        (T0 + timedelta(minutes=1), "203.0.113.10", "/"): (1, 0, 0),
+    }
+    assert _buckets(db) == expected
+
+    # chạy lại: không có log mới → không ghi gì, kết quả giữ nguyên
+    assert aggregate_ip_stats(db, now=NOW) == 0
+    assert aggregate_ip_stats(db, T0, T0 + timedelta(minutes=2), now=NOW) == 0
+    db.commit()
+    assert _buckets(db) == expected
+
+    # dữ liệu đến trễ cho phút đã rollup → phút đó được tính lại toàn bộ
+    db.add(_log(T0 + timedelta(seconds=30), 404))
+    db.commit()
+    assert aggregate_ip_stats(db, now=NOW) == 1
+    db.commit()
+    assert _buckets(db)[(T0, *key)] == (3, 2, 0)
+    wm = db.get(RollupWatermark, IP_STATS_WATERMARK)
+    assert wm is not None and wm.last_id == 5
+
+
+def test_row_committed_after_a_higher_id_is_rolled_up(db: Session) -> None:
+    engine = db.get_bind()
+    with Session(engine) as slow:  # vd. COPY dài: lấy id trước nhưng commit sau
+        slow.add(_log(T0 + timedelta(seconds=5), 401))
+        slow.flush()
+        db.add(_log(T0 + timedelta(minutes=5), 200))
+        db.commit()
+
+        aggregate_ip_stats(db, now=NOW)
+        db.commit()
+        wm = db.get(RollupWatermark, IP_STATS_WATERMARK)
+        assert wm is not None and wm.last_id == 2 and wm.safe_id == 0
+        slow.commit()
+
+    assert aggregate_ip_stats(db, now=NOW) == 1  # phút T0 nằm ngoài ROLLUP_RECHECK_SEC
+    db.commit()
+    assert _buckets(db)[(T0, "203.0.113.10", "/login")] == (1, 1, 0)
+    db.expire_all()
+    wm = db.get(RollupWatermark, IP_STATS_WATERMARK)
+    assert wm is not None and wm.safe_id == 2
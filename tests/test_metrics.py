@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy.orm import Session
+
+from backend.db.models import RuleWatermark
+from backend.main import app
+
+EVENT = {"ts": "2025-01-01T00:00:00Z", "source": "web", "host": "shop.example.com",
+         "ip": "203.0.113.10", "endpoint": "/login", "method": "POST", "status_code": 401,
+         "resp_time_ms": 42, "ua": "Mozilla/5.0", "action_type": "login"}  # fmt: skip
+
+
+def _samples(text: str) -> dict[tuple[str, tuple[tuple[str, str], ...]], float]:
+    return {
+        (s.name, tuple(sorted(s.labels.items()))): s.value
+        for fam in text_string_to_metric_families(text)
+        for s in fam.samples
+    }
+
+
+def test_metrics_cover_requests_ingest_db_and_analyzer(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    db.add(RuleWatermark(rule_id="R-002", last_end=now - timedelta(minutes=2), lag_sec=0,
+                         updated_at=now, avg_wall_ms=12.5, avg_db_ms=10.0, avg_rows=3))  # fmt: skip
+    db.commit()
+    client = TestClient(app)
+    before = _samples(client.get("/metrics").text)
+    events = [dict(EVENT, ip=f"203.0.113.{i}") for i in range(3)]  # khác nhau → không bị dedup
+    r = client.post("/api/ingest", json={"events": events}, headers={"X-API-Key": "dev-key-1"})
+    assert r.status_code == 200
+
+    resp = client.get("/metrics")
+    assert resp.headers["content-type"].startswith("text/plain")
+    after = _samples(resp.text)
+
+    def delta(name: str, **labels: str) -> float:
+        key = (name, tuple(sorted(labels.items())))
+        return after.get(key, 0) - before.get(key, 0)
+
+    route = {"method": "POST", "route": "/api/ingest", "status": "200"}
+    assert delta("http_request_duration_seconds_count", **route) == 1
+    assert delta("ingest_events_total", outcome="accepted") == 3
+    assert delta("ingest_batch_size_count") == 1
+    assert delta("db_query_duration_seconds_count", operation="INSERT") >= 1
+    assert delta("db_pool_checkout_wait_seconds_count") >= 1
+    assert after[("db_pool_connections_in_use", ())] >= 0
+    assert after[("analyzer_lag_seconds", (("rule_id", "R-002"),))] >= 120
+    assert after[("analyzer_rule_wall_seconds", (("rule_id", "R-002"),))] == 0.0125
+
+
+def test_multiprocess_mode_sums_workers(tmp_path: Path) -> None:
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = "from backend.core import metrics; metrics.record_ingest({}, 1, 10)"
+    for accepted in (5, 7):  # hai "worker" ghi vào cùng thư mục rồi thoát
+        subprocess.run([sys.executable, "-c", worker.format(accepted)], env=env, check=True)
+    out = subprocess.run(
+        [sys.executable, "-c", "from backend.core import metrics; print(metrics.render()[0].decode())"],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout  # fmt: skip
+    samples = _samples(out)
+    assert samples[("ingest_events_total", (("outcome", "accepted"),))] == 12
+    assert samples[("ingest_batch_size_count", ())] == 2
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Event, Log
+from backend.main import app
+
+T0 = datetime(2025, 10, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _pages(client: TestClient, path: str, **params: Any) -> list[list[dict[str, Any]]]:
+    pages, cursor = [], None
+    while True:
+        body = client.get(path, params=dict(params, cursor=cursor) if cursor else params).json()
+        pages.append(body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_logs_keyset_pages_are_complete_and_filtered(db: Session) -> None:
+    # 3 dòng cùng ts mỗi giây → thứ tự phải phân định bằng id
+    rows = [{"ts": T0 + timedelta(seconds=i // 3), "ip": f"198.51.100.{i % 2}", "endpoint": "/",
+             "method": "GET", "status_code": 200, "resp_time_ms": 5} for i in range(25)]  # fmt: skip
+    db.execute(insert(Log), rows)
+    db.commit()
+    client = TestClient(app)
+
+    pages = _pages(client, "/api/logs", limit=10)
+    assert [len(p) for p in pages] == [10, 10, 5]
+    items = [r for p in pages for r in p]
+    assert len({r["id"] for r in items}) == 25
+    keys = [(r["ts"], r["id"]) for r in items]
+    assert keys == sorted(keys, reverse=True)
+
+    asc_ids = [r["id"] for p in _pages(client, "/api/logs", limit=7, order_by="id") for r in p]
+    assert asc_ids == sorted(r["id"] for r in items)
+
+    window = {
+        "ts_from": "2025-10-01T12:00:02Z",
+        "ts_to": "2025-10-01T12:00:05Z",
+        "ip": "198.51.100.0",
+    }
+    got = [r for p in _pages(client, "/api/logs", limit=2, **window) for r in p]
+    assert got and all(r["ip"] == "198.51.100.0" for r in got)
+    assert all("12:00:02" <= r["ts"][11:19] < "12:00:05" for r in got)
+    assert len(got) == sum(1 for i in range(6, 15) if i % 2 == 0)
+
+
+def test_events_cursor_follows_order_and_rejects_bad_cursor(db: Session) -> None:
+    rows = [{"rule_id": "R-002", "severity": 4, "ip": f"203.0.113.{i}", "endpoint": None,
+             "first_seen": T0, "last_seen": T0 + timedelta(minutes=i % 4), "count": i % 3,
+             "is_open": False} for i in range(12)]  # fmt: skip
+    db.execute(insert(Event), rows)
+    db.commit()
+    client = TestClient(app)
+
+    pages = _pages(client, "/api/events", limit=5, order_by="-count")
+    items = [r for p in pages for r in p]
+    assert len({r["id"] for r in items}) == 12
+    assert [r["count"] for r in items] == sorted((r["count"] for r in items), reverse=True)
+
+    first = client.get("/api/events", params={"limit": 5, "order_by": "-count"}).json()
+    other = client.get(
+        "/api/events", params={"order_by": "first_seen", "cursor": first["next_cursor"]}
+    )
+    assert other.status_code == 400
+    assert client.get("/api/events", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/logs", params={"ts_from": "yesterday"}).status_code == 400
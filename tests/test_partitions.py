@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+
+from backend.db.database import get_engine
+from backend.db.models import Log
+from backend.db.partitions import (
+    drop_expired_partitions,
+    ensure_partitions,
+    list_partitions,
+    partition_name,
+)
+
+DAY = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def conn() -> Iterator[Connection]:
+    with get_engine().connect() as c:
+        yield c
+        c.rollback()
+        # dọn các partition test tạo ra (TRUNCATE giữa các test không xóa bảng con)
+        for name, start, _ in list_partitions(c):
+            if start < datetime(2026, 1, 1, tzinfo=timezone.utc) - timedelta(days=30):
+                c.exec_driver_sql(f"DROP TABLE {name}")
+        c.commit()
+
+
+def _insert(conn: Connection, ts: datetime) -> None:
+    conn.execute(
+        Log.__table__.insert().values(
+            ts=ts, ip="203.0.113.10", endpoint="/", method="GET", status_code=200, resp_time_ms=1
+        )
+    )
+
+
+def _placement(conn: Connection) -> dict[str, int]:
+    rows = conn.exec_driver_sql("SELECT tableoid::regclass::text, count(*) FROM logs GROUP BY 1")
+    return {name: n for name, n in rows}
+
+
+def test_ensure_partitions_moves_rows_out_of_default(conn: Connection) -> None:
+    _insert(conn, DAY + timedelta(hours=3))
+    assert _placement(conn) == {"logs_default": 1}
+
+    created = ensure_partitions(conn, DAY, DAY + timedelta(days=1), "day")
+    assert created == ["logs_p20250101", "logs_p20250102"]
+    assert _placement(conn) == {"logs_p20250101": 1}
+    assert ensure_partitions(conn, DAY, DAY + timedelta(days=1), "day") == []
+
+
+def test_window_query_prunes_to_one_partition(conn: Connection) -> None:
+    ensure_partitions(conn, DAY, DAY + timedelta(days=2), "day")
+    q = select(Log.ip).where(Log.ts >= DAY + timedelta(hours=1), Log.ts < DAY + timedelta(hours=2))
+    plan = "\n".join(
+        conn.exec_driver_sql(
+            "EXPLAIN " + str(q.compile(conn, compile_kwargs={"literal_binds": True}))
+        ).scalars()
+    )
+    assert partition_name(DAY, "day") in plan
+    assert "logs_p20250102" not in plan and "logs_default" not in plan
+
+
+def test_retention_drops_whole_partitions(conn: Connection) -> None:
+    ensure_partitions(conn, DAY, DAY + timedelta(days=2), "day")
+    for d in range(3):
+        _insert(conn, DAY + timedelta(days=d, hours=1))
+    _insert(conn, DAY - timedelta(days=10))  # → logs_default
+
+    dropped, deleted = drop_expired_partitions(conn, 1, now=DAY + timedelta(days=3))
+    assert dropped == ["logs_p20250101", "logs_p20250102"]
+    assert deleted == 1
+    assert _placement(conn) == {"logs_p20250103": 1}
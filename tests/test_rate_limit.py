@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import pytest
+from fastapi.testclient import TestClient
+
+import backend.api.routes.logs as logs_routes
+from backend.main import app
+from backend.services.rate_limiter import DbBucketStore, MemoryBucketStore, RateLimiter
+
+event = {
+    "ts": "2025-01-01T00:00:00Z",
+    "source": "web",
+    "host": "shop.example.com",
+    "ip": "203.0.113.10",
+    "endpoint": "/login",
+    "method": "POST",
+    "status_code": 401,
+    "resp_time_ms": 42,
+    "ua": "Mozilla/5.0",
+    "action_type": "login",
+}
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_counts_events_and_refills() -> None:
+    clock = FakeClock()
+    rl = RateLimiter(per_min=60, burst=10, store=MemoryBucketStore(clock))
+
+    assert rl.check("k", 6).allowed
+    denied = rl.check("k", 6)
+    assert not denied.allowed
+    assert denied.remaining == 4
+    assert denied.retry_after_sec == 2  # thiếu 2 token, refill 1 token/s
+
+    clock.now += 2
+    assert rl.check("k", 6).allowed
+    assert rl.check("other-key", 10).allowed  # bucket riêng cho từng key
+
+
+def test_db_store_is_shared_and_atomic() -> None:
+    a = RateLimiter(per_min=60, burst=5, store=DbBucketStore())
+    b = RateLimiter(per_min=60, burst=5, store=DbBucketStore())  # "worker" thứ hai
+    assert a.check("shared", 4).allowed
+    assert not b.check("shared", 4).allowed
+
+
+def test_ingest_returns_429_with_headers(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(logs_routes, "rate_limiter", RateLimiter(per_min=60, burst=2))
+    client = TestClient(app)
+    headers = {"X-API-Key": "dev-key-2"}
+
+    r = client.post("/api/ingest", json={"events": [event, event]}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["X-RateLimit-Limit"] == "2"
+    assert r.headers["X-RateLimit-Remaining"] == "0"
+
+    r = client.post("/api/ingest", json={"events": [event]}, headers=headers)
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
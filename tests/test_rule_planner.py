@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log
+from backend.db.queries import aggregate_ip_stats, split_window
+from backend.services.anomaly_detector import RuleEngine, RuleMatch, rule_window
+
+
+def _rows(ts: datetime, ip: str, endpoint: str, status: int, n: int) -> list[dict[str, Any]]:
+    row = {"ts": ts, "ip": ip, "endpoint": endpoint, "method": "GET", "status_code": status}
+    return [dict(row, resp_time_ms=5)] * n
+
+
+def test_merged_scan_matches_per_rule_queries(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    ts = now - timedelta(seconds=5)
+    db.execute(
+        insert(Log),
+        _rows(ts, "198.51.100.1", "/login", 403, 4)
+        + _rows(ts, "198.51.100.1", "/admin/", 404, 5)
+        + _rows(ts, "198.51.100.2", "/", 200, 401)
+        + _rows(ts, "198.51.100.3", "/pay", 500, 20),
+    )
+    aggregate_ip_stats(db)
+    db.commit()
+
+    engine = RuleEngine()
+    statements: list[str] = []
+
+    def _count(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        statements.append(statement)
+
+    bind = db.get_bind()
+    event.listen(bind, "before_cursor_execute", _count)
+    try:
+        merged = engine.evaluate(db, now - timedelta(seconds=300), now)
+    finally:
+        event.remove(bind, "before_cursor_execute", _count)
+
+    separate = [
+        m
+        for r in engine.rules
+        for m in r.evaluate(db, *rule_window(r.rule_id, now - timedelta(seconds=300), now))
+    ]
+
+    def key(m: RuleMatch) -> tuple:
+        return (m.rule_id, m.ip, m.endpoint, m.count)
+
+    assert sorted(map(key, merged)) == sorted(map(key, separate))
+    assert {m.rule_id for m in merged} == {"R-001", "R-002", "R-004", "R-005"}
+    # 1 scan theo ip (R-001/002/005) + 1 theo endpoint (R-004) + R-003 query riêng trên logs
+    # + 1 query sketch cho mỗi rule HLL (R-006, R-007), thêm 1 query logs nếu cửa sổ lệch phút
+    edges = bool(split_window(now - timedelta(seconds=300), now).edges)
+    assert len(statements) == 5 + 2 * edges
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log, RuleWatermark
+from backend.services.analyzer import Analyzer
+from backend.services.anomaly_detector import RuleEngine
+from backend.services.rule_profiler import RuleProfiler, report_json, report_table
+
+NOW = datetime(2025, 10, 1, 12, 0, 10, tzinfo=timezone.utc)
+
+
+def _logs(db: Session, ts: datetime) -> None:
+    row = {"ts": ts, "ip": "198.51.100.9", "endpoint": "/",
+           "method": "GET", "status_code": 200, "resp_time_ms": 5}  # fmt: skip
+    db.execute(insert(Log), [row] * 400)
+    db.commit()
+
+
+def test_profiled_engine_matches_merged_engine_and_measures_each_rule(db: Session) -> None:
+    start, end = NOW - timedelta(minutes=5), NOW.replace(second=0)
+    _logs(db, end - timedelta(seconds=30))  # trong window 60s của R-002
+    plain = RuleEngine()
+    plain.process_window(db, start, end)  # rollup ip_stats
+    expected = plain.evaluate(db, start, end)
+
+    profiler = RuleProfiler(explain=True)
+    found = RuleEngine(profiler=profiler).evaluate(db, start, end)
+    assert expected and sorted(map(repr, found)) == sorted(map(repr, expected))
+
+    records = profiler.take()
+    by_rule = {r.rule_id: r for r in records}
+    assert set(by_rule) == {r.rule_id for r in plain.rules}
+    ddos = by_rule["R-002"]
+    assert ddos.matches == 1 and ddos.queries >= 1 and ddos.rows >= 1
+    assert 0 < ddos.db_ms <= ddos.wall_ms
+    assert any("Buffers" in plan or "Execution Time" in plan for plan in ddos.explain)
+    assert report_json(records)[0]["window_end"] == end.isoformat()
+    assert report_table(records).splitlines()[0].split()[:2] == ["rule", "windows"]
+    assert profiler.take() == [] and profiler.stats["R-002"].windows == 1
+
+
+def test_analyzer_stores_rolling_timings(db: Session) -> None:
+    _logs(db, NOW - timedelta(minutes=4))
+    analyzer = Analyzer(engine=RuleEngine(profiler=RuleProfiler()), lookback=timedelta(minutes=10))
+    analyzer.tick(db, NOW)
+    db.commit()
+    wm = db.get(RuleWatermark, "R-002")
+    assert wm is not None and wm.avg_wall_ms is not None and wm.avg_wall_ms > 0
+    assert wm.avg_db_ms is not None and wm.avg_rows is not None
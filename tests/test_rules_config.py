@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.core.rules_config import (
+    BruteForceConfig,
+    DDoSConfig,
+    RulesConfig,
+    SQLiConfig,
+    compile_rules,
+    rules_config,
+)
+from backend.db.models import Log
+from backend.db.queries import aggregate_ip_stats
+from backend.services.anomaly_detector import RuleEngine
+
+DDOS = "R-002:\n  window_sec: 60\n  req_per_ip_threshold: {}\n"
+
+
+def _write(path: Path, text: str) -> None:
+    # ghi file mới rồi rename như editor / deploy → đổi inode
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def test_compiled_configs_are_validated_and_frozen() -> None:
+    rules = compile_rules({"R-001": {"min_failures": "5"}, "R-003": {"patterns": None}})
+    r1 = rules["R-001"]
+    assert isinstance(r1, BruteForceConfig) and r1.min_failures == 5 and r1.severity == 4
+    assert isinstance(rules["R-003"], SQLiConfig) and rules["R-003"].patterns == ()
+    with pytest.raises(ValueError, match="frozen"):
+        r1.min_failures = 1  # type: ignore[misc]
+    with pytest.raises(ValueError, match="R-002"):
+        compile_rules({"R-002": {"req_per_ip_threshold": 0}})
+
+
+def test_reload_only_when_file_changes_and_keeps_last_good(tmp_path: Path) -> None:
+    path = tmp_path / "rules.yaml"
+    _write(path, DDOS.format(400))
+    cfg = RulesConfig(str(path))
+    assert cfg.reload_if_changed() and cfg.version == 1
+    first = cfg.rule("R-002", DDoSConfig)
+    assert first.req_per_ip_threshold == 400
+    assert not cfg.reload_if_changed()
+    assert cfg.rule("R-002", DDoSConfig) is first  # không parse lại khi file không đổi
+
+    _write(path, DDOS.format(900))
+    assert cfg.reload_if_changed() and cfg.rule("R-002", DDoSConfig).req_per_ip_threshold == 900
+
+    _write(path, DDOS.format("-1"))  # bản lỗi: giữ version cũ, không thử lại tới khi file đổi
+    assert not cfg.reload_if_changed() and not cfg.reload_if_changed()
+    assert cfg.version == 2 and cfg.rule("R-002", DDoSConfig).req_per_ip_threshold == 900
+
+
+@pytest.mark.usefixtures("restore_rules")
+def test_engine_swaps_thresholds_between_windows(db: Session, tmp_path: Path) -> None:
+    now = datetime.now(timezone.utc)
+    row = {"ts": now - timedelta(seconds=5), "ip": "198.51.100.7", "endpoint": "/"}
+    db.execute(insert(Log), [dict(row, method="GET", status_code=200, resp_time_ms=5)] * 450)
+    aggregate_ip_stats(db)
+    db.commit()
+
+    path = tmp_path / "rules.yaml"
+    _write(path, DDOS.format(400))
+    rules_config.load(str(path))
+    engine = RuleEngine()
+    assert [m.count for m in engine.evaluate(db, now - timedelta(seconds=60), now)] == [450]
+    _write(path, DDOS.format(500))
+    assert engine.evaluate(db, now - timedelta(seconds=60), now) == []
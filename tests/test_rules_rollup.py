@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Event, IPStat, Log
+from backend.db.queries import aggregate_ip_stats
+from backend.services.anomaly_detector import RuleEngine
+
+
+def _rows(ts: datetime, ip: str, endpoint: str, status: int, n: int) -> list[dict[str, Any]]:
+    row = {
+        "ts": ts,
+        "ip": ip,
+        "endpoint": endpoint,
+        "method": "GET",
+        "status_code": status,
+        "resp_time_ms": 5,
+    }
+    return [row] * n
+
+
+def _events(db: Session) -> dict[str, list[Event]]:
+    out: dict[str, list[Event]] = {}
+    for e in db.query(Event).order_by(Event.id):
+        out.setdefault(e.rule_id, []).append(e)
+    return out
+
+
+def test_threshold_rules_read_buckets_with_their_own_window(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    recent, older = now - timedelta(seconds=5), now - timedelta(minutes=3)
+    rows = (
+        _rows(older, "198.51.100.1", "/login", 401, 3)  # R-001 (300s)
+        + _rows(recent, "198.51.100.2", "/", 200, 400)  # R-002 (60s)
+        + _rows(older, "198.51.100.3", "/", 200, 400)  # ngoài window 60s của R-002
+        + _rows(recent, "198.51.100.4", "/checkout", 200, 15)
+        + _rows(recent, "198.51.100.4", "/checkout", 502, 5)  # R-004: 5/20 = 25%
+        + _rows(older, "198.51.100.5", "/admin", 404, 3)
+        + _rows(recent, "198.51.100.5", "/.git/config", 404, 2)  # R-005: 5 x 404
+    )
+    db.execute(insert(Log), rows)
+    db.commit()
+
+    written = RuleEngine().process_window(db, now - timedelta(seconds=300), now)
+    db.commit()
+
+    ev = _events(db)
+    assert written == 4
+    assert [(e.ip, e.count) for e in ev["R-001"]] == [("198.51.100.1", 3)]
+    assert [(e.ip, e.count) for e in ev["R-002"]] == [("198.51.100.2", 400)]
+    assert [(e.endpoint, e.count) for e in ev["R-004"]] == [("/checkout", 5)]
+    assert [(e.ip, e.count) for e in ev["R-005"]] == [("198.51.100.5", 5)]
+    assert ev["R-001"][0].first_seen == older
+    assert db.query(IPStat).count() == 6
+
+
+def test_unaligned_window_reads_partial_edges_from_logs(db: Session) -> None:
+    def at(minute: int, second: int) -> datetime:
+        return datetime(2025, 1, 1, 12, minute, second, tzinfo=timezone.utc)
+
+    rows = (
+        _rows(at(0, 10), "198.51.100.1", "/login", 401, 4)  # trước start, cùng phút với start
+        + _rows(at(0, 40), "198.51.100.1", "/login", 401, 4)
+        + _rows(at(2, 0), "198.51.100.1", "/login", 401, 4)
+        + _rows(at(5, 20), "198.51.100.1", "/login", 401, 4)
+        + _rows(at(5, 50), "198.51.100.1", "/login", 401, 4)  # sau end, cùng phút với end
+        # phút 12:04 là bucket trọn vẹn của R-001 (300s) nhưng là biên của R-002 (60s)
+        + _rows(at(4, 10), "198.51.100.2", "/", 200, 300)
+        + _rows(at(4, 50), "198.51.100.2", "/", 200, 200)
+        + _rows(at(5, 10), "198.51.100.2", "/", 200, 210)
+    )
+    db.execute(insert(Log), rows)
+    aggregate_ip_stats(db)
+    db.commit()
+
+    end = at(5, 30)
+    found = {m.rule_id: m for m in RuleEngine().evaluate(db, end - timedelta(seconds=300), end)}
+    assert (found["R-001"].count, found["R-001"].first_seen) == (12, at(0, 40))
+    assert found["R-001"].last_seen == at(5, 20)
+    assert (found["R-002"].ip, found["R-002"].count) == ("198.51.100.2", 410)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from backend.core.rules_config import rules_config
+from backend.core.signatures import AhoCorasick, sig_mask, sqli_matcher
+from backend.db.models import Log
+from backend.services.anomaly_detector import SQLiSignatureRule
+from backend.services.log_ingestor import LogEvent, LogIngestor
+from scripts.retag_signatures import retag_batch
+
+
+def test_automaton_matches_naive_substring_search() -> None:
+    rng = random.Random(7)
+    alphabet = "abc' =-()"
+    patterns = ["".join(rng.choices(alphabet, k=rng.randint(1, 6))) for _ in range(500)]
+    ac = AhoCorasick(patterns)
+    for _ in range(200):
+        text = "".join(rng.choices(alphabet + "ABC", k=rng.randint(0, 40)))
+        expected = 0
+        for i, p in enumerate(patterns):
+            if p.lower() in text.lower():
+                expected |= 1 << (i % 63)
+        assert ac.search(text) == expected
+    assert AhoCorasick(["he", "she", "hers"]).search("USHERS") == 0b111
+    assert AhoCorasick([]).search("anything") == 0
+
+
+@pytest.mark.usefixtures("restore_rules")
+def test_matcher_follows_edits_of_rules_file(tmp_path: Path) -> None:
+    path = tmp_path / "rules.yaml"
+    path.write_text("R-003:\n  patterns: ['union select']\n")
+    rules_config.load(str(path))
+    assert sqli_matcher().patterns == ("union select",)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text("R-003:\n  patterns: ['sleep(', 'union select']\n")
+    os.replace(tmp, path)  # như deploy: file mới, inode mới
+    assert sqli_matcher().patterns == ("sleep(", "union select")  # không cần load() lại
+    assert sig_mask(None, "SLEEP(5)") == 1
+
+
+def test_ingest_tags_rows_with_signatures(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    base = {
+        "source": "pytest", "host": "h", "ip": "198.51.100.9", "endpoint": "/search",
+        "method": "GET", "status_code": 200, "resp_time_ms": 5, "ua": "ua", "action_type": "http",
+    }  # fmt: skip
+    events = [
+        LogEvent(ts=now, query_params="q=1 union select pw", **base),
+        LogEvent(ts=now, query_params="q=shoes", **base),
+    ]
+    for mode in ("core", "copy"):
+        LogIngestor(write_mode=mode).save_batch(db, events)
+    db.add(Log(ts=now - timedelta(seconds=1), query_params="SLEEP(5)", **base))
+    db.flush()
+
+    masks = [m for (m,) in db.query(Log.sig_mask).order_by(Log.id)]
+    assert masks[0] == masks[2] == sig_mask("/search", "UNION SELECT") != 0
+    assert masks[1] == masks[3] == 0
+    assert masks[4] == sig_mask(None, "sleep(") != 0
+
+
+def test_untagged_and_stale_rows_are_matched_then_retagged(db: Session) -> None:
+    now = datetime.now(timezone.utc)
+    base = {"ts": now - timedelta(seconds=5), "source": "pytest", "host": "h", "method": "GET",
+            "endpoint": "/search", "status_code": 200, "resp_time_ms": 5}  # fmt: skip
+    for ip in ("198.51.100.1", "198.51.100.2"):
+        db.add_all(Log(ip=ip, query_params=f"q={i} UNION SELECT pw", **base) for i in range(3))
+    db.flush()
+    # .1: ghi trước khi có tag (NULL); .2: gắn bằng bộ pattern cũ không khớp gì
+    db.execute(update(Log).where(Log.ip == "198.51.100.1").values(sig_mask=None, sig_version=None))
+    db.execute(update(Log).where(Log.ip == "198.51.100.2").values(sig_mask=0, sig_version=1))
+    db.commit()
+
+    def hits() -> dict[str | None, int]:
+        got = SQLiSignatureRule().evaluate(db, now - timedelta(minutes=5), now)
+        return {m.ip: m.count for m in got}
+
+    assert hits() == {"198.51.100.1": 3, "198.51.100.2": 3}
+    assert retag_batch(db, 0, 4)[0] == 4 and retag_batch(db, 0, 100)[0] == 2
+    assert retag_batch(db, 0, 100) == (0, None)
+    assert {v for (v,) in db.query(Log.sig_version)} == {sqli_matcher().version}
+    assert hits() == {"198.51.100.1": 3, "198.51.100.2": 3}
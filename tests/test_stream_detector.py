@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.core.config import settings
+from backend.db.bulk import LOG_COLUMNS, LogRow
+from backend.db.models import Event, Log
+from backend.db.queries import aggregate_ip_stats
+from backend.main import app
+from backend.services import log_ingestor
+from backend.services.anomaly_detector import RuleEngine, RuleMatch
+from backend.services.stream_detector import StreamingRuleEngine
+
+T0 = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _row(ts: datetime, ip: str, endpoint: str, status: int) -> LogRow:
+    values = {"ts": ts, "ip": ip, "endpoint": endpoint, "status_code": status}
+    return tuple(values.get(c, {"method": "GET", "resp_time_ms": 1}.get(c)) for c in LOG_COLUMNS)
+
+
+def _traffic(seed: int) -> list[LogRow]:
+    rnd = random.Random(seed)
+    ips = [f"198.51.100.{i}" for i in range(1, 7)]
+    paths = ["/", "/login", "/pay", "/admin", "/admin/users", "/.git/HEAD", "/search"]
+    rows = []
+    for _ in range(1500):
+        ts = T0 + timedelta(seconds=rnd.uniform(0, 480))
+        ep = rnd.choice(paths)
+        status = rnd.choice([200, 200, 401, 404, 500]) if ep != "/pay" else rnd.choice([200, 502])
+        rows.append(_row(ts, rnd.choice(ips), ep, status))
+    burst = T0 + timedelta(seconds=450)  # R-002: > 400 request/60s từ một IP
+    rows += [_row(burst + timedelta(milliseconds=i), "203.0.113.9", "/", 200) for i in range(420)]
+    return sorted(rows, key=lambda r: r[0])
+
+
+def _key(m: RuleMatch) -> tuple:
+    return (m.rule_id, m.ip, m.endpoint, m.count, m.evidence)
+
+
+@pytest.mark.parametrize(("seed", "end_sec"), [(1, 480), (2, 480), (1, 457), (2, 463)])
+def test_stream_matches_equal_batch_engine(db: Session, seed: int, end_sec: int) -> None:
+    rows = _traffic(seed)
+    db.execute(insert(Log), [dict(zip(LOG_COLUMNS, r)) for r in rows])
+    aggregate_ip_stats(db)
+    db.commit()
+
+    end = T0 + timedelta(seconds=end_sec)  # 457/463: không chẵn phút, batch đọc biên lẻ từ logs
+    batch = RuleEngine().evaluate(db, end - timedelta(seconds=300), end)
+    batch = [m for m in batch if m.rule_id != "R-003"]
+
+    stream = StreamingRuleEngine()
+    stream.observe([r for r in rows if r[0] < end])
+
+    assert {m.rule_id for m in batch} == {"R-001", "R-002", "R-004", "R-005"}
+    assert sorted(map(_key, stream.matches(end))) == sorted(map(_key, batch))
+
+
+def test_live_emission_counts_the_same_window_as_batch(db: Session) -> None:
+    # R-002: 400 request / 60s. Bucket phút sẽ gộp cả 250 dòng lúc 00:10 vào window 00:41-01:41
+    def burst(sec: int, n: int) -> list[LogRow]:
+        return [
+            _row(T0 + timedelta(seconds=sec, milliseconds=i), "203.0.113.5", "/", 200)
+            for i in range(n)
+        ]
+
+    rows = burst(10, 250) + burst(100, 250) + burst(110, 200)
+    db.execute(insert(Log), [dict(zip(LOG_COLUMNS, r)) for r in rows])
+    aggregate_ip_stats(db)
+    db.commit()
+
+    def batch(end_sec: int) -> list[tuple]:
+        end = T0 + timedelta(seconds=end_sec)
+        return [_key(m) for m in RuleEngine().evaluate(db, T0, end) if m.rule_id == "R-002"]
+
+    stream = StreamingRuleEngine()
+    assert stream.observe(rows[:500]) == []
+    assert batch(101) == []
+
+    emitted = [m for m in stream.observe(rows[500:]) if m.rule_id == "R-002"]
+    assert [m.count for m in emitted] == [400]  # dòng thứ 150 lúc 01:50 chạm ngưỡng
+    assert batch(111) == [_key(stream.matches(T0 + timedelta(seconds=111))[0])]
+
+
+def test_emits_once_on_crossing_and_evicts_idle_keys() -> None:
+    stream = StreamingRuleEngine()
+    fails = [_row(T0 + timedelta(seconds=i), "192.0.2.1", "/login", 401) for i in range(5)]
+
+    emitted = [stream.observe([r]) for r in fails]
+    assert [len(e) for e in emitted] == [0, 0, 1, 0, 0]  # min_failures = 3
+    assert emitted[2][0].rule_id == "R-001" and emitted[2][0].count == 3
+
+    later = T0 + timedelta(minutes=20)
+    stream.observe([_row(later, "192.0.2.2", "/", 200)])
+    # chỉ còn key của request mới (R-002 theo ip, R-004 theo endpoint)
+    assert stream.key_count() == 2
+
+    again = stream.observe(
+        [_row(later + timedelta(seconds=i), "192.0.2.1", "/login", 403) for i in range(3)]
+    )
+    assert [m.rule_id for m in again] == ["R-001"]
+
+
+def test_future_dated_row_does_not_freeze_the_clock() -> None:
+    stream = StreamingRuleEngine()
+    now = datetime.now(timezone.utc)
+    assert stream.observe([_row(now + timedelta(days=1), "192.0.2.9", "/", 200)]) == []
+    fails = [_row(now + timedelta(milliseconds=i), "192.0.2.1", "/login", 401) for i in range(50)]
+    assert [m.rule_id for m in stream.observe(fails)] == ["R-001"]
+    assert stream.future_rows == 1
+
+
+def test_ingest_path_writes_stream_events(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "STREAM_RULES_ENABLED", True)
+    monkeypatch.setattr(log_ingestor, "stream_engine", StreamingRuleEngine())
+    now = datetime.now(timezone.utc)
+    events = [
+        {
+            "ts": (now + timedelta(milliseconds=i)).isoformat(),
+            "source": "web",
+            "host": "shop.example.com",
+            "ip": "192.0.2.77",
+            "endpoint": "/login",
+            "method": "POST",
+            "status_code": 401,
+            "resp_time_ms": 10,
+            "ua": "curl/8",
+            "action_type": "login",
+        }
+        for i in range(3)
+    ]
+    r = TestClient(app).post(
+        "/api/ingest", json={"events": events}, headers={"X-API-Key": "dev-key-1"}
+    )
+    assert r.status_code == 200
+
+    ev = db.query(Event).filter(Event.source == "stream").all()
+    assert [(e.rule_id, e.ip, e.count) for e in ev] == [("R-001", "192.0.2.77", 3)]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from backend.db.models import Log
+from backend.db.queries import aggregate_ip_stats
+from backend.services.anomaly_detector import RuleEngine, RuleMatch
+
+pytest.importorskip("numpy")
+
+T0 = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def _traffic(seed: int) -> list[dict[str, object]]:
+    rnd = random.Random(seed)
+    ips = [f"198.51.100.{i}" for i in range(1, 9)]
+    paths = ["/", "/login", "/pay", "/admin", "/admin/users", "/.git/HEAD", "/search\\tab"]
+    rows = []
+    for _ in range(3000):
+        ep = rnd.choice(paths)
+        status = (
+            rnd.choice([200, 200, 401, 403, 404, 500]) if ep != "/pay" else rnd.choice([200, 502])
+        )
+        rows.append({"ts": T0 + timedelta(seconds=rnd.uniform(0, 600)), "ip": rnd.choice(ips),
+                     "endpoint": ep, "method": "GET", "status_code": status, "resp_time_ms": 1})  # fmt: skip
+    burst = T0 + timedelta(seconds=560)
+    rows += [{"ts": burst + timedelta(milliseconds=i), "ip": "203.0.113.9", "endpoint": "/",
+              "method": "GET", "status_code": 200, "resp_time_ms": 1} for i in range(450)]  # fmt: skip
+    return rows
+
+
+def _key(m: RuleMatch) -> tuple[object, ...]:
+    return (m.rule_id, m.ip, m.endpoint, m.count, m.evidence, m.first_seen, m.last_seen)
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_numpy_evaluator_matches_sql(db: Session, seed: int) -> None:
+    db.execute(insert(Log), _traffic(seed))
+    aggregate_ip_stats(db)
+    db.commit()
+
+    seen: set[str] = set()
+    for end in (T0 + timedelta(seconds=601), T0 + timedelta(seconds=345, microseconds=7)):
+        sql = RuleEngine(evaluator="sql").evaluate(db, end - timedelta(seconds=300), end)
+        vec = RuleEngine(evaluator="numpy").evaluate(db, end - timedelta(seconds=300), end)
+        assert sorted(map(_key, vec)) == sorted(map(_key, sql))
+        seen |= {m.rule_id for m in sql}
+    assert seen >= {"R-001", "R-002", "R-004", "R-005"}
+
+
+def test_numpy_evaluator_on_empty_window(db: Session) -> None:
+    assert RuleEngine(evaluator="numpy").evaluate(db, T0, T0 + timedelta(minutes=5)) == []